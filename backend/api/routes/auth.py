@@ -1,17 +1,19 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, EmailStr
 
-from database.database import get_db
+from database.database import get_async_db
 from models.user import User
 from services.auth_service import (
     authenticate_user, 
     create_access_token, 
-    get_password_hash,
+    get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from services.password_hasher import password_hasher
 
 router = APIRouter(
     prefix="/auth",
@@ -35,9 +37,9 @@ class UserCreate(BaseModel):
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -60,9 +62,9 @@ async def login_for_access_token(
     }
 
 @router.post("/register", status_code=status.HTTP_201_CREATED)
-async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     # Check if username exists
-    user_by_username = db.query(User).filter(User.username == user_data.username).first()
+    user_by_username = await db.scalar(select(User).where(User.username == user_data.username).limit(1))
     if user_by_username:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -70,15 +72,16 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Check if email exists
-    user_by_email = db.query(User).filter(User.email == user_data.email).first()
+    user_by_email = await db.scalar(select(User).where(User.email == user_data.email).limit(1))
     if user_by_email:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email already registered"
         )
     
-    # Create new user
-    hashed_password = get_password_hash(user_data.password)
+    # Create new user; no connection is held while the password is hashed
+    await db.rollback()
+    hashed_password = await password_hasher.hash(user_data.password)
     db_user = User(
         username=user_data.username,
         email=user_data.email,
@@ -88,10 +91,17 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     
     return {
         "message": "User registered successfully",
         "user_id": db_user.user_id
-    }
\ No newline at end of file
+    }
+
+@router.get("/password-hasher/stats")
+async def get_password_hasher_stats(
+    current_user: User = Depends(get_current_user)
+):
+    # Queue of login and registration password checks
+    return password_hasher.stats()
@@ -1,19 +1,34 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from datetime import datetime
+import asyncio
+import json
+import os
+import time
 
-from database.database import get_db
+from database.database import get_db, SessionLocal
 from models.user import User
 from models.photo import Event, Photo
+from models.face import FaceDetection
+from models.job import ProcessingJob
 from services.auth_service import get_current_user
+from services.detection_presets import PRESETS as DETECTION_PRESETS
+from services.job_queue import job_queue, PENDING, RUNNING, FAILED
+from services.pagination import after_cursor, next_cursor
 
 router = APIRouter(
     prefix="/events",
     tags=["events"]
 )
 
+# Photos per queued job of POST /events/{event_id}/process
+EVENT_PROCESS_BATCH_SIZE = int(os.getenv("EVENT_PROCESS_BATCH_SIZE", "32"))
+
 class EventCreate(BaseModel):
     name: str
     description: Optional[str] = None
@@ -38,8 +53,30 @@ class EventUpdate(BaseModel):
     event_date: Optional[datetime]
     location: Optional[str]
 
+def _photo_counts(db: Session, event_ids: List[int]) -> Dict[int, int]:
+    """Number of non-deleted photos per event, for events that have any."""
+    if not event_ids:
+        return {}
+    return dict(
+        db.query(Photo.event_id, func.count(Photo.photo_id)).filter(
+            Photo.event_id.in_(event_ids),
+            Photo.is_deleted == False
+        ).group_by(Photo.event_id).all()
+    )
+
+def _event_response(event: Event, photo_count: int) -> EventResponse:
+    return EventResponse(
+        event_id=event.event_id,
+        name=event.name,
+        description=event.description,
+        event_date=event.event_date,
+        location=event.location,
+        created_at=event.created_at,
+        photo_count=photo_count
+    )
+
 @router.post("/", response_model=EventResponse)
-async def create_event(
+def create_event(
     event_data: EventCreate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -57,61 +94,45 @@ async def create_event(
     db.commit()
     db.refresh(new_event)
     
-    # Get photo count (should be 0 for new event)
-    photo_count = db.query(Photo).filter(
-        Photo.event_id == new_event.event_id,
-        Photo.is_deleted == False
-    ).count()
-    
-    # Create response
-    response = EventResponse(
-        event_id=new_event.event_id,
-        name=new_event.name,
-        description=new_event.description,
-        event_date=new_event.event_date,
-        location=new_event.location,
-        created_at=new_event.created_at,
-        photo_count=photo_count
-    )
-    
-    return response
+    # A new event has no photos yet
+    return _event_response(new_event, 0)
 
 @router.get("/", response_model=List[EventResponse])
-async def get_events(
+def get_events(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    # Get events for user
-    events = db.query(Event).filter(
+    # Get events for user, newest first
+    query = db.query(Event).filter(
         Event.user_id == current_user.user_id
-    ).order_by(Event.created_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Event.created_at.desc(), Event.event_id.desc())
     
-    # Get photo count for each event
-    responses = []
-    for event in events:
-        photo_count = db.query(Photo).filter(
-            Photo.event_id == event.event_id,
-            Photo.is_deleted == False
-        ).count()
-        
-        responses.append(
-            EventResponse(
-                event_id=event.event_id,
-                name=event.name,
-                description=event.description,
-                event_date=event.event_date,
-                location=event.location,
-                created_at=event.created_at,
-                photo_count=photo_count
-            )
-        )
+    # Continue after the previous page's cursor (skip is for offset paging only)
+    if cursor:
+        try:
+            query = query.filter(after_cursor(Event, "created_at", "event_id", cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        query = query.offset(skip)
+    
+    # One extra row tells whether another page exists
+    events = query.limit(limit + 1).all()
+    page_cursor = next_cursor(events, limit, "created_at", "event_id")
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    events = events[:limit]
     
-    return responses
+    # Get photo counts of the whole page in one grouped query
+    photo_counts = _photo_counts(db, [event.event_id for event in events])
+    return [_event_response(event, photo_counts.get(event.event_id, 0)) for event in events]
 
 @router.get("/{event_id}", response_model=EventResponse)
-async def get_event(
+def get_event(
     event_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -129,26 +150,10 @@ async def get_event(
         )
     
     # Get photo count for event
-    photo_count = db.query(Photo).filter(
-        Photo.event_id == event.event_id,
-        Photo.is_deleted == False
-    ).count()
-    
-    # Create response
-    response = EventResponse(
-        event_id=event.event_id,
-        name=event.name,
-        description=event.description,
-        event_date=event.event_date,
-        location=event.location,
-        created_at=event.created_at,
-        photo_count=photo_count
-    )
-    
-    return response
+    return _event_response(event, _photo_counts(db, [event.event_id]).get(event.event_id, 0))
 
 @router.put("/{event_id}", response_model=EventResponse)
-async def update_event(
+def update_event(
     event_id: int,
     event_data: EventUpdate,
     current_user: User = Depends(get_current_user),
@@ -186,26 +191,10 @@ async def update_event(
     db.refresh(event)
     
     # Get photo count for event
-    photo_count = db.query(Photo).filter(
-        Photo.event_id == event.event_id,
-        Photo.is_deleted == False
-    ).count()
-    
-    # Create response
-    response = EventResponse(
-        event_id=event.event_id,
-        name=event.name,
-        description=event.description,
-        event_date=event.event_date,
-        location=event.location,
-        created_at=event.created_at,
-        photo_count=photo_count
-    )
-    
-    return response
+    return _event_response(event, _photo_counts(db, [event.event_id]).get(event.event_id, 0))
 
 @router.delete("/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_event(
+def delete_event(
     event_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -226,4 +215,229 @@ async def delete_event(
     db.delete(event)
     db.commit()
     
-    return None
\ No newline at end of file
+    return None
+
+@router.post("/{event_id}/process", status_code=status.HTTP_202_ACCEPTED)
+def process_event(
+    event_id: int,
+    preset: Optional[str] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Get event by ID
+    event = db.query(Event).filter(
+        Event.event_id == event_id,
+        Event.user_id == current_user.user_id
+    ).first()
+    
+    if not event:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found or you don't have access"
+        )
+    
+    # Check if the detection preset exists
+    if preset is not None and preset not in DETECTION_PRESETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown detection preset: {preset}"
+        )
+    
+    user_id = current_user.user_id
+    
+    # Hold the event's row lock (the database write lock on SQLite) from the
+    # check below until the first job is committed, so concurrent requests
+    # for the same event cannot both pass the check. The lock is taken in a
+    # new transaction: SQLite cannot turn a transaction that has already
+    # read into a writer once another connection has committed.
+    db.rollback()
+    db.query(Event).filter(Event.event_id == event_id).update(
+        {Event.updated_at: Event.updated_at}, synchronize_session=False
+    )
+    
+    # Check if event is already being processed
+    active_jobs = db.query(ProcessingJob).filter(
+        ProcessingJob.event_id == event_id,
+        ProcessingJob.job_type == "process_photo_batch",
+        ProcessingJob.status.in_([PENDING, RUNNING])
+    ).count()
+    
+    if active_jobs:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Event is already being processed"
+        )
+    
+    # Get unprocessed photos, except those already queued on their own
+    queued_photo_ids = db.query(ProcessingJob.photo_id).filter(
+        ProcessingJob.user_id == user_id,
+        ProcessingJob.photo_id.isnot(None),
+        ProcessingJob.status.in_([PENDING, RUNNING])
+    )
+    photo_ids = [
+        row.photo_id for row in db.query(Photo.photo_id).filter(
+            Photo.event_id == event_id,
+            Photo.is_deleted == False,
+            Photo.is_processed == False,
+            Photo.photo_id.notin_(queued_photo_ids)
+        ).order_by(Photo.photo_id).all()
+    ]
+    
+    # Queue the photos in batches; each batch shares one gallery load and one matching pass
+    jobs = [
+        job_queue.enqueue(
+            db,
+            "process_photo_batch",
+            user_id=user_id,
+            event_id=event_id,
+            payload={"photo_ids": photo_ids[i:i + EVENT_PROCESS_BATCH_SIZE], "preset": preset}
+        )
+        for i in range(0, len(photo_ids), EVENT_PROCESS_BATCH_SIZE)
+    ]
+    
+    return {
+        "message": "Processing started",
+        "queued_photos": len(photo_ids),
+        "job_ids": [job.job_id for job in jobs]
+    }
+
+def _sse(event_name: str, data: dict) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+class _EventProgress:
+    """
+    Progress of an event's processing, polled incrementally.
+    
+    The first poll counts the processed photos and their faces; later polls
+    read only the photos that were still unprocessed and the faces of those
+    that finished since the previous poll.
+    """
+    
+    def __init__(self, event_id: int):
+        self.event_id = event_id
+        self.processed = 0
+        self.faces_found = 0
+        self.unprocessed_ids = None
+    
+    def poll(self) -> Tuple[List[Tuple[int, int]], Dict[str, int]]:
+        """
+        Blocking; run in the threadpool. Uses its own short-lived session, so
+        the stream does not hold a connection between polls.
+        
+        Returns:
+            Tuple of (photos finished since the previous poll with their
+            number of faces, job counts by status)
+        """
+        db = SessionLocal()
+        try:
+            event_photos = (Photo.event_id == self.event_id, Photo.is_deleted == False)
+            unprocessed_ids = {
+                row.photo_id for row in db.query(Photo.photo_id).filter(
+                    *event_photos, Photo.is_processed == False
+                )
+            }
+            
+            finished = []
+            if self.unprocessed_ids is None:
+                self.processed = db.query(func.count(Photo.photo_id)).filter(
+                    *event_photos, Photo.is_processed == True
+                ).scalar()
+                self.faces_found = db.query(func.count(FaceDetection.detection_id)).join(Photo).filter(
+                    *event_photos, Photo.is_processed == True
+                ).scalar()
+            elif self.unprocessed_ids - unprocessed_ids:
+                # Left the unprocessed set: processed, or deleted or moved meanwhile
+                finished = db.query(
+                    Photo.photo_id, func.count(FaceDetection.detection_id)
+                ).outerjoin(
+                    FaceDetection, FaceDetection.photo_id == Photo.photo_id
+                ).filter(
+                    Photo.photo_id.in_(self.unprocessed_ids - unprocessed_ids),
+                    *event_photos,
+                    Photo.is_processed == True
+                ).group_by(Photo.photo_id).order_by(Photo.photo_id).all()
+            self.unprocessed_ids = unprocessed_ids
+            self.processed += len(finished)
+            self.faces_found += sum(faces for _, faces in finished)
+            
+            # The event's batches, and photos of the event that were queued on their own
+            jobs = dict(
+                db.query(ProcessingJob.status, func.count(ProcessingJob.job_id)).filter(
+                    ProcessingJob.job_type.in_(["process_photo_batch", "process_photo"]),
+                    or_(
+                        ProcessingJob.event_id == self.event_id,
+                        ProcessingJob.photo_id.in_(db.query(Photo.photo_id).filter(*event_photos))
+                    ),
+                    ProcessingJob.status.in_([PENDING, RUNNING, FAILED])
+                ).group_by(ProcessingJob.status).all()
+            )
+        finally:
+            db.close()
+        return [tuple(row) for row in finished], jobs
+
+async def _event_progress_stream(event_id: int, interval: float):
+    """Yield Server-Sent Events until no processing job of the event is left."""
+    started = time.monotonic()
+    progress_state = _EventProgress(event_id)
+    processed_at_start = None
+    
+    while True:
+        finished, jobs = await run_in_threadpool(progress_state.poll)
+        if processed_at_start is None:
+            processed_at_start = progress_state.processed
+        
+        # Only photos finished after the stream started are reported one by one
+        for photo_id, faces in finished:
+            yield _sse("photo", {"photo_id": photo_id, "faces": faces})
+        
+        elapsed = time.monotonic() - started
+        processed = progress_state.processed
+        remaining = len(progress_state.unprocessed_ids)
+        progress = {
+            "total": processed + remaining,
+            "processed": processed,
+            "remaining": remaining,
+            "faces_found": progress_state.faces_found,
+            "photos_per_second": round((processed - processed_at_start) / elapsed, 2) if elapsed else 0.0,
+            "pending_jobs": jobs.get(PENDING, 0),
+            "running_jobs": jobs.get(RUNNING, 0),
+            "failed_jobs": jobs.get(FAILED, 0)
+        }
+        yield _sse("progress", progress)
+        
+        if not progress["pending_jobs"] and not progress["running_jobs"]:
+            yield _sse("done", progress)
+            return
+        
+        await asyncio.sleep(interval)
+
+@router.get("/{event_id}/process/progress")
+def stream_event_progress(
+    event_id: int,
+    interval: float = 1.0,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Check if event exists and belongs to user
+    event = db.query(Event).filter(
+        Event.event_id == event_id,
+        Event.user_id == current_user.user_id
+    ).first()
+    
+    if not event:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Event not found or you don't have access"
+        )
+    
+    # The request's session is only closed once the stream ends; give its
+    # connection back now, every poll opens a short-lived session of its own
+    db.close()
+    
+    # Stream progress as Server-Sent Events
+    return StreamingResponse(
+        _event_progress_stream(event_id, max(interval, 0.2)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
\ No newline at end of file
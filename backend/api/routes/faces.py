@@ -1,17 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
 from pydantic import BaseModel
 import numpy as np
+import asyncio
 import os
+import shutil
+import tempfile
+from collections import defaultdict
+from datetime import datetime
 import logging
 
-from database.database import get_db
+from database.database import background_writer, get_db
 from models.user import User
 from models.photo import Photo
-from models.face import Face, FaceDetection
+from models.face import Face, FaceCluster, FaceDetection
+from models.job import ProcessingJob
 from services.auth_service import get_current_user
 from services.face_recognition_service import FaceRecognitionService
+from services.detection_cache import detection_cache
+from services.detection_index import detection_index
+from services.detection_presets import PRESETS as DETECTION_PRESETS
+from services.face_clustering import assign_detections, cluster_cache, cluster_version, detach_detections
+from services.face_matching import normalize_embeddings
+from services.gallery_cache import gallery_cache, gallery_version, load_gallery
+from services.job_queue import job_queue
+from services.renditions import EAGER_SIZES as EAGER_RENDITION_SIZES
+from services.renditions import FACE_CROP_SIZES, RENDITION_FORMATS, rendition_cache
+from services.retro_match import retro_match
+from services.upload_service import stream_upload
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -49,38 +69,137 @@ class FaceResponse(BaseModel):
 class FaceUpdate(BaseModel):
     person_name: str
 
-async def process_photo_faces(
-    photo_id: int,
-    db: Session,
-    user_id: int
-):
+class FaceClusterResponse(BaseModel):
+    cluster_id: int
+    size: int
+    # Crop at GET /faces/detections/{detection_id}/crop
+    representative: Optional[FaceDetectionResponse]
+
+class FaceSearchMatch(BaseModel):
+    photo_id: int
+    # Best matching detection of the photo
+    detection_id: int
+    score: float
+
+class FaceSearchResponse(BaseModel):
+    # Photos above the threshold among the top_k closest detections
+    total: int
+    results: List[FaceSearchMatch]
+
+class ClusterName(BaseModel):
+    # A new person, or an existing one the cluster's faces belong to
+    person_name: Optional[str] = None
+    face_id: Optional[int] = None
+
+class ProcessingJobResponse(BaseModel):
+    job_id: int
+    job_type: str
+    photo_id: Optional[int]
+    event_id: Optional[int]
+    status: str
+    attempts: int
+    last_error: Optional[str]
+    created_at: datetime
+    finished_at: Optional[datetime]
+    
+    class Config:
+        orm_mode = True
+
+def find_reusable_detections(db: Session, photos: List[Photo]) -> Dict[int, List[dict]]:
     """
-    Background task to process faces in a photo
+    Detections of byte-identical photos that were already processed.
+    
+    A photo's earlier twin (same content hash) is used only if all of its
+    embeddings come from the active descriptor pipeline.
+    
+    Returns:
+        Detection results in detect_faces format, keyed by photo_id
     """
-    try:
-        # Get photo
-        photo = db.query(Photo).filter(
-            Photo.photo_id == photo_id,
-            Photo.user_id == user_id
-        ).first()
-        
-        if not photo or not os.path.exists(photo.storage_path):
-            logger.error(f"Photo {photo_id} not found or file doesn't exist")
-            return
-        
-        # Detect faces
-        face_detections = await face_recognition_service.detect_faces(photo.storage_path)
-        
-        if not face_detections:
-            # Mark photo as processed even if no faces detected
-            photo.is_processed = True
-            db.commit()
-            logger.info(f"No faces detected in photo {photo_id}")
-            return
+    hashes = {photo.content_hash for photo in photos if photo.content_hash}
+    if not hashes:
+        return {}
+    
+    # Oldest processed twin of every content hash
+    sources = dict(
+        db.query(Photo.content_hash, func.min(Photo.photo_id)).filter(
+            Photo.content_hash.in_(hashes),
+            Photo.is_processed == True,
+            Photo.photo_id.notin_([photo.photo_id for photo in photos])
+        ).group_by(Photo.content_hash).all()
+    )
+    if not sources:
+        return {}
+    
+    detections_by_photo = defaultdict(list)
+    for detection in db.query(FaceDetection).filter(
+        FaceDetection.photo_id.in_(list(sources.values()))
+    ).order_by(FaceDetection.detection_id):
+        detections_by_photo[detection.photo_id].append(detection)
+    
+    reusable = {}
+    for photo in photos:
+        source_id = sources.get(photo.content_hash)
+        if source_id is None:
+            continue
+        detections = detections_by_photo[source_id]
+        if not all(face_recognition_service.is_current_embedding(d.embedding) for d in detections):
+            continue
+        reusable[photo.photo_id] = [
+            {
+                "location": {
+                    "x": detection.bounding_box_x,
+                    "y": detection.bounding_box_y,
+                    "width": detection.bounding_box_width,
+                    "height": detection.bounding_box_height
+                },
+                "embedding": face_recognition_service.deserialize_embedding(detection.embedding),
+                "confidence": detection.confidence_score
+            }
+            for detection in detections
+        ]
+    return reusable
+
+def _load_batch(db: Session, photo_ids: List[int], user_id: int) -> Tuple[List[Photo], Dict[int, object]]:
+    """Unprocessed photos of a batch and the detections they can reuse; blocking."""
+    photos = []
+    for photo in db.query(Photo).filter(
+        Photo.photo_id.in_(photo_ids),
+        Photo.user_id == user_id,
+        Photo.is_processed == False
+    ).order_by(Photo.photo_id).all():
+        if os.path.exists(photo.storage_path):
+            photos.append(photo)
+        else:
+            logger.error(f"Photo {photo.photo_id} not found or file doesn't exist")
+    
+    if not photos:
+        return photos, {}
+    
+    results = find_reusable_detections(db, photos)
+    if results:
+        logger.info(f"Reusing detections of identical files for photos {sorted(results)}")
+    return photos, results
+
+def _store_batch(db: Session, user_id: int, photos: List[Photo], results: Dict[int, object]) -> Tuple[int, List[int]]:
+    """
+    Stage, match and cluster the detected faces and mark the photos processed;
+    blocking, one transaction.
+    
+    Returns:
+        The number of new faces and the ids of the photos that failed
+    """
+    # Stage all face detections; they are committed with the processed flags
+    new_detections = []
+    embeddings = []
+    failed_ids = []
+    for photo in photos:
+        face_detections = results[photo.photo_id]
+        if isinstance(face_detections, Exception):
+            logger.error(f"Error processing photo {photo.photo_id}: {str(face_detections)}")
+            failed_ids.append(photo.photo_id)
+            continue
         
-        # Process each detected face
         for detection in face_detections:
-            # Save face detection
             face_detection = FaceDetection(
                 photo_id=photo.photo_id,
                 bounding_box_x=detection["location"]["x"],
@@ -90,56 +209,174 @@ async def process_photo_faces(
                 confidence_score=detection["confidence"],
                 embedding=face_recognition_service.serialize_embedding(detection["embedding"])
             )
-            
             db.add(face_detection)
-            db.commit()
-            db.refresh(face_detection)
+            new_detections.append(face_detection)
+            embeddings.append(detection["embedding"])
+    
+    # Try to match all new faces with existing faces at once
+    if new_detections:
+        try:
+            # Get the user's gallery of existing faces (cached across calls)
+            gallery = gallery_cache.get_or_load(
+                user_id,
+                lambda: load_gallery(
+                    db,
+                    user_id,
+                    face_recognition_service.deserialize_embedding,
+                    face_recognition_service.is_current_embedding
+                ),
+                version=gallery_version(db, user_id)
+            )
             
-            # Try to match with existing faces
-            try:
-                # Get all existing faces for this user
-                existing_faces = db.query(Face).filter(
-                    Face.user_id == user_id,
-                    Face.is_active == True
-                ).all()
+            if len(gallery):
+                scores, face_ids = gallery.search(normalize_embeddings(embeddings), top_k=1)
                 
-                if existing_faces:
-                    # Get embeddings for comparison
-                    existing_embeddings = []
-                    for face in existing_faces:
-                        embedding = face_recognition_service.deserialize_embedding(face.face_embedding)
-                        existing_embeddings.append(embedding)
-                    
-                    # Compare with existing faces
-                    comparisons = await face_recognition_service.compare_faces(
-                        detection["embedding"], 
-                        existing_embeddings
-                    )
-                    
-                    # Find best match if any
-                    if comparisons and comparisons[0][0] >= 0.7:  # Similarity threshold
-                        best_match_idx = comparisons[0][1]
-                        matched_face = existing_faces[best_match_idx]
-                        
-                        # Update face detection with matched face
-                        face_detection.face_id = matched_face.face_id
+                # Update face detections whose best match clears the threshold
+                for face_detection, score, face_id in zip(new_detections, scores[:, 0], face_ids[:, 0]):
+                    if score >= face_recognition_service.similarity_threshold:
+                        face_detection.face_id = int(face_id)
                         face_detection.identified = True
-                        db.commit()
-            except Exception as e:
-                logger.error(f"Error matching faces: {str(e)}")
-        
-        # Mark photo as processed
-        photo.is_processed = True
-        db.commit()
-        logger.info(f"Successfully processed {len(face_detections)} faces in photo {photo_id}")
+        except Exception as e:
+            logger.error(f"Error matching faces: {str(e)}")
         
-    except Exception as e:
-        logger.error(f"Error processing photo {photo_id}: {str(e)}")
+        # Group the faces nobody is known for into suggested people
+        unmatched = [i for i, face_detection in enumerate(new_detections) if not face_detection.identified]
+        if unmatched:
+            db.flush()
+            try:
+                # A failed clustering rolls back only its own changes; the faces are still saved
+                with db.begin_nested():
+                    assign_detections(
+                        db,
+                        user_id,
+                        [new_detections[i] for i in unmatched],
+                        [embeddings[i] for i in unmatched],
+                        face_recognition_service.descriptor.pipeline_version,
+                        face_recognition_service.cluster_threshold
+                    )
+            except Exception as e:
+                logger.error(f"Error clustering faces: {str(e)}")
+                cluster_cache.invalidate(user_id)
+    
+    # Mark photos as processed (even if no faces detected) in the same transaction
+    for photo in photos:
+        if photo.photo_id not in failed_ids:
+            photo.is_processed = True
+    db.commit()
+    logger.info(
+        f"Successfully processed {len(photos) - len(failed_ids)} photos "
+        f"with {len(new_detections)} faces"
+    )
+    
+    return len(new_detections), failed_ids
+
+async def process_photo_batch(
+    photo_ids: List[int],
+    db: Session,
+    user_id: int,
+    preset: Optional[str] = None
+) -> int:
+    """
+    Detect, store and match the faces of several photos at once.
+    
+    Photos whose byte-identical twin was already processed reuse its
+    detections; the rest are ingested concurrently on the detection pool,
+    each decoded once for detection and any missing eager renditions.
+    The user's gallery is loaded once and every new face is matched in one
+    batched search. Photos that fail are left unprocessed and an error is raised
+    after the others are saved, so the job queue retries only those.
+    The database sections run on the background writer thread, not the
+    event loop.
+    
+    Args:
+        photo_ids: Photos to process
+        db: Database session
+        user_id: Owner of the photos
+        preset: Detection preset name, None for the default
+    
+    Returns:
+        Number of faces found
+    """
+    # Get unprocessed photos of the batch and the detections of identical files
+    photos, results = await background_writer.run(_load_batch, db, photo_ids, user_id)
+    if not photos:
+        return 0
+    
+    # Detect faces in the other photos concurrently
+    to_detect = [photo for photo in photos if photo.photo_id not in results]
+    ingested = await asyncio.gather(
+        *[
+            face_recognition_service.ingest_photo(
+                photo.storage_path, preset, EAGER_RENDITION_SIZES, photo.content_hash
+            )
+            for photo in to_detect
+        ],
+        return_exceptions=True
+    )
+    for photo, result in zip(to_detect, ingested):
+        if isinstance(result, Exception):
+            results[photo.photo_id] = result
+            continue
+        results[photo.photo_id] = result.faces
+        # Photos stored before uploads recorded their header
+        if photo.width is None and result.width is not None:
+            photo.format, photo.width, photo.height = result.format, result.width, result.height
+    
+    face_count, failed_ids = await background_writer.run(_store_batch, db, user_id, photos, results)
+    if failed_ids:
+        raise RuntimeError(f"Face detection failed for photos {failed_ids}")
+    
+    return face_count
+
+async def process_photo_faces(
+    photo_id: int,
+    db: Session,
+    user_id: int,
+    preset: Optional[str] = None
+):
+    """
+    Detect, store and match the faces of a photo.
+    
+    Raises on failure so the job queue can retry the photo.
+    """
+    await process_photo_batch([photo_id], db, user_id, preset)
+
+@job_queue.handler("process_photo")
+async def run_process_photo_job(db: Session, job: ProcessingJob):
+    # Job queue entry point; the job's own session is used throughout
+    await process_photo_faces(
+        photo_id=job.photo_id,
+        db=db,
+        user_id=job.user_id,
+        preset=(job.payload or {}).get("preset")
+    )
+
+@job_queue.handler("process_photo_batch")
+async def run_process_photo_batch_job(db: Session, job: ProcessingJob):
+    # Queued by POST /events/{event_id}/process
+    await process_photo_batch(
+        job.payload["photo_ids"],
+        db=db,
+        user_id=job.user_id,
+        preset=job.payload.get("preset")
+    )
+
+@job_queue.handler("retro_match")
+async def run_retro_match_job(db: Session, job: ProcessingJob):
+    # Queued when a face is created or changed; the scan runs off the event loop
+    await run_in_threadpool(
+        retro_match,
+        db,
+        job.user_id,
+        job.payload["face_id"],
+        face_recognition_service.descriptor.pipeline_version,
+        face_recognition_service.similarity_threshold
+    )
 
 @router.post("/process/{photo_id}", status_code=status.HTTP_202_ACCEPTED)
-async def process_photo(
+def process_photo(
     photo_id: int,
-    background_tasks: BackgroundTasks,
+    preset: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -162,18 +399,49 @@ async def process_photo(
             detail="Photo is already processed"
         )
     
-    # Add task to process photo faces in background
-    background_tasks.add_task(
-        process_photo_faces, 
-        photo_id=photo.photo_id,
-        db=db,
-        user_id=current_user.user_id
-    )
+    # Check if the detection preset exists
+    if preset is not None and preset not in DETECTION_PRESETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown detection preset: {preset}"
+        )
     
-    return {"message": "Processing started"}
+    # Reuse a job that is already queued for this photo
+    job = job_queue.active_job_for_photo(db, photo.photo_id, "process_photo")
+    if not job:
+        # Queue the photo; a job worker processes it with its own session
+        job = job_queue.enqueue(
+            db,
+            "process_photo",
+            user_id=current_user.user_id,
+            photo_id=photo.photo_id,
+            payload={"preset": preset} if preset else None
+        )
+    
+    return {"message": "Processing started", "job_id": job.job_id}
+
+@router.get("/jobs/{job_id}", response_model=ProcessingJobResponse)
+def get_processing_job(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Get job
+    job = db.query(ProcessingJob).filter(
+        ProcessingJob.job_id == job_id,
+        ProcessingJob.user_id == current_user.user_id
+    ).first()
+    
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found or you don't have access"
+        )
+    
+    return job
 
 @router.get("/photo/{photo_id}", response_model=List[FaceDetectionResponse])
-async def get_photo_faces(
+def get_photo_faces(
     photo_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -198,7 +466,7 @@ async def get_photo_faces(
     return detections
 
 @router.post("/create", response_model=FaceResponse)
-async def create_face(
+def create_face(
     detection_id: int,
     face_data: FaceUpdate,
     current_user: User = Depends(get_current_user),
@@ -224,18 +492,35 @@ async def create_face(
     )
     
     db.add(new_face)
+    db.flush()
+    # Versions of the faces including this one, for the write-through below
+    version = gallery_version(db, current_user.user_id)
     db.commit()
     db.refresh(new_face)
     
-    # Update detection with face ID
+    # Update detection with face ID, it no longer needs a suggested person
+    detach_detections(db, current_user.user_id, [detection])
     detection.face_id = new_face.face_id
     detection.identified = True
+    detection.cluster_id = None
     db.commit()
     
+    # Keep the cached gallery in sync (stale embeddings are not matchable)
+    if face_recognition_service.is_current_embedding(new_face.face_embedding):
+        gallery_cache.add_face(
+            current_user.user_id,
+            new_face.face_id,
+            face_recognition_service.deserialize_embedding(new_face.face_embedding),
+            version=version
+        )
+    
+    # Identify the person's earlier detections in the background
+    job_queue.enqueue(db, "retro_match", user_id=current_user.user_id, payload={"face_id": new_face.face_id})
+    
     return new_face
 
 @router.put("/update/{face_id}", response_model=FaceResponse)
-async def update_face(
+def update_face(
     face_id: int,
     face_data: FaceUpdate,
     current_user: User = Depends(get_current_user),
@@ -255,13 +540,77 @@ async def update_face(
     
     # Update face
     face.person_name = face_data.person_name
+    db.flush()
+    version = gallery_version(db, current_user.user_id)
     db.commit()
     db.refresh(face)
     
+    # Keep the cached gallery in sync (stale embeddings are not matchable)
+    if face.is_active and face_recognition_service.is_current_embedding(face.face_embedding):
+        gallery_cache.add_face(
+            current_user.user_id,
+            face.face_id,
+            face_recognition_service.deserialize_embedding(face.face_embedding),
+            version=version
+        )
+        
+        # Identify the person's earlier detections in the background
+        job_queue.enqueue(db, "retro_match", user_id=current_user.user_id, payload={"face_id": face.face_id})
+    
     return face
 
+@router.delete("/people/{face_id}", status_code=status.HTTP_204_NO_CONTENT)
+def deactivate_face(
+    face_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Get face
+    face = db.query(Face).filter(
+        Face.face_id == face_id,
+        Face.user_id == current_user.user_id
+    ).first()
+    
+    if not face:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Face not found or you don't have access"
+        )
+    
+    # Soft delete (stop matching new detections against this face)
+    face.is_active = False
+    db.flush()
+    version = gallery_version(db, current_user.user_id)
+    db.commit()
+    
+    # Keep the cached gallery in sync
+    gallery_cache.remove_face(current_user.user_id, face_id, version=version)
+    
+    return None
+
+@router.get("/gallery-cache/stats")
+async def get_gallery_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    # Hit/miss/eviction counters of this worker process
+    return gallery_cache.stats()
+
+@router.get("/cluster-cache/stats")
+async def get_cluster_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    # Hit/miss/eviction counters of this worker process
+    return cluster_cache.stats()
+
+@router.get("/detection-cache/stats")
+async def get_detection_cache_stats(
+    current_user: User = Depends(get_current_user)
+):
+    # Hit/miss/eviction counters of this worker process
+    return detection_cache.stats()
+
 @router.get("/people", response_model=List[FaceResponse])
-async def get_people(
+def get_people(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -273,7 +622,7 @@ async def get_people(
     return faces
 
 @router.get("/people/{face_id}/photos", response_model=List[int])
-async def get_person_photos(
+def get_person_photos(
     face_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -298,4 +647,266 @@ async def get_person_photos(
     # Extract photo IDs
     photo_ids = [detection.photo_id for detection in detections]
     
-    return photo_ids
\ No newline at end of file
+    return photo_ids
+
+@router.get("/detections/{detection_id}/crop")
+def get_detection_crop(
+    detection_id: int,
+    size: int = 128,
+    format: str = "jpeg",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Get face detection with its photo
+    row = db.query(FaceDetection, Photo).join(Photo).filter(
+        FaceDetection.detection_id == detection_id,
+        Photo.user_id == current_user.user_id
+    ).first()
+    
+    if not row:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Face detection not found or you don't have access"
+        )
+    
+    # Check the requested crop
+    if size not in FACE_CROP_SIZES or format not in RENDITION_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Face crops are available in sizes {list(FACE_CROP_SIZES)} "
+                   f"and formats {list(RENDITION_FORMATS)}"
+        )
+    
+    # Serve the cached crop, generating it on first request
+    detection, photo = row
+    crop_path = rendition_cache.get_face(
+        photo.storage_path,
+        (detection.bounding_box_x, detection.bounding_box_y,
+         detection.bounding_box_width, detection.bounding_box_height),
+        size,
+        format,
+        photo.content_hash
+    )
+    return FileResponse(
+        crop_path,
+        media_type=RENDITION_FORMATS[format][2],
+        headers={"Cache-Control": "private, max-age=86400"}
+    )
+
+@router.get("/clusters", response_model=List[FaceClusterResponse])
+def get_clusters(
+    min_size: int = 2,
+    skip: int = 0,
+    limit: int = 50,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Get the user's clusters of unidentified faces, largest first
+    clusters = db.query(FaceCluster).filter(
+        FaceCluster.user_id == current_user.user_id,
+        FaceCluster.size >= min_size
+    ).order_by(FaceCluster.size.desc(), FaceCluster.cluster_id.desc()).offset(skip).limit(limit).all()
+    
+    # Load all representative detections at once
+    representative_ids = [c.representative_detection_id for c in clusters if c.representative_detection_id]
+    representatives = {
+        detection.detection_id: detection
+        for detection in db.query(FaceDetection).filter(FaceDetection.detection_id.in_(representative_ids))
+    } if representative_ids else {}
+    
+    return [
+        {
+            "cluster_id": cluster.cluster_id,
+            "size": cluster.size,
+            "representative": representatives.get(cluster.representative_detection_id)
+        }
+        for cluster in clusters
+    ]
+
+@router.get("/clusters/{cluster_id}/detections", response_model=List[FaceDetectionResponse])
+def get_cluster_detections(
+    cluster_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Check if cluster exists and belongs to user
+    cluster = db.query(FaceCluster).filter(
+        FaceCluster.cluster_id == cluster_id,
+        FaceCluster.user_id == current_user.user_id
+    ).first()
+    
+    if not cluster:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Cluster not found or you don't have access"
+        )
+    
+    # Get the members of the cluster
+    detections = db.query(FaceDetection).filter(
+        FaceDetection.cluster_id == cluster_id
+    ).order_by(FaceDetection.detection_id).offset(skip).limit(limit).all()
+    
+    return detections
+
+@router.post("/clusters/{cluster_id}/name", response_model=FaceResponse)
+def name_cluster(
+    cluster_id: int,
+    cluster_name: ClusterName,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Check if cluster exists and belongs to user
+    cluster = db.query(FaceCluster).filter(
+        FaceCluster.cluster_id == cluster_id,
+        FaceCluster.user_id == current_user.user_id
+    ).first()
+    
+    if not cluster:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Cluster not found or you don't have access"
+        )
+    
+    if (cluster_name.face_id is None) == (cluster_name.person_name is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Give either person_name or face_id"
+        )
+    
+    if cluster_name.face_id is not None:
+        # Add the faces to an existing person
+        face = db.query(Face).filter(
+            Face.face_id == cluster_name.face_id,
+            Face.user_id == current_user.user_id,
+            Face.is_active == True
+        ).first()
+        
+        if not face:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Face not found or you don't have access"
+            )
+    else:
+        # Create a new person from the cluster's representative detection
+        representative = db.query(FaceDetection).filter(
+            FaceDetection.cluster_id == cluster_id
+        ).order_by(
+            (FaceDetection.detection_id == cluster.representative_detection_id).desc()
+        ).first()
+        
+        if not representative:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Cluster has no detections"
+            )
+        
+        face = Face(
+            user_id=current_user.user_id,
+            person_name=cluster_name.person_name,
+            face_embedding=representative.embedding
+        )
+        db.add(face)
+        db.flush()
+    
+    # Identify every member with one UPDATE and drop the cluster
+    identified = db.query(FaceDetection).filter(
+        FaceDetection.cluster_id == cluster_id
+    ).update(
+        {FaceDetection.face_id: face.face_id, FaceDetection.identified: True, FaceDetection.cluster_id: None},
+        synchronize_session=False
+    )
+    db.delete(cluster)
+    db.flush()
+    # Versions including these changes, for the write-through below
+    clusters_version = cluster_version(db, current_user.user_id)
+    faces_version = gallery_version(db, current_user.user_id)
+    db.commit()
+    db.refresh(face)
+    logger.info(f"Named cluster {cluster_id} as face {face.face_id} ({identified} detections)")
+    
+    # Keep the cached indexes in sync (stale embeddings are not matchable)
+    cluster_cache.remove_face(current_user.user_id, cluster_id, version=clusters_version)
+    if cluster_name.face_id is None and face_recognition_service.is_current_embedding(face.face_embedding):
+        gallery_cache.add_face(
+            current_user.user_id,
+            face.face_id,
+            face_recognition_service.deserialize_embedding(face.face_embedding),
+            version=faces_version
+        )
+    
+    # Identify the person's detections outside the cluster in the background
+    job_queue.enqueue(db, "retro_match", user_id=current_user.user_id, payload={"face_id": face.face_id})
+    
+    return face
+
+def _best_match_per_photo(db: Session, user_id: int, scores: Dict[int, float]) -> Dict[int, FaceSearchMatch]:
+    """Best scoring detection of each live photo; blocking, run in the threadpool."""
+    best: Dict[int, FaceSearchMatch] = {}
+    if scores:
+        for detection_id, photo_id in db.query(FaceDetection.detection_id, FaceDetection.photo_id).join(Photo).filter(
+            FaceDetection.detection_id.in_(list(scores)),
+            Photo.user_id == user_id,
+            Photo.is_deleted == False
+        ):
+            score = scores[detection_id]
+            if photo_id not in best or score > best[photo_id].score:
+                best[photo_id] = FaceSearchMatch(photo_id=photo_id, detection_id=detection_id, score=score)
+    return best
+
+@router.post("/search", response_model=FaceSearchResponse)
+async def search_faces(
+    file: UploadFile = File(...),
+    top_k: int = 200,
+    threshold: Optional[float] = None,
+    skip: int = 0,
+    limit: int = 20,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # Check the search parameters
+    if not 1 <= top_k <= 1000:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="top_k must be between 1 and 1000"
+        )
+    if threshold is None:
+        threshold = face_recognition_service.similarity_threshold
+    
+    # Detect faces in the query image; it is not kept, and neither are its
+    # detections, which would evict the cached results of real photos
+    upload_dir = tempfile.mkdtemp(prefix="face-search-")
+    try:
+        query_image = await stream_upload(file, upload_dir=upload_dir)
+        detections = await face_recognition_service.detect_faces(query_image.path, content_hash=None)
+    finally:
+        await run_in_threadpool(shutil.rmtree, upload_dir, True)
+    
+    if not detections:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No face found in the image"
+        )
+    
+    # Search for the largest face (the subject of a selfie) in the user's detection index
+    query = max(detections, key=lambda d: d["location"]["width"] * d["location"]["height"])
+    scores, detection_ids = await run_in_threadpool(
+        detection_index.search,
+        db,
+        current_user.user_id,
+        face_recognition_service.descriptor.pipeline_version,
+        query["embedding"],
+        top_k
+    )
+    scores_by_detection = {
+        int(detection_id): float(score)
+        for score, detection_id in zip(scores, detection_ids)
+        if score >= threshold
+    }
+    
+    # Best match per photo, skipping deleted photos and detections
+    best = await run_in_threadpool(_best_match_per_photo, db, current_user.user_id, scores_by_detection)
+    
+    ranked = sorted(best.values(), key=lambda match: (-match.score, match.photo_id))
+    return FaceSearchResponse(total=len(ranked), results=ranked[skip:skip + limit])
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Response, status, UploadFile, File, Form
 from fastapi.responses import FileResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
@@ -7,20 +10,22 @@ import os
 import shutil
 from datetime import datetime
 
-from database.database import get_db
+from database.database import background_writer, get_async_db, get_db
 from models.user import User
 from models.photo import Photo, Event
+from models.job import ProcessingJob
 from services.auth_service import get_current_user
-from services.face_recognition_service import FaceRecognitionService
+from services.job_queue import job_queue
+from services.pagination import after_cursor, next_cursor
+from services.renditions import EAGER_SIZES, RENDITION_FORMATS, RENDITION_SIZES, rendition_cache
+from services.photo_store import abandon as abandon_stored_file, acquire as acquire_stored_file, release as release_stored_file
+from services.upload_service import UPLOAD_MAX_BYTES, StoredUpload, safe_filename, storage_remaining, stream_upload
 
 router = APIRouter(
     prefix="/photos",
     tags=["photos"]
 )
 
-# Initialize face recognition service
-face_recognition_service = FaceRecognitionService()
-
 class PhotoCreate(BaseModel):
     event_id: Optional[int] = None
     taken_at: Optional[datetime] = None
@@ -36,31 +41,31 @@ class PhotoResponse(BaseModel):
     height: Optional[int]
     format: Optional[str]
     taken_at: Optional[datetime]
+    location_lat: Optional[float]
+    location_long: Optional[float]
+    camera_model: Optional[str]
     is_processed: bool
     upload_date: datetime
 
     class Config:
         orm_mode = True
 
-@router.post("/upload", response_model=PhotoResponse)
-async def upload_photo(
-    event_id: Optional[int] = Form(None),
-    file: UploadFile = File(...),
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    # Process and save the uploaded image
-    file_path = await face_recognition_service.process_uploaded_image(file)
-    
-    # Get file information
-    file_size = os.path.getsize(file_path)
-    file_name = os.path.basename(file_path)
-    
+@job_queue.handler("generate_renditions")
+async def run_generate_renditions_job(db: Session, job: ProcessingJob):
+    # Queued by upload_photo; renders off the event loop
+    photo = await background_writer.run(db.get, Photo, job.photo_id)
+    if not photo or photo.is_deleted:
+        return
+    for size in job.payload["sizes"]:
+        await run_in_threadpool(rendition_cache.get, photo.storage_path, size, "jpeg", photo.content_hash)
+
+def _upload_limit(db: Session, user_id: int, event_id: Optional[int]) -> int:
+    """Size limit of a new photo of the user; blocking, run in the threadpool."""
     # Check if event exists if event_id is provided
     if event_id:
         event = db.query(Event).filter(
             Event.event_id == event_id,
-            Event.user_id == current_user.user_id
+            Event.user_id == user_id
         ).first()
         
         if not event:
@@ -69,13 +74,46 @@ async def upload_photo(
                 detail="Event not found or you don't have access"
             )
     
-    # Create photo record
+    # Check the subscription's storage limit before reading the file
+    max_bytes = UPLOAD_MAX_BYTES
+    remaining = storage_remaining(db, user_id)
+    # No connection is held while the file streams in
+    db.rollback()
+    if remaining is not None:
+        if remaining == 0:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail="Storage limit of your subscription reached"
+            )
+        max_bytes = min(max_bytes, remaining)
+    return max_bytes
+
+def _add_photo(db: Session, user_id: int, event_id: Optional[int], file_name: str, stored: StoredUpload) -> Photo:
+    """Create the photo record of a stored upload; blocking, run in the threadpool."""
+    # Create photo record referencing the stored file
+    try:
+        acquire_stored_file(db, stored)
+    except FileNotFoundError:
+        # Purged while the upload was in flight (see services.photo_store)
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The stored file was removed during the upload; upload it again"
+        )
     new_photo = Photo(
-        user_id=current_user.user_id,
+        user_id=user_id,
         event_id=event_id,
-        file_name=file_name,
-        storage_path=file_path,
-        file_size=file_size,
+        file_name=safe_filename(file_name),
+        storage_path=stored.path,
+        content_hash=stored.sha256,
+        file_size=stored.size,
+        width=stored.width,
+        height=stored.height,
+        format=stored.format,
+        taken_at=stored.metadata.taken_at,
+        location_lat=stored.metadata.location_lat,
+        location_long=stored.metadata.location_long,
+        camera_model=stored.metadata.camera_model,
         is_processed=False
     )
     
@@ -83,11 +121,40 @@ async def upload_photo(
     db.commit()
     db.refresh(new_photo)
     
-    # Return response
+    # Generate gallery thumbnails in the background
+    if EAGER_SIZES:
+        job_queue.enqueue(
+            db,
+            "generate_renditions",
+            user_id=user_id,
+            photo_id=new_photo.photo_id,
+            payload={"sizes": EAGER_SIZES}
+        )
     return new_photo
 
+@router.post("/upload", response_model=PhotoResponse)
+async def upload_photo(
+    event_id: Optional[int] = Form(None),
+    file: UploadFile = File(...),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    # The synchronous session's queries run in the threadpool, the upload on the event loop
+    max_bytes = await run_in_threadpool(_upload_limit, db, current_user.user_id, event_id)
+    
+    # Stream the uploaded image into the content-addressed store
+    stored = await stream_upload(file, max_bytes=max_bytes)
+    
+    # Return response
+    try:
+        return await run_in_threadpool(_add_photo, db, current_user.user_id, event_id, file.filename, stored)
+    except Exception:
+        # Leave no file in the store without a stored_files row
+        await run_in_threadpool(abandon_stored_file, db, stored)
+        raise
+
 @router.get("/{photo_id}", response_model=PhotoResponse)
-async def get_photo(
+def get_photo(
     photo_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -107,8 +174,10 @@ async def get_photo(
     return photo
 
 @router.get("/{photo_id}/file")
-async def get_photo_file(
+def get_photo_file(
     photo_id: int,
+    size: Optional[int] = None,
+    format: str = "jpeg",
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -124,34 +193,68 @@ async def get_photo_file(
             detail="Photo not found or you don't have access"
         )
     
-    # Return file
-    return FileResponse(photo.storage_path, filename=photo.file_name)
+    # Return the original file unless a rendition size is requested
+    if size is None:
+        return FileResponse(photo.storage_path, filename=photo.file_name)
+    
+    # Check the requested rendition
+    if size not in RENDITION_SIZES or format not in RENDITION_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Renditions are available in sizes {list(RENDITION_SIZES)} "
+                   f"and formats {list(RENDITION_FORMATS)}"
+        )
+    
+    # Serve the cached rendition, generating it on first request
+    rendition_path = rendition_cache.get(photo.storage_path, size, format, photo.content_hash)
+    _, extension, media_type = RENDITION_FORMATS[format]
+    return FileResponse(
+        rendition_path,
+        media_type=media_type,
+        filename=f"{os.path.splitext(photo.file_name)[0]}_{size}{extension}",
+        headers={"Cache-Control": "private, max-age=86400"}
+    )
 
 @router.get("/", response_model=List[PhotoResponse])
 async def get_photos(
+    response: Response,
     event_id: Optional[int] = None,
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Build query
-    query = db.query(Photo).filter(
+    # Build query; the async session awaits the database instead of blocking the event loop
+    query = select(Photo).where(
         Photo.user_id == current_user.user_id,
         Photo.is_deleted == False
     )
     
     # Filter by event if specified
     if event_id:
-        query = query.filter(Photo.event_id == event_id)
+        query = query.where(Photo.event_id == event_id)
+    
+    # Continue after the previous page's cursor (skip is for offset paging only)
+    if cursor:
+        try:
+            query = query.where(after_cursor(Photo, "upload_date", "photo_id", cursor))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    else:
+        query = query.offset(skip)
     
-    # Get photos with pagination
-    photos = query.order_by(Photo.upload_date.desc()).offset(skip).limit(limit).all()
+    # Get photos with pagination; one extra row tells whether another page exists
+    query = query.order_by(Photo.upload_date.desc(), Photo.photo_id.desc()).limit(limit + 1)
+    photos = (await db.scalars(query)).all()
     
-    return photos
+    page_cursor = next_cursor(photos, limit, "upload_date", "photo_id")
+    if page_cursor:
+        response.headers["X-Next-Cursor"] = page_cursor
+    return photos[:limit]
 
 @router.delete("/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_photo(
+def delete_photo(
     photo_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -168,7 +271,9 @@ async def delete_photo(
             detail="Photo not found or you don't have access"
         )
     
-    # Soft delete (mark as deleted)
+    # Soft delete (mark as deleted) and drop its reference to the stored file
+    if not photo.is_deleted:
+        release_stored_file(db, photo.content_hash)
     photo.is_deleted = True
     db.commit()
     
@@ -1,4 +1,5 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, EmailStr
@@ -6,7 +7,9 @@ from datetime import datetime
 
 from database.database import get_db
 from models.user import User, UserSubscription
-from services.auth_service import get_current_user, get_password_hash
+from services.auth_service import get_current_user
+from services.password_hasher import password_hasher
+from services.principal_cache import principal_cache
 
 router = APIRouter(
     prefix="/users",
@@ -40,7 +43,7 @@ async def get_current_user_profile(
     return current_user
 
 @router.put("/me", response_model=UserProfile)
-async def update_user_profile(
+def update_user_profile(
     profile_data: UserProfileUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -68,6 +71,9 @@ async def update_user_profile(
     db.commit()
     db.refresh(current_user)
     
+    # Cached tokens of the user still carry the old profile
+    principal_cache.invalidate_user(current_user.user_id)
+    
     return current_user
 
 @router.put("/me/password", status_code=status.HTTP_204_NO_CONTENT)
@@ -77,17 +83,19 @@ async def change_password(
     db: Session = Depends(get_db)
 ):
     # Verify current password
-    if not verify_password(password_data.current_password, current_user.password_hash):
+    if not await password_hasher.verify(password_data.current_password, current_user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Incorrect current password"
         )
     
     # Update password
-    current_user.password_hash = get_password_hash(password_data.new_password)
+    current_user.password_hash = await password_hasher.hash(password_data.new_password)
     current_user.updated_at = datetime.utcnow()
     
-    db.commit()
+    # The synchronous session commits in the threadpool, not on the event loop
+    await run_in_threadpool(db.commit)
+    principal_cache.invalidate_user(current_user.user_id)
     
     return None
 
@@ -102,7 +110,7 @@ class SubscriptionResponse(BaseModel):
         orm_mode = True
 
 @router.get("/me/subscription", response_model=Optional[SubscriptionResponse])
-async def get_user_subscription(
+def get_user_subscription(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -0,0 +1,80 @@
+"""
+Benchmark the IVF gallery index against brute-force search.
+
+Reports recall@1 (agreement of the top match with exact search) and query
+latency percentiles for synthetic galleries of increasing size.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ann --sizes 1000 10000 100000 --n-probe 4 8 16
+"""
+import argparse
+import time
+
+import numpy as np
+
+from services.ann_index import ExactIndex, IVFIndex
+from services.face_matching import normalize_embeddings
+
+
+def make_gallery(size: int, dim: int, rng: np.random.Generator):
+    """Clustered identities, as real embeddings are not uniformly spread."""
+    n_clusters = max(1, int(np.sqrt(size)))
+    centres = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    members = rng.integers(0, n_clusters, size)
+    vectors = centres[members] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    return normalize_embeddings(vectors)
+
+
+def make_queries(gallery: np.ndarray, count: int, rng: np.random.Generator):
+    """Noisy copies of gallery entries, i.e. new photos of known people."""
+    picks = rng.integers(0, len(gallery), count)
+    noise = 1.5 * rng.standard_normal((count, gallery.shape[1])).astype(np.float32) / np.sqrt(gallery.shape[1])
+    return normalize_embeddings(gallery[picks] + noise)
+
+
+def time_queries(index, queries: np.ndarray, **kwargs):
+    latencies = []
+    top_ids = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[np.newaxis], top_k=1, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        top_ids.append(ids[0, 0])
+    return np.array(top_ids), np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--n-probe", type=int, nargs="+", default=[4, 8, 16])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'size':>8} {'index':>12} {'build s':>8} {'recall@1':>9} {'p50 ms':>8} {'p99 ms':>8}")
+
+    for size in args.sizes:
+        gallery = make_gallery(size, args.dim, rng)
+        ids = np.arange(size)
+        queries = make_queries(gallery, args.queries, rng)
+
+        exact = ExactIndex(ids, gallery)
+        truth, latencies = time_queries(exact, queries)
+        print(f"{size:>8} {'exact':>12} {0.0:>8.2f} {1.0:>9.3f} "
+              f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}")
+
+        start = time.perf_counter()
+        ivf = IVFIndex.build(ids, gallery)
+        build_time = time.perf_counter() - start
+
+        for n_probe in args.n_probe:
+            found, latencies = time_queries(ivf, queries, n_probe=n_probe)
+            recall = float(np.mean(found == truth))
+            print(f"{size:>8} {f'ivf/{n_probe}':>12} {build_time:>8.2f} {recall:>9.3f} "
+                  f"{np.percentile(latencies, 50):>8.3f} {np.percentile(latencies, 99):>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark incremental clustering of unidentified faces at scale.
+
+Fills a throwaway SQLite database with ``--detections`` unidentified
+detections of one user, drawn from ``--identities`` synthetic people with
+Zipf-distributed photo counts, and clusters them with the backfill of
+services.face_clustering, ``--step`` new detections at a time as if photos
+kept arriving. Each step's throughput should stay flat while the number of
+clusters grows, since a detection is only compared with cluster means.
+
+Reports per step the detections/s, clusters and the size of the cluster
+index, then purity (share of detections in a cluster whose majority is
+their own person), how many clusters each person is split over, and peak
+RSS of the process.
+
+Usage (from backend/):
+    python -m benchmarks.bench_clustering [--detections 100000] [--identities 2000] [--step 10000]
+"""
+import argparse
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+PIPELINE_VERSION = 1
+
+
+def make_detections(count: int, identities: int, dim: int, noise: float, rng: np.random.Generator):
+    """Identity labels and embeddings: each person's base vector plus per-photo noise."""
+    weights = 1 / np.arange(1, identities + 1)
+    labels = rng.choice(identities, size=count, p=weights / weights.sum())
+    bases = rng.standard_normal((identities, dim)).astype(np.float32)
+    bases /= np.linalg.norm(bases, axis=1, keepdims=True)
+    vectors = bases[labels] + noise * rng.standard_normal((count, dim)).astype(np.float32) / np.sqrt(dim)
+    return labels, vectors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detections", type=int, default=100000)
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--step", type=int, default=10000, help="Detections added between clustering runs")
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.5, help="Per-photo noise relative to the identity vector")
+    # Random vectors score on their own scale, not any descriptor's
+    parser.add_argument("--threshold", type=float, default=0.7, help="Minimum correlation with a cluster mean to join")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run(args):
+    from sqlalchemy import insert
+
+    from database.database import Base, SessionLocal, engine
+    from models import face, job, photo, user  # noqa: F401 (register the tables)
+    from models.face import FaceDetection
+    from models.photo import Photo
+    from models.user import User
+    from services.embedding_format import encode_embedding
+    from services.face_clustering import backfill, cluster_cache
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(username="bench", email="bench@example.com", password_hash="-"))
+    db.commit()
+
+    rng = np.random.default_rng(args.seed)
+    labels, vectors = make_detections(args.detections, args.identities, args.dim, args.noise, rng)
+
+    print(f"{args.detections} detections of {args.identities} people, dim {args.dim}, noise {args.noise}")
+    print(f"{'detections':>10} {'per s':>8} {'clusters':>9} {'index MB':>9}")
+    total_clusters = 0
+    for start in range(0, args.detections, args.step):
+        stop = min(start + args.step, args.detections)
+        # One photo per four faces
+        db.execute(insert(Photo), [
+            {"user_id": 1, "file_name": f"{i}.jpg", "storage_path": f"/photos/{i}.jpg", "file_size": 1,
+             "is_processed": True, "is_deleted": False}
+            for i in range(start // 4, (stop + 3) // 4)
+        ])
+        db.execute(insert(FaceDetection), [
+            {"photo_id": i // 4 + 1, "bounding_box_x": 0, "bounding_box_y": 0, "bounding_box_width": 1,
+             "bounding_box_height": 1, "confidence_score": 1.0, "identified": False,
+             "embedding": encode_embedding(vectors[i], pipeline_version=PIPELINE_VERSION)}
+            for i in range(start, stop)
+        ])
+        db.commit()
+
+        begin = time.perf_counter()
+        assigned, created = backfill(db, 1, PIPELINE_VERSION, args.threshold, batch_size=1000)
+        elapsed = time.perf_counter() - begin
+        total_clusters += created
+        index_mb = cluster_cache.stats()["bytes"] / 1024 / 1024
+        print(f"{stop:>10} {assigned / elapsed:>8.0f} {total_clusters:>9} {index_mb:>9.1f}")
+
+    # Detections are numbered in insertion order, like labels
+    assignments = np.array(
+        [cluster_id for cluster_id, in db.query(FaceDetection.cluster_id).order_by(FaceDetection.detection_id)]
+    )
+    db.close()
+    # Detections per (cluster, person) pair
+    pairs, counts = np.unique(np.stack([assignments, labels], axis=1), axis=0, return_counts=True)
+    cluster_starts = np.flatnonzero(np.r_[True, pairs[1:, 0] != pairs[:-1, 0]])
+    majority = np.maximum.reduceat(counts, cluster_starts).sum()
+    splits = np.bincount(pairs[:, 1])
+    splits = splits[splits > 0]
+
+    print(f"purity {majority / len(labels):.3f}, clusters per person: "
+          f"median {np.median(splits):.0f}, p95 {np.percentile(splits, 95):.0f}")
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
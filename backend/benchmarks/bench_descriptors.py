@@ -0,0 +1,207 @@
+"""
+Compare face descriptors on speed, size and identification quality.
+
+For every descriptor this reports the embedding size, describe() throughput,
+gallery matching throughput and rank-1 identification accuracy: one view of
+each identity is enrolled and every other view must find its own identity as
+the best match.
+
+Rank-1 accuracy says nothing about the match threshold, so every pair of
+views is also scored: the false-accept rate (pairs of different identities
+scoring at or above the threshold) and false-reject rate (pairs of the same
+identity scoring below it) are reported at the descriptor's
+similarity_threshold, together with the lowest threshold whose false-accept
+rate is within --target-far. That column is how the descriptors'
+similarity_threshold values were calibrated.
+
+Clustering compares a new face with the mean of a cluster's members, and
+means of unrelated faces score higher than single faces do. The last view
+of every identity is scored against the mean of each identity's other
+views, and the lowest threshold with a false-accept rate within
+--cluster-target-far is reported next to the descriptor's
+cluster_threshold.
+
+By default identities are synthetic (random face-like textures seen under
+small pose, lighting, blur and noise changes). Pass --dataset DIR with one
+sub-directory of face crops per person to measure on real data.
+
+Usage (from backend/):
+    python -m benchmarks.bench_descriptors [--identities 200] [--views 5] [--target-far 0.001]
+        [--cluster-target-far 0.0001]
+"""
+import argparse
+import os
+import time
+
+import cv2
+import numpy as np
+
+from services.face_descriptors import LBPDescriptor, PixelDescriptor
+from services.face_matching import match_embeddings, normalize_embeddings
+
+
+def synthetic_identity(rng: np.random.Generator, size: int = 120) -> np.ndarray:
+    """Face-like layout (oval, eyes, mouth) over an identity-specific texture."""
+    texture = cv2.GaussianBlur(rng.random((size, size)).astype(np.float32), (0, 0), 6)
+    face = 0.35 + 0.4 * (texture - texture.min()) / (np.ptp(texture) + 1e-6)
+    center = size // 2
+    cv2.ellipse(face, (center, center), (int(size * 0.36), int(size * 0.46)), 0, 0, 360, 0.15, 2)
+    eye_y = int(size * rng.uniform(0.36, 0.44))
+    eye_dx = int(size * rng.uniform(0.14, 0.2))
+    for dx in (-eye_dx, eye_dx):
+        cv2.circle(face, (center + dx, eye_y), int(size * rng.uniform(0.04, 0.07)), 0.1, -1)
+    mouth_y = int(size * rng.uniform(0.66, 0.74))
+    cv2.ellipse(face, (center, mouth_y), (int(size * rng.uniform(0.1, 0.18)), 6), 0, 0, 180, 0.2, 2)
+    return face
+
+
+def synthetic_view(face: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """The same face in a new photo: small pose, lighting, blur and noise changes."""
+    size = face.shape[0]
+    matrix = cv2.getRotationMatrix2D(
+        (size / 2 + rng.uniform(-3, 3), size / 2 + rng.uniform(-3, 3)),
+        rng.uniform(-8, 8),
+        rng.uniform(0.93, 1.07)
+    )
+    view = cv2.warpAffine(face, matrix, (size, size), borderMode=cv2.BORDER_REFLECT)
+    view = view * rng.uniform(0.7, 1.3) + rng.uniform(-0.15, 0.15)
+    view = cv2.GaussianBlur(view, (0, 0), rng.uniform(0.3, 1.2))
+    view = view + rng.normal(0, 0.03, view.shape)
+    return (np.clip(view, 0, 1) * 255).astype(np.uint8)
+
+
+def load_dataset(path: str):
+    crops, labels = [], []
+    for label, person in enumerate(sorted(os.listdir(path))):
+        person_dir = os.path.join(path, person)
+        for name in sorted(os.listdir(person_dir)):
+            crop = cv2.imread(os.path.join(person_dir, name), cv2.IMREAD_GRAYSCALE)
+            if crop is not None:
+                crops.append(crop)
+                labels.append(label)
+    return crops, np.array(labels)
+
+
+def score_histograms(embeddings: np.ndarray, labels: np.ndarray, chunk: int = 1024):
+    """
+    Histograms of the scores of every pair of views, in 0.001 wide bins.
+
+    Returns:
+        Tuple of (bin edges, genuine pair counts, impostor pair counts)
+    """
+    edges = np.linspace(-1, 1, 2001)
+    genuine = np.zeros(len(edges) - 1, dtype=np.int64)
+    impostor = np.zeros(len(edges) - 1, dtype=np.int64)
+    for start in range(0, len(labels), chunk):
+        rows = np.arange(start, min(start + chunk, len(labels)))
+        scores = np.clip(embeddings[rows] @ embeddings.T, -1, 1)
+        # Each unordered pair once
+        upper = np.arange(len(labels))[np.newaxis, :] > rows[:, np.newaxis]
+        same = labels[rows, np.newaxis] == labels[np.newaxis, :]
+        genuine += np.histogram(scores[upper & same], edges)[0]
+        impostor += np.histogram(scores[upper & ~same], edges)[0]
+    return edges, genuine, impostor
+
+
+def cluster_histograms(embeddings: np.ndarray, labels: np.ndarray):
+    """
+    Histograms of the scores of every identity's last view against the mean
+    of each identity's other views, in 0.001 wide bins.
+
+    Returns:
+        Tuple of (bin edges, genuine pair counts, impostor pair counts)
+    """
+    identities = np.unique(labels)
+    last = np.array([np.flatnonzero(labels == identity)[-1] for identity in identities])
+    rest = np.ones(len(labels), dtype=bool)
+    rest[last] = False
+    means = normalize_embeddings([embeddings[rest & (labels == identity)].mean(axis=0) for identity in identities])
+    scores = np.clip(embeddings[last] @ means.T, -1, 1)
+    same = np.eye(len(identities), dtype=bool)
+    edges = np.linspace(-1, 1, 2001)
+    return edges, np.histogram(scores[same], edges)[0], np.histogram(scores[~same], edges)[0]
+
+
+def error_rates(edges, genuine, impostor, threshold: float):
+    """False-accept and false-reject rates when scores >= threshold match."""
+    cut = int(np.searchsorted(edges, threshold - 1e-9))
+    far = impostor[cut:].sum() / max(impostor.sum(), 1)
+    frr = genuine[:cut].sum() / max(genuine.sum(), 1)
+    return float(far), float(frr)
+
+
+def calibrate_threshold(edges, impostor, target_far: float) -> float:
+    """Lowest bin edge whose false-accept rate is at most target_far."""
+    accepted = np.cumsum(impostor[::-1])[::-1] / max(impostor.sum(), 1)
+    return float(edges[int(np.argmax(accepted <= target_far))]) if (accepted <= target_far).any() else 1.0
+
+
+def evaluate(descriptor, crops, labels):
+    start = time.perf_counter()
+    embeddings = normalize_embeddings([descriptor.describe(crop) for crop in crops])
+    describe_rate = len(crops) / (time.perf_counter() - start)
+
+    # Enroll the first view of every identity, probe with the rest
+    _, first = np.unique(labels, return_index=True)
+    probe_mask = np.ones(len(labels), dtype=bool)
+    probe_mask[first] = False
+
+    start = time.perf_counter()
+    _, indices = match_embeddings(embeddings[probe_mask], embeddings[first], top_k=1, normalized=True)
+    match_rate = probe_mask.sum() / (time.perf_counter() - start)
+
+    accuracy = float(np.mean(labels[first][indices[:, 0]] == labels[probe_mask]))
+    return (
+        embeddings.shape[1], describe_rate, match_rate, accuracy,
+        score_histograms(embeddings, labels), cluster_histograms(embeddings, labels)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--identities", type=int, default=200)
+    parser.add_argument("--views", type=int, default=5)
+    parser.add_argument("--dataset", help="Directory with one sub-directory of face crops per person")
+    parser.add_argument("--target-far", type=float, default=0.001,
+                        help="False-accept rate the calibrated threshold is chosen for")
+    parser.add_argument("--cluster-target-far", type=float, default=0.0001,
+                        help="False-accept rate against cluster means the calibrated cluster threshold is chosen for")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.dataset:
+        crops, labels = load_dataset(args.dataset)
+    else:
+        crops, labels = [], []
+        for identity in range(args.identities):
+            face = synthetic_identity(rng)
+            for _ in range(args.views):
+                crops.append(synthetic_view(face, rng))
+                labels.append(identity)
+        labels = np.array(labels)
+
+    descriptors = [PixelDescriptor(), LBPDescriptor()]
+
+    print(f"{len(crops)} crops of {len(np.unique(labels))} identities")
+    print(f"{'descriptor':>18} {'dims':>6} {'bytes/f16':>10} {'describe/s':>11} {'match/s':>10} {'rank-1':>7} "
+          f"{'threshold':>10} {'FAR':>7} {'FRR':>7} {'calibrated':>11} {'FRR':>7} "
+          f"{'cluster':>10} {'FAR':>7} {'FRR':>7} {'calibrated':>11} {'FRR':>7}")
+    for descriptor in descriptors:
+        dims, describe_rate, match_rate, accuracy, pairs, clusters = evaluate(descriptor, crops, labels)
+        columns = []
+        for (edges, genuine, impostor), threshold, target_far in (
+            (pairs, descriptor.similarity_threshold, args.target_far),
+            (clusters, descriptor.cluster_threshold, args.cluster_target_far),
+        ):
+            far, frr = error_rates(edges, genuine, impostor, threshold)
+            calibrated = calibrate_threshold(edges, impostor, target_far)
+            _, calibrated_frr = error_rates(edges, genuine, impostor, calibrated)
+            columns.append(f"{threshold:>10.3f} {far:>7.4f} {frr:>7.4f} "
+                           f"{calibrated:>11.3f} {calibrated_frr:>7.4f}")
+        print(f"{descriptor.version:>18} {dims:>6} {dims * 2 + 16:>10} "
+              f"{describe_rate:>11.0f} {match_rate:>10.0f} {accuracy:>7.3f} {' '.join(columns)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare face detection presets on a fixed corpus of photos.
+
+For every preset (services.detection_presets) this reports photos per
+second, mean latency, faces found and recall against the ``thorough``
+preset: the share of its boxes that the preset also finds (IoU >= 0.5).
+
+Pass --corpus DIR to measure on real photos. Without it a deterministic
+corpus of camera-sized synthetic photos is generated, which measures speed
+only (it contains no faces).
+
+Usage (from backend/):
+    python -m benchmarks.bench_detection_presets [--corpus DIR] [--photos 10] [--width 6000 --height 4000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from services.detection_presets import PRESETS
+from services.face_recognition_service import FaceRecognitionService
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def synthetic_corpus(directory: str, photos: int, width: int, height: int, seed: int):
+    """Write smooth random textures as JPEG files, like camera output in size and entropy."""
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(photos):
+        small = rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8)
+        image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+        path = os.path.join(directory, f"synthetic_{i:03d}.jpg")
+        cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        paths.append(path)
+    return paths
+
+
+def iou(a: dict, b: dict) -> float:
+    x0, y0 = max(a["x"], b["x"]), max(a["y"], b["y"])
+    x1 = min(a["x"] + a["width"], b["x"] + b["width"])
+    y1 = min(a["y"] + a["height"], b["y"] + b["height"])
+    intersection = max(x1 - x0, 0) * max(y1 - y0, 0)
+    union = a["width"] * a["height"] + b["width"] * b["height"] - intersection
+    return intersection / union if union else 0.0
+
+
+def run_preset(service: FaceRecognitionService, paths, preset: str):
+    boxes, latencies = [], []
+    for path in paths:
+        start = time.perf_counter()
+        detections = service.detect_faces_sync(path, preset)
+        latencies.append(time.perf_counter() - start)
+        boxes.append([detection["location"] for detection in detections])
+    return boxes, np.array(latencies)
+
+
+def recall(found, reference) -> float:
+    total = sum(len(photo) for photo in reference)
+    if not total:
+        return float("nan")
+    matched = sum(
+        any(iou(box, candidate) >= 0.5 for candidate in candidates)
+        for candidates, photo in zip(found, reference)
+        for box in photo
+    )
+    return matched / total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of photos")
+    parser.add_argument("--photos", type=int, default=10, help="Synthetic photos to generate")
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = None
+    if args.corpus:
+        paths = sorted(
+            os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    else:
+        work_dir = tempfile.mkdtemp()
+        paths = synthetic_corpus(work_dir, args.photos, args.width, args.height, args.seed)
+
+    try:
+        service = FaceRecognitionService()
+        results = {preset: run_preset(service, paths, preset) for preset in PRESETS}
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir)
+
+    # Synthetic photos hold no faces; boxes found there are false positives
+    reference = results["thorough"][0] if args.corpus else None
+    print(f"{len(paths)} photos")
+    print(f"{'preset':>10} {'photos/s':>9} {'mean ms':>9} {'faces':>6} {'recall':>7}")
+    for preset, (boxes, latencies) in results.items():
+        print(f"{preset:>10} {1 / latencies.mean():>9.2f} {latencies.mean() * 1000:>9.0f} "
+              f"{sum(len(photo) for photo in boxes):>6} "
+              f"{recall(boxes, reference) if reference else float('nan'):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
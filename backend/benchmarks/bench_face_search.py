@@ -0,0 +1,121 @@
+"""
+Benchmark search by face over a user's persistent detection index.
+
+Fills a throwaway SQLite database with ``--detections`` detections of
+synthetic people (see benchmarks.bench_clustering) and times, through
+services.detection_index:
+
+* the first search, which builds the index from the database and saves it;
+* a search after a restart, which loads the saved index instead;
+* steady-state searches, including the check for new detections.
+
+Latency percentiles are reported with the recall of the top ``--top-k``
+against exact search over the same embeddings.
+
+Usage (from backend/):
+    python -m benchmarks.bench_face_search [--detections 200000] [--top-k 100]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_clustering import PIPELINE_VERSION, make_detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detections", type=int, default=200000)
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--dim", type=int, default=531, help="531 is the size of the LBP descriptor")
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ["DETECTION_INDEX_DIR"] = os.path.join(work_dir, "detection_index")
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run(args):
+    from sqlalchemy import insert
+
+    from database.database import Base, SessionLocal, engine
+    from models import face, job, photo, user  # noqa: F401 (register the tables)
+    from models.face import FaceDetection
+    from models.photo import Photo
+    from models.user import User
+    from services.ann_index import ExactIndex
+    from services.detection_index import SEARCH_N_PROBE, detection_index
+    from services.embedding_format import encode_embedding
+    from services.face_matching import normalize_embeddings
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(username="bench", email="bench@example.com", password_hash="-"))
+    db.commit()
+
+    rng = np.random.default_rng(args.seed)
+    labels, vectors = make_detections(args.detections, args.identities, args.dim, args.noise, rng)
+    for start in range(0, args.detections, 10000):
+        stop = min(start + 10000, args.detections)
+        # One photo per four faces
+        db.execute(insert(Photo), [
+            {"user_id": 1, "file_name": f"{i}.jpg", "storage_path": f"/photos/{i}.jpg", "file_size": 1,
+             "is_processed": True, "is_deleted": False}
+            for i in range(start // 4, (stop + 3) // 4)
+        ])
+        db.execute(insert(FaceDetection), [
+            {"photo_id": i // 4 + 1, "bounding_box_x": 0, "bounding_box_y": 0, "bounding_box_width": 1,
+             "bounding_box_height": 1, "confidence_score": 1.0, "identified": False,
+             "embedding": encode_embedding(vectors[i], pipeline_version=PIPELINE_VERSION)}
+            for i in range(start, stop)
+        ])
+    db.commit()
+
+    # New photos of people in the library
+    picks = rng.integers(0, args.detections, args.queries)
+    queries = vectors[picks] + args.noise * rng.standard_normal(
+        (args.queries, args.dim)
+    ).astype(np.float32) / np.sqrt(args.dim)
+
+    def search(query):
+        return detection_index.search(db, 1, PIPELINE_VERSION, query, args.top_k)
+
+    print(f"{args.detections} detections, dim {args.dim}, top {args.top_k}, n_probe {SEARCH_N_PROBE}")
+    start = time.perf_counter()
+    search(queries[0])
+    print(f"first search (build and save): {time.perf_counter() - start:.2f}s, "
+          f"index {os.path.getsize(detection_index.path_for(1)) / 1024 / 1024:.0f} MB on disk")
+
+    detection_index.cache.invalidate(1)
+    start = time.perf_counter()
+    search(queries[0])
+    print(f"search after restart (load): {time.perf_counter() - start:.2f}s")
+
+    # Detection ids follow insertion order
+    exact = ExactIndex(np.arange(1, args.detections + 1), normalize_embeddings(vectors))
+    latencies, recalls = [], []
+    for query in queries:
+        begin = time.perf_counter()
+        _, found = search(query)
+        latencies.append((time.perf_counter() - begin) * 1000)
+        _, truth = exact.search(normalize_embeddings(query), top_k=args.top_k)
+        recalls.append(len(np.intersect1d(found, truth[0])) / args.top_k)
+    db.close()
+
+    print(f"search p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms, "
+          f"recall@{args.top_k} {np.mean(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    main()
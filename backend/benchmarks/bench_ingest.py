@@ -0,0 +1,118 @@
+"""
+Compare the single-decode ingest pipeline with the separate reads it replaces.
+
+``separate`` is the former path: the header is parsed, faces are detected
+from a grayscale read of the file and every rendition re-opens and decodes
+the file. ``pipeline`` is services.ingest_pipeline. Both run on the same
+photos with an empty rendition cache; the report shows mean milliseconds
+per stage, mean peak traced memory per photo and the end-to-end speedup.
+
+Pass --corpus DIR to measure on real photos. Without it a deterministic
+corpus of camera-sized synthetic photos is generated (see
+benchmarks.bench_detection_presets).
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest [--corpus DIR] [--photos 10] [--preset balanced] [--sizes 256,1024]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_detection_presets import IMAGE_EXTENSIONS, synthetic_corpus
+from services.detection_presets import PRESETS
+from services.face_recognition_service import FaceRecognitionService
+from services.ingest_pipeline import ingest
+from services.renditions import rendition_cache
+from services.upload_service import read_image_header
+
+
+def run_separate(service: FaceRecognitionService, path: str, preset: str, sizes):
+    timings = {}
+    tracemalloc.start()
+    try:
+        start = time.perf_counter()
+        read_image_header(path)
+        timings["header"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        service.detect_faces_sync(path, preset)
+        timings["detect"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for size in sizes:
+            rendition_cache.get(path, size, "jpeg")
+        timings["renditions"] = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return timings, peak
+
+
+def run_pipeline(service: FaceRecognitionService, path: str, preset: str, sizes):
+    result = ingest(service, path, preset, sizes, trace_memory=True)
+    return result.timings, result.peak_memory
+
+
+def measure(runner, service, paths, preset, sizes, cache_dir):
+    stages, peaks, totals = {}, [], []
+    for path in paths:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        start = time.perf_counter()
+        timings, peak = runner(service, path, preset, sizes)
+        totals.append(time.perf_counter() - start)
+        peaks.append(peak)
+        for stage, seconds in timings.items():
+            stages.setdefault(stage, []).append(seconds)
+    return {stage: np.mean(values) for stage, values in stages.items()}, np.mean(peaks), np.mean(totals)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of photos")
+    parser.add_argument("--photos", type=int, default=10, help="Synthetic photos to generate")
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--preset", choices=list(PRESETS), action="append",
+                        help="Detection preset (repeatable, default all)")
+    parser.add_argument("--sizes", default="256", help="Comma-separated rendition sizes")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    work_dir = tempfile.mkdtemp()
+    rendition_cache.cache_dir = os.path.join(work_dir, "renditions")
+    if args.corpus:
+        paths = sorted(
+            os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    else:
+        paths = synthetic_corpus(work_dir, args.photos, args.width, args.height, args.seed)
+
+    try:
+        service = FaceRecognitionService()
+        print(f"{len(paths)} photos, renditions {sizes}")
+        print(f"{'preset':>10} {'path':>9} {'header':>7} {'decode':>7} {'detect':>7} {'rendit.':>7} "
+              f"{'total':>7} {'peak MB':>8} {'speedup':>8}")
+        for preset in args.preset or list(PRESETS):
+            baseline = None
+            for name, runner in (("separate", run_separate), ("pipeline", run_pipeline)):
+                stages, peak, total = measure(runner, service, paths, preset, sizes, rendition_cache.cache_dir)
+                baseline = baseline or total
+                cells = " ".join(
+                    f"{stages[stage] * 1000:>7.0f}" if stage in stages else f"{'-':>7}"
+                    for stage in ("header", "decode", "detect", "renditions")
+                )
+                print(f"{preset:>10} {name:>9} {cells} {total * 1000:>7.0f} "
+                      f"{peak / (1024 * 1024):>8.1f} {baseline / total:>7.2f}x")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
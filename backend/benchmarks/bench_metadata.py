@@ -0,0 +1,93 @@
+"""
+Measure header-only metadata extraction throughput on one core.
+
+Compares services.photo_metadata.read_metadata with reading the same
+fields through PIL (Image.open, getexif and the Exif/GPS sub-IFDs). Each
+file is read ``--repeat`` times; the page cache is warm after the first
+pass, so the numbers are parsing cost, not disk speed.
+
+Pass --corpus DIR to measure on real photos. Without it JPEG files with a
+camera-like EXIF block (orientation, capture time, GPS, camera) and a
+64 KB embedded thumbnail segment are generated.
+
+Usage (from backend/):
+    python -m benchmarks.bench_metadata [--corpus DIR] [--photos 200] [--repeat 5]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_detection_presets import IMAGE_EXTENSIONS
+from services.photo_metadata import read_metadata
+
+
+def synthetic_corpus(directory: str, photos: int, seed: int):
+    rng = np.random.default_rng(seed)
+    paths = []
+    for i in range(photos):
+        image = Image.fromarray(rng.integers(0, 256, (480, 640, 3), dtype=np.uint8))
+        exif = Image.Exif()
+        exif[0x0112] = int(rng.integers(1, 9))
+        exif[0x010F] = "Canon"
+        exif[0x0110] = "Canon EOS R5"
+        exif.get_ifd(0x8769)[0x9003] = f"2024:06:{i % 28 + 1:02d} 12:00:00"
+        gps = exif.get_ifd(0x8825)
+        gps[1], gps[2], gps[3], gps[4] = "N", (32.0, 4.0, 30.0), "E", (34.0, 46.0, 0.0)
+        path = os.path.join(directory, f"exif_{i:04d}.jpg")
+        # A large APP segment ahead of the frame header, like a camera's maker notes
+        image.save(path, quality=80, exif=exif.tobytes(), icc_profile=b"\x00" * 65000)
+        paths.append(path)
+    return paths
+
+
+def read_with_pil(path: str):
+    with Image.open(path) as image:
+        exif = image.getexif()
+        return image.size, exif.get(0x0112), exif.get_ifd(0x8769), exif.get_ifd(0x8825)
+
+
+def files_per_second(reader, paths, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            reader(path)
+    return len(paths) * repeat / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of photos")
+    parser.add_argument("--photos", type=int, default=200, help="Synthetic photos to generate")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = None
+    if args.corpus:
+        paths = sorted(
+            os.path.join(args.corpus, name) for name in os.listdir(args.corpus)
+            if name.lower().endswith(IMAGE_EXTENSIONS)
+        )
+    else:
+        work_dir = tempfile.mkdtemp()
+        paths = synthetic_corpus(work_dir, args.photos, args.seed)
+
+    try:
+        # Warm the page cache
+        for path in paths:
+            read_metadata(path)
+        print(f"{len(paths)} photos x {args.repeat}")
+        for name, reader in (("read_metadata", read_metadata), ("PIL", read_with_pil)):
+            print(f"{name:>14} {files_per_second(reader, paths, args.repeat):>10.0f} files/s")
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Compare page latency of offset and keyset (cursor) pagination at increasing depth.
+
+Fills a throwaway SQLite database with ``--photos`` photos of one user
+(plus as many of other users) and times the GET /api/photos/ query for a
+page starting at each depth, once with OFFSET and once after a cursor
+(services.pagination). Offset pages get slower the deeper they start;
+cursor pages should not, given the index on the ordering columns
+(ix_photos_user_id_upload_date); --no-index drops it for comparison.
+
+Usage (from backend/):
+    python -m benchmarks.bench_pagination [--photos 50000] [--limit 100] [--repeat 20] [--no-index]
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=50000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--no-index", action="store_true", help="Drop the listing's index")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run(args):
+    from sqlalchemy import insert, select
+
+    from database.database import Base, SessionLocal, engine
+    from models import face, job, photo, user  # noqa: F401 (register the tables)
+    from models.photo import Photo
+    from models.user import User
+    from services.pagination import after_cursor, encode_cursor
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add_all([User(username=f"bench{i}", email=f"bench{i}@example.com", password_hash="-") for i in (1, 2)])
+    db.commit()
+
+    # Two users' uploads interleaved, several per second like a bulk upload
+    start = datetime(2024, 1, 1)
+    rows = [
+        {
+            "user_id": 1 + i % 2, "file_name": f"{i}.jpg", "storage_path": f"/photos/{i}.jpg",
+            "file_size": 1, "is_deleted": False, "upload_date": start + timedelta(seconds=i // 4)
+        }
+        for i in range(args.photos * 2)
+    ]
+    db.execute(insert(Photo), rows)
+    db.commit()
+    if args.no_index:
+        next(index for index in Photo.__table__.indexes if index.name == "ix_photos_user_id_upload_date").drop(bind=engine)
+
+    listing = select(Photo).where(Photo.user_id == 1, Photo.is_deleted == False)
+    order = (Photo.upload_date.desc(), Photo.photo_id.desc())
+
+    def timed(query) -> float:
+        times = []
+        for _ in range(args.repeat):
+            begin = time.perf_counter()
+            db.scalars(query).all()
+            times.append(time.perf_counter() - begin)
+            db.expunge_all()
+        return statistics.median(times) * 1000
+
+    print(f"{args.photos} photos, pages of {args.limit}, median of {args.repeat}")
+    print(f"{'depth':>8} {'offset ms':>10} {'cursor ms':>10}")
+    depths = [0, 1000, 10000, args.photos // 2, args.photos - args.limit]
+    for depth in sorted({d for d in depths if 0 <= d < args.photos}):
+        offset_query = listing.order_by(*order).offset(depth).limit(args.limit + 1)
+        if depth:
+            previous = db.scalars(listing.order_by(*order).offset(depth - 1).limit(1)).one()
+            cursor = encode_cursor(previous.upload_date, previous.photo_id)
+            cursor_query = listing.where(after_cursor(Photo, "upload_date", "photo_id", cursor))
+        else:
+            cursor_query = listing
+        cursor_query = cursor_query.order_by(*order).limit(args.limit + 1)
+        print(f"{depth:>8} {timed(offset_query):>10.2f} {timed(cursor_query):>10.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark the retro-match scan over a user's unidentified detections.
+
+Fills a throwaway SQLite database with ``--detections`` unidentified
+detections of synthetic people (see benchmarks.bench_clustering), names the
+most photographed person and runs services.retro_match for each chunk size.
+Reports detections scanned per second, the matches found (the share of
+that person's detections recovered) and the Python heap peak of the scan,
+which is bounded by the chunk size rather than the library size.
+
+Usage (from backend/):
+    python -m benchmarks.bench_retro_match [--detections 200000] [--chunk-sizes 1000 5000 20000]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+import numpy as np
+
+from benchmarks.bench_clustering import PIPELINE_VERSION, make_detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--detections", type=int, default=200000)
+    parser.add_argument("--identities", type=int, default=2000)
+    parser.add_argument("--chunk-sizes", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--threshold", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    try:
+        run(args)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run(args):
+    from sqlalchemy import insert, update
+
+    from database.database import Base, SessionLocal, engine
+    from models import face, job, photo, user  # noqa: F401 (register the tables)
+    from models.face import Face, FaceDetection
+    from models.photo import Photo
+    from models.user import User
+    from services.embedding_format import encode_embedding
+    from services.retro_match import retro_match
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    db.add(User(username="bench", email="bench@example.com", password_hash="-"))
+    db.commit()
+
+    rng = np.random.default_rng(args.seed)
+    labels, vectors = make_detections(args.detections, args.identities, args.dim, args.noise, rng)
+    for start in range(0, args.detections, 10000):
+        stop = min(start + 10000, args.detections)
+        # One photo per four faces
+        db.execute(insert(Photo), [
+            {"user_id": 1, "file_name": f"{i}.jpg", "storage_path": f"/photos/{i}.jpg", "file_size": 1,
+             "is_processed": True, "is_deleted": False}
+            for i in range(start // 4, (stop + 3) // 4)
+        ])
+        db.execute(insert(FaceDetection), [
+            {"photo_id": i // 4 + 1, "bounding_box_x": 0, "bounding_box_y": 0, "bounding_box_width": 1,
+             "bounding_box_height": 1, "confidence_score": 1.0, "identified": False,
+             "embedding": encode_embedding(vectors[i], pipeline_version=PIPELINE_VERSION)}
+            for i in range(start, stop)
+        ])
+    # Person 0 has the most photos (Zipf); name them from their first detection
+    first = int(np.flatnonzero(labels == 0)[0])
+    named = Face(
+        user_id=1,
+        person_name="Bench",
+        face_embedding=encode_embedding(vectors[first], pipeline_version=PIPELINE_VERSION)
+    )
+    db.add(named)
+    db.commit()
+    expected = int((labels == 0).sum())
+
+    print(f"{args.detections} detections, {expected} of the named person, threshold {args.threshold}")
+    print(f"{'chunk':>7} {'per s':>9} {'matched':>8} {'recall':>7} {'heap MB':>8}")
+
+    def scan(chunk_size: int):
+        db.execute(update(FaceDetection).values(face_id=None, identified=False))
+        db.commit()
+        return retro_match(db, 1, named.face_id, PIPELINE_VERSION, args.threshold, chunk_size)
+
+    for chunk_size in args.chunk_sizes:
+        result = scan(chunk_size)
+        # Tracing slows allocation down, so the heap is measured on a second run
+        tracemalloc.start()
+        scan(chunk_size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{chunk_size:>7} {result['detections_per_second']:>9.0f} {result['matched']:>8} "
+              f"{result['matched'] / expected:>7.3f} {peak / 1024 / 1024:>8.1f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Deterministic synthetic photo corpus with known faces.
+
+Every photo is a smooth random background with a number of drawn faces
+(head oval, brows, eye sockets, nose and mouth shading) that the Haar
+cascade of services.face_recognition_service detects, placed on a grid so
+they do not overlap. Faces are drawn from a pool of identities, each with
+its own proportions and skin tone, and their boxes are recorded, so
+detection recall can be measured without downloading a dataset. The same
+seed always writes the same files.
+
+Usage (from backend/):
+    python -m benchmarks.corpus DIR [--resolutions 640x480 1920x1080 4032x3024] [--faces 0 1 4]
+
+This writes the photos and a manifest.json with their sizes and face boxes.
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+RESOLUTIONS = ((640, 480), (1920, 1080), (4032, 3024))
+FACE_COUNTS = (0, 1, 4)
+
+
+class CorpusPhoto(NamedTuple):
+    path: str
+    width: int
+    height: int
+    # Face boxes ({"x", "y", "width", "height", "identity"}) in pixels
+    faces: List[Dict[str, int]]
+
+
+def parse_resolution(value: str) -> Tuple[int, int]:
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def draw_face(identity: int, size: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    A frontal face of one identity, ``size`` pixels square.
+
+    Returns:
+        Tuple of (BGR float32 pixels in [0, 1], float32 alpha mask of the head)
+    """
+    rng = np.random.default_rng([seed, identity])
+    face = np.zeros((size, size), dtype=np.float32)
+    center = size // 2
+    skin = rng.uniform(0.7, 0.85)
+    cv2.ellipse(face, (center, center), (int(size * 0.36), int(size * 0.46)), 0, 0, 360, skin, -1)
+
+    eye_y = int(size * rng.uniform(0.38, 0.42))
+    eye_dx = int(size * rng.uniform(0.15, 0.18))
+    for side in (-1, 1):
+        eye_x = center + side * eye_dx
+        cv2.ellipse(face, (eye_x, eye_y - int(size * 0.09)), (int(size * 0.1), int(size * 0.025)), 0, 0, 360, 0.3, -1)
+        cv2.ellipse(face, (eye_x, eye_y), (int(size * 0.08), int(size * 0.045)), 0, 0, 360, 0.35, -1)
+        cv2.circle(face, (eye_x, eye_y), int(size * 0.025), 0.1, -1)
+    cv2.ellipse(face, (center, int(size * 0.6)), (int(size * 0.06), int(size * 0.03)), 0, 0, 360, skin - 0.2, -1)
+    mouth_width = int(size * rng.uniform(0.11, 0.16))
+    cv2.ellipse(face, (center, int(size * 0.73)), (mouth_width, int(size * 0.035)), 0, 0, 360, 0.35, -1)
+
+    mask = np.zeros((size, size), dtype=np.float32)
+    cv2.ellipse(mask, (center, center), (int(size * 0.38), int(size * 0.48)), 0, 0, 360, 1.0, -1)
+    blur = max(size / 60, 0.5)
+    face = cv2.GaussianBlur(face, (0, 0), blur)
+    mask = cv2.GaussianBlur(mask, (0, 0), blur)
+    # Shading survives the grayscale conversion the cascade sees
+    tint = np.array([rng.uniform(0.6, 0.8), rng.uniform(0.75, 0.9), 1.0], dtype=np.float32)
+    return face[..., np.newaxis] * tint, mask
+
+
+def make_photo(
+    width: int,
+    height: int,
+    faces: int,
+    rng: np.random.Generator,
+    identities: int = 50,
+    seed: int = 0
+) -> Tuple[np.ndarray, List[Dict[str, int]]]:
+    """
+    One photo with ``faces`` faces on a smooth random background.
+
+    Returns:
+        Tuple of (BGR uint8 pixels, face boxes)
+    """
+    small = rng.integers(40, 216, (max(height // 32, 2), max(width // 32, 2), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC).astype(np.float32) / 255
+
+    boxes = []
+    if faces:
+        columns = int(np.ceil(np.sqrt(faces * width / height)))
+        rows = int(np.ceil(faces / columns))
+        cell_width, cell_height = width // columns, height // rows
+        for cell in rng.permutation(columns * rows)[:faces]:
+            row, column = divmod(int(cell), columns)
+            size = int(min(cell_width, cell_height) * rng.uniform(0.5, 0.85))
+            x = column * cell_width + int(rng.integers(0, cell_width - size + 1))
+            y = row * cell_height + int(rng.integers(0, cell_height - size + 1))
+            identity = int(rng.integers(identities))
+            face, mask = draw_face(identity, size, seed)
+            region = image[y:y + size, x:x + size]
+            region += mask[..., np.newaxis] * (face - region)
+            boxes.append({"x": x, "y": y, "width": size, "height": size, "identity": identity})
+
+    # Sensor noise, so the files compress like photos
+    image += rng.normal(0, 0.01, image.shape).astype(np.float32)
+    return (np.clip(image, 0, 1) * 255).astype(np.uint8), boxes
+
+
+def generate_corpus(
+    directory: str,
+    resolutions: Sequence[Tuple[int, int]] = RESOLUTIONS,
+    face_counts: Sequence[int] = FACE_COUNTS,
+    seed: int = 0,
+    quality: int = 90
+) -> List[CorpusPhoto]:
+    """
+    Write one JPEG photo per resolution and face count.
+
+    Args:
+        directory: Destination directory
+        resolutions: (width, height) pairs
+        face_counts: Faces per photo
+        seed: Seed of the backgrounds, placements and identities
+        quality: JPEG quality
+
+    Returns:
+        The photos, in resolution then face count order
+    """
+    os.makedirs(directory, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    photos = []
+    for width, height in resolutions:
+        for faces in face_counts:
+            image, boxes = make_photo(width, height, faces, rng, seed=seed)
+            path = os.path.join(directory, f"synthetic_{width}x{height}_{faces}faces.jpg")
+            cv2.imwrite(path, image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            photos.append(CorpusPhoto(path, width, height, boxes))
+    return photos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory")
+    parser.add_argument("--resolutions", type=parse_resolution, nargs="+", default=list(RESOLUTIONS))
+    parser.add_argument("--faces", type=int, nargs="+", default=list(FACE_COUNTS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    photos = generate_corpus(args.directory, args.resolutions, args.faces, args.seed)
+    with open(os.path.join(args.directory, "manifest.json"), "w") as manifest:
+        json.dump([photo._asdict() for photo in photos], manifest, indent=2)
+    print(f"Wrote {len(photos)} photos with {sum(len(photo.faces) for photo in photos)} faces to {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Load test: GET /api/photos latency while face detection runs.
+
+Uploads a batch of large photos, starts processing all of them at once and
+keeps polling GET /api/photos/ until processing finishes. Reports latency
+percentiles of the polling requests, once with nothing else running and once
+during processing.
+
+With the detection pool the percentiles should stay close to the idle ones;
+--blocking runs detection on the event loop instead (the old behaviour) for
+comparison.
+
+The app is served in-process against a throwaway SQLite database.
+
+Usage (from backend/):
+    python -m benchmarks.load_photos_latency [--photos 8] [--size 3000] [--blocking]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+
+def make_photo(rng: np.random.Generator, size: int) -> bytes:
+    """Smooth random texture, expensive to scan at every cascade scale."""
+    pixels = rng.integers(0, 256, (size // 8, size // 8, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize((size, size), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def percentiles(latencies):
+    values = np.array(latencies) * 1000
+    return {p: float(np.percentile(values, p)) for p in (50, 95, 99)} | {"max": float(values.max())}
+
+
+async def poll(client, headers, stop: asyncio.Event, latencies, interval: float):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/api/photos/", headers=headers)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def run(args):
+    import httpx
+    from main import app
+    from services.detection_executor import detection_executor
+    from services.face_recognition_service import FaceRecognitionService
+
+    if args.blocking:
+        # Old behaviour: detection runs synchronously inside the coroutine
+        service = FaceRecognitionService()
+
+        async def detect_on_loop(image_path, preset=None):
+            return service.detect_faces_sync(image_path, preset)
+
+        detection_executor.detect = detect_on_loop
+
+    rng = np.random.default_rng(args.seed)
+    transport = httpx.ASGITransport(app=app)
+    stored_paths = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/api/auth/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench",
+            "first_name": "Bench", "last_name": "User"
+        })
+        token = (await client.post(
+            "/api/auth/token", data={"username": "bench@example.com", "password": "bench"}
+        )).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        photo_ids = []
+        for i in range(args.photos):
+            response = await client.post(
+                "/api/photos/upload",
+                files={"file": (f"bench_{i}.jpg", make_photo(rng, args.size), "image/jpeg")},
+                headers=headers
+            )
+            response.raise_for_status()
+            photo_ids.append(response.json()["photo_id"])
+            stored_paths.append(response.json()["storage_path"])
+
+        # Idle baseline
+        idle, stop = [], asyncio.Event()
+        poller = asyncio.create_task(poll(client, headers, stop, idle, args.interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        await poller
+
+        # Same polling while every photo is being processed
+        busy, stop = [], asyncio.Event()
+        poller = asyncio.create_task(poll(client, headers, stop, busy, args.interval))
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            client.post(f"/api/faces/process/{photo_id}", headers=headers) for photo_id in photo_ids
+        ])
+        processing_time = time.perf_counter() - start
+        stop.set()
+        await poller
+
+    detection_executor.shutdown()
+    for path in stored_paths:
+        if os.path.exists(path):
+            os.remove(path)
+    return idle, busy, processing_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, default=8)
+    parser.add_argument("--size", type=int, default=3000, help="Photo width and height in pixels")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between polling requests")
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    parser.add_argument("--blocking", action="store_true", help="Run detection on the event loop")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # One log line per polling request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    try:
+        idle, busy, processing_time = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(work_dir)
+
+    mode = "blocking (event loop)" if args.blocking else "detection pool"
+    print(f"{args.photos} photos of {args.size}x{args.size} processed in {processing_time:.1f}s, {mode}")
+    print(f"{'GET /api/photos/':>18} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, latencies in (("idle", idle), ("during processing", busy)):
+        stats = percentiles(latencies)
+        print(f"{label:>18} {len(latencies):>9} {stats[50]:>8.1f} {stats[95]:>8.1f} "
+              f"{stats[99]:>8.1f} {stats['max']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
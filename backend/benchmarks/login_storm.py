@@ -0,0 +1,124 @@
+"""
+Load test: login throughput and GET /api/photos latency during a login storm.
+
+Registers a user, then sends ``--logins`` concurrent POST /api/auth/token
+requests (guests of an event signing in at once) while another client keeps
+polling GET /api/photos/. Reports the logins per second and the latency
+percentiles of the polling requests, once with nothing else running and
+once during the storm, plus the longest event loop stall and the password
+hasher's queue statistics. A stalled loop also delays the poller itself, so
+compare the request counts along with the percentiles.
+
+With the hasher pool the polling percentiles should stay close to the idle
+ones; --blocking runs bcrypt on the event loop instead (the old behaviour)
+for comparison.
+
+The app is served in-process against a throwaway SQLite database.
+
+Usage (from backend/):
+    python -m benchmarks.login_storm [--logins 32] [--workers 2] [--blocking]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.load_photos_latency import percentiles, poll
+
+
+async def watch_loop(stop: asyncio.Event, stalls, interval: float = 0.005):
+    """Record how late each short sleep wakes up."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - start - interval)
+
+
+async def run(args):
+    import httpx
+    from main import app
+    from services.password_hasher import password_hasher
+
+    password_hasher.workers = args.workers
+    if args.blocking:
+        # Old behaviour: bcrypt runs synchronously inside the coroutine
+        async def run_on_loop(fn, *fn_args):
+            return fn(*fn_args)
+
+        password_hasher._run = run_on_loop
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/api/auth/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench",
+            "first_name": "Bench", "last_name": "User"
+        })
+        credentials = {"username": "bench@example.com", "password": "bench"}
+        token = (await client.post("/api/auth/token", data=credentials)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # Idle baseline
+        idle, stop = [], asyncio.Event()
+        poller = asyncio.create_task(poll(client, headers, stop, idle, args.interval))
+        await asyncio.sleep(args.idle_seconds)
+        stop.set()
+        await poller
+
+        # Same polling while every guest logs in
+        busy, stalls, stop = [], [], asyncio.Event()
+        poller = asyncio.create_task(poll(client, headers, stop, busy, args.interval))
+        watcher = asyncio.create_task(watch_loop(stop, stalls))
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post("/api/auth/token", data=credentials) for _ in range(args.logins)
+        ])
+        storm_time = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(poller, watcher)
+        for response in responses:
+            response.raise_for_status()
+
+    stats = password_hasher.stats()
+    password_hasher.shutdown()
+    return idle, busy, storm_time, max(stalls), stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=2, help="Password hasher workers")
+    parser.add_argument("--interval", type=float, default=0.01, help="Seconds between polling requests")
+    parser.add_argument("--idle-seconds", type=float, default=2.0)
+    parser.add_argument("--blocking", action="store_true", help="Run bcrypt on the event loop")
+    args = parser.parse_args()
+
+    # One log line per polling request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    work_dir = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    try:
+        idle, busy, storm_time, stall, stats = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(work_dir)
+
+    mode = "blocking (event loop)" if args.blocking else f"hasher pool, {args.workers} workers"
+    print(f"{args.logins} logins in {storm_time:.1f}s ({args.logins / storm_time:.1f}/s), {mode}")
+    print(f"{'GET /api/photos/':>18} {'requests':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for label, latencies in (("idle", idle), ("during logins", busy)):
+        percentile_ms = percentiles(latencies)
+        print(f"{label:>18} {len(latencies):>9} {percentile_ms[50]:>8.1f} {percentile_ms[95]:>8.1f} "
+              f"{percentile_ms[99]:>8.1f} {percentile_ms['max']:>8.1f}")
+    print(f"longest event loop stall: {stall * 1000:.0f}ms")
+    if not args.blocking:
+        print(
+            f"hasher queue: peak {stats['peak_waiting']} waiting, "
+            f"mean {stats['mean_queue_ms']:.0f}ms, max {stats['max_queue_ms']:.0f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,393 @@
+"""
+Benchmark suite of the recognition pipeline, with machine-readable results.
+
+Micro benchmarks run on a deterministic synthetic corpus (benchmarks.corpus),
+grouped as:
+
+    decode     cv2.imread of a photo per resolution, grayscale (detection) and
+               color (renditions)
+    detect     cascade detection and description with each preset on decoded
+               photos, with recall of the drawn faces
+    crop       face crops (services.renditions.render_face) and renditions
+               (render_array) per resolution
+    serialize  embedding encode and decode, one blob and a batch
+    match      match_embeddings and Gallery.search (ExactIndex or IVF) at
+               several gallery sizes, with recall@1 of Gallery.search
+
+and one end-to-end benchmark:
+
+    e2e        upload -> process -> list through the FastAPI app in-process,
+               against a throwaway database and storage
+
+Every result holds milliseconds per operation (median, p95 and mean) plus
+recall where it applies. --output writes them as JSON with the environment
+they were measured in; --baseline compares a run with such a file and exits
+with status 1 when a median is more than --tolerance slower or a recall
+dropped. Compare runs from the same machine only.
+
+The focused benchmarks (bench_detection_presets, bench_ingest, bench_ann,
+...) remain for looking into one stage in depth.
+
+Usage (from backend/):
+    python -m benchmarks.suite [--groups decode detect crop serialize match e2e] [--output results.json]
+    python -m benchmarks.suite --output new.json --baseline results.json [--tolerance 0.15]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from benchmarks.corpus import FACE_COUNTS, RESOLUTIONS, CorpusPhoto, generate_corpus, parse_resolution
+
+GROUPS = ("decode", "detect", "crop", "serialize", "match", "e2e")
+# Recall may drop this much before a comparison fails
+RECALL_TOLERANCE = 0.01
+EMBEDDING_DIM = 531
+
+
+def measure(fn: Callable[[], object], repeat: int, ops: int = 1, warmup: int = 1) -> Dict[str, float]:
+    """Milliseconds per operation of ``fn``, which performs ``ops`` operations per call."""
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - start) * 1000 / ops)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "mean_ms": float(np.mean(latencies)),
+        "runs": repeat
+    }
+
+
+def resolution(photo: CorpusPhoto) -> str:
+    return f"{photo.width}x{photo.height}"
+
+
+def by_resolution(photos: List[CorpusPhoto]) -> Dict[str, List[CorpusPhoto]]:
+    groups = defaultdict(list)
+    for photo in photos:
+        groups[resolution(photo)].append(photo)
+    return groups
+
+
+def bench_decode(photos: List[CorpusPhoto], args) -> Dict[str, dict]:
+    results = {}
+    for name, group in by_resolution(photos).items():
+        path = group[-1].path
+        results[f"decode/gray/{name}"] = measure(lambda: cv2.imread(path, cv2.IMREAD_GRAYSCALE), args.repeat)
+        results[f"decode/color/{name}"] = measure(lambda: cv2.imread(path, cv2.IMREAD_COLOR), args.repeat)
+    return results
+
+
+def bench_detect(photos: List[CorpusPhoto], args) -> Dict[str, dict]:
+    from benchmarks.bench_detection_presets import iou
+    from services.face_recognition_service import FaceRecognitionService
+
+    service = FaceRecognitionService()
+    results = {}
+    for name, group in by_resolution(photos).items():
+        images = [cv2.imread(photo.path, cv2.IMREAD_GRAYSCALE) for photo in group]
+        for preset in args.presets:
+            found = []
+
+            def detect_all():
+                found[:] = [service.detect_faces_in_image(image, preset) for image in images]
+
+            result = measure(detect_all, args.repeat, ops=len(images))
+            truth = [box for photo in group for box in photo.faces]
+            boxes = [[face["location"] for face in faces] for faces in found]
+            matched = sum(
+                any(iou(box, candidate) >= 0.5 for candidate in candidates)
+                for candidates, photo in zip(boxes, group)
+                for box in photo.faces
+            )
+            result["recall"] = matched / len(truth) if truth else 1.0
+            result["false_positives"] = sum(len(candidates) for candidates in boxes) - matched
+            results[f"detect/{preset}/{name}"] = result
+    return results
+
+
+def bench_crop(photos: List[CorpusPhoto], args, work_dir: str) -> Dict[str, dict]:
+    from services.renditions import FACE_CROP_SIZES, render_array, render_face
+
+    output_path = os.path.join(work_dir, "rendition.jpg")
+    results = {}
+    for name, group in by_resolution(photos).items():
+        photo = max(group, key=lambda photo: len(photo.faces))
+        if photo.faces:
+            face = photo.faces[0]
+            box = (face["x"], face["y"], face["width"], face["height"])
+            for size in FACE_CROP_SIZES:
+                results[f"crop/face_{size}/{name}"] = measure(
+                    lambda: render_face(photo.path, output_path, box, size, "jpeg"), args.repeat
+                )
+        image = cv2.imread(photo.path, cv2.IMREAD_COLOR)
+        for size in args.rendition_sizes:
+            results[f"crop/rendition_{size}/{name}"] = measure(
+                lambda: render_array(image, output_path, size, "jpeg"), args.repeat
+            )
+    return results
+
+
+def bench_serialize(args) -> Dict[str, dict]:
+    from services.embedding_format import decode_embedding, decode_embeddings, encode_embedding
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((1000, EMBEDDING_DIM)).astype(np.float32)
+    blob = encode_embedding(vectors[0])
+    blobs = [encode_embedding(vector) for vector in vectors]
+    repeat = args.repeat * 100
+    return {
+        "serialize/encode": measure(lambda: encode_embedding(vectors[0]), repeat),
+        "serialize/decode": measure(lambda: decode_embedding(blob), repeat),
+        "serialize/decode_batch_1000": measure(lambda: decode_embeddings(blobs), args.repeat),
+    }
+
+
+def bench_match(args) -> Dict[str, dict]:
+    from benchmarks.bench_ann import make_gallery, make_queries
+    from services.face_matching import match_embeddings
+    from services.gallery_cache import Gallery
+
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    for size in args.gallery_sizes:
+        embeddings = make_gallery(size, EMBEDDING_DIM, rng)
+        # The faces of one photo are matched together
+        queries = make_queries(embeddings, args.faces_per_query * args.repeat, rng)
+        batches = np.split(queries, args.repeat)
+        gallery = Gallery(np.arange(size), embeddings)
+
+        batch = iter(batches * 2)
+        results[f"match/exact/{size}"] = measure(
+            lambda: match_embeddings(next(batch), embeddings, normalized=True), args.repeat, ops=args.faces_per_query
+        )
+        batch = iter(batches * 2)
+        result = measure(lambda: gallery.search(next(batch)), args.repeat, ops=args.faces_per_query)
+        _, truth = match_embeddings(queries, embeddings, normalized=True)
+        _, found = gallery.search(queries)
+        result["recall"] = float(np.mean(found[:, 0] == truth[:, 0]))
+        results[f"match/gallery/{size}"] = result
+    return results
+
+
+def bench_e2e(photos: List[CorpusPhoto], args) -> Dict[str, dict]:
+    from fastapi.testclient import TestClient
+
+    from benchmarks.bench_detection_presets import iou
+    from main import app
+
+    results = {}
+    with TestClient(app) as client:
+        client.post("/api/auth/register", json={
+            "username": "bench", "email": "bench@example.com", "password": "bench",
+            "first_name": "Bench", "last_name": "User"
+        }).raise_for_status()
+        token = client.post(
+            "/api/auth/token", data={"username": "bench@example.com", "password": "bench"}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # Upload
+        photo_ids, latencies = [], []
+        for photo in photos:
+            with open(photo.path, "rb") as f:
+                content = f.read()
+            start = time.perf_counter()
+            response = client.post(
+                "/api/photos/upload",
+                files={"file": (os.path.basename(photo.path), content, "image/jpeg")},
+                headers=headers
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+            photo_ids.append(response.json()["photo_id"])
+        results["e2e/upload"] = {
+            "p50_ms": float(np.percentile(latencies, 50)),
+            "p95_ms": float(np.percentile(latencies, 95)),
+            "mean_ms": float(np.mean(latencies)),
+            "runs": len(latencies)
+        }
+
+        # Process every photo through the job queue
+        start = time.perf_counter()
+        job_ids = []
+        for photo_id in photo_ids:
+            response = client.post(f"/api/faces/process/{photo_id}", headers=headers)
+            response.raise_for_status()
+            job_ids.append(response.json()["job_id"])
+        pending = set(job_ids)
+        while pending:
+            for job_id in list(pending):
+                job = client.get(f"/api/faces/jobs/{job_id}", headers=headers).json()
+                if job["status"] == "failed":
+                    raise RuntimeError(f"Processing job {job_id} failed: {job['last_error']}")
+                if job["status"] == "succeeded":
+                    pending.discard(job_id)
+            time.sleep(0.01)
+        elapsed = time.perf_counter() - start
+
+        matched = 0
+        for photo, photo_id in zip(photos, photo_ids):
+            found = [
+                {"x": face["bounding_box_x"], "y": face["bounding_box_y"],
+                 "width": face["bounding_box_width"], "height": face["bounding_box_height"]}
+                for face in client.get(f"/api/faces/photo/{photo_id}", headers=headers).json()
+            ]
+            matched += sum(any(iou(box, candidate) >= 0.5 for candidate in found) for box in photo.faces)
+        total_faces = sum(len(photo.faces) for photo in photos)
+        results["e2e/process"] = {
+            "mean_ms": elapsed * 1000 / len(photos),
+            "photos_per_s": len(photos) / elapsed,
+            "recall": matched / total_faces if total_faces else 1.0,
+            "runs": len(photos)
+        }
+
+        # List
+        results["e2e/list"] = measure(
+            lambda: client.get("/api/photos/", headers=headers).raise_for_status(), args.repeat * 5
+        )
+    return results
+
+
+def environment() -> Dict[str, object]:
+    import PIL
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+        "pillow": PIL.__version__,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> int:
+    """Print each result against the baseline; returns the number of regressions."""
+    regressions = 0
+    print(f"\n{'benchmark':<34} {'baseline ms':>12} {'ms':>10} {'change':>8}  status")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<34} {'-':>12} {result.get('p50_ms', result['mean_ms']):>10.4f} {'-':>8}  new")
+            continue
+        metric = "p50_ms" if "p50_ms" in result else "mean_ms"
+        change = result[metric] / previous[metric] - 1 if previous.get(metric) else 0.0
+        status = "ok"
+        if change > tolerance:
+            status = "slower"
+        elif change < -tolerance:
+            status = "faster"
+        if "recall" in previous and result.get("recall", 0.0) < previous["recall"] - RECALL_TOLERANCE:
+            status = f"recall {previous['recall']:.3f} -> {result.get('recall', 0.0):.3f}"
+        if status == "slower" or status.startswith("recall"):
+            regressions += 1
+        print(f"{name:<34} {previous[metric]:>12.4f} {result[metric]:>10.4f} {change:>+8.1%}  {status}")
+    for name in baseline.keys() - results.keys():
+        print(f"{name:<34} {'':>12} {'':>10} {'':>8}  not run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--groups", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--resolutions", type=parse_resolution, nargs="+", default=list(RESOLUTIONS))
+    parser.add_argument("--faces", type=int, nargs="+", default=list(FACE_COUNTS), help="Faces per corpus photo")
+    parser.add_argument("--presets", nargs="+", default=["fast", "balanced"])
+    parser.add_argument("--rendition-sizes", type=int, nargs="+", default=[256, 1024])
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--faces-per-query", type=int, default=4, help="Faces matched together, as in one photo")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Slowdown of a median that fails the comparison")
+    args = parser.parse_args()
+
+    # Before the services configure INFO logging: a line per detection and request would drown the report
+    logging.basicConfig(level=logging.WARNING)
+    work_dir = tempfile.mkdtemp()
+    # Before the services are imported: they read their locations at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    for setting, directory in (
+        ("UPLOAD_DIR", "uploads"),
+        ("RENDITION_CACHE_DIR", "renditions"),
+        ("DETECTION_CACHE_DIR", "detections"),
+        ("DETECTION_INDEX_DIR", "detection_index"),
+    ):
+        os.environ[setting] = os.path.join(work_dir, directory)
+
+    results = {}
+    try:
+        photos = generate_corpus(os.path.join(work_dir, "corpus"), args.resolutions, args.faces, args.seed)
+        for group in args.groups:
+            start = time.perf_counter()
+            if group == "decode":
+                group_results = bench_decode(photos, args)
+            elif group == "detect":
+                group_results = bench_detect(photos, args)
+            elif group == "crop":
+                group_results = bench_crop(photos, args, work_dir)
+            elif group == "serialize":
+                group_results = bench_serialize(args)
+            elif group == "match":
+                group_results = bench_match(args)
+            else:
+                group_results = bench_e2e(photos, args)
+            for name, result in group_results.items():
+                extra = f"  recall {result['recall']:.3f}" if "recall" in result else ""
+                print(f"{name:<34} {result.get('p50_ms', result['mean_ms']):>10.4f} ms{extra}")
+            print(f"({group}: {time.perf_counter() - start:.1f}s)")
+            results.update(group_results)
+    finally:
+        shutil.rmtree(work_dir)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["environment"].get("platform") != report["environment"]["platform"]:
+            print("Baseline was measured on another platform; timings are not comparable")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"{regressions} regressions (tolerance {args.tolerance:.0%} on medians, {RECALL_TOLERANCE} on recall)")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
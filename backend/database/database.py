@@ -1,8 +1,61 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+"""
+Database engines and session factories.
+
+``engine``/``SessionLocal``/``get_db`` are the synchronous SQLAlchemy API
+used by most of the code. ``async_engine``/``AsyncSessionLocal``/
+``get_async_db`` use the same database through SQLAlchemy's asyncio
+extension (aiosqlite for SQLite, asyncpg for PostgreSQL), so a route can
+await its queries instead of blocking the event loop. The async engine is
+only created when the driver is installed. Routes on the synchronous
+session never query on the event loop: they are plain ``def`` handlers,
+which FastAPI runs in its threadpool, or, when they await other work, run
+their queries through ``run_in_threadpool``.
+
+Background processing (the job queue and its handlers) does its database
+work on ``background_writer``, a single dedicated thread. Its writes are
+serialized among themselves, so concurrent jobs never queue for SQLite's
+write lock against each other, and the event loop never waits in the busy
+handler while uploads or an aiosqlite writer hold the lock.
+
+SQLite connections run in WAL mode (readers do not block the writer and
+vice versa) with ``synchronous=NORMAL`` and a busy timeout. The driver
+opens a transaction just before the first INSERT/UPDATE/DELETE (reads
+before it run on their own snapshot); on the synchronous engine that
+transaction is ``BEGIN IMMEDIATE``, so it takes SQLite's write lock
+before writing. Writers of any thread or process then queue in SQLite's
+busy handler, which does not hold the GIL, instead of failing with
+"database is locked", and a transaction never needs to upgrade a stale
+read snapshot to a write. Write and commit without awaiting in between,
+so the lock is never held by a coroutine another one waits for on the
+same event loop.
+
+Settings:
+    DATABASE_URL             synchronous database URL (default SQLite file)
+    DATABASE_ASYNC_URL       async URL (default: DATABASE_URL with the async driver)
+    DB_POOL_SIZE             persistent connections per engine (default 5)
+    DB_MAX_OVERFLOW          extra connections under load (default 10)
+    DB_POOL_TIMEOUT          seconds to wait for a free connection (default 30)
+    DB_POOL_RECYCLE          seconds after which connections are replaced (default 1800, -1 never)
+    DB_POOL_PRE_PING         test connections before use (default true)
+    SQLITE_WAL               enable WAL mode (default true)
+    SQLITE_SYNCHRONOUS       PRAGMA synchronous value (default NORMAL)
+    SQLITE_BUSY_TIMEOUT_MS   wait for a locked database (default 5000)
+"""
+import asyncio
+import functools
+import logging
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
 from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -10,17 +63,58 @@ load_dotenv()
 # Use environment variables to configure database connection
 # Default to SQLite for development
 DATABASE_URL = os.getenv(
-    "DATABASE_URL", 
+    "DATABASE_URL",
     "sqlite:///./facial_recognition.db"
 )
 
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _engine_options(url: str) -> dict:
+    """Pool settings from the environment (in-memory SQLite keeps its single-connection pool)."""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() == "true",
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        if SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    finally:
+        cursor.close()
+
+
 # Create SQLAlchemy engine
 engine = create_engine(
-    DATABASE_URL, 
-    # Required for SQLite to support transaction with rollback
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+    DATABASE_URL,
+    # Sessions are used from other threads than the one that connected;
+    # write transactions take the write lock when they begin
+    connect_args={"check_same_thread": False, "isolation_level": "IMMEDIATE"} if _is_sqlite(DATABASE_URL) else {},
+    **_engine_options(DATABASE_URL)
 )
 
+if _is_sqlite(DATABASE_URL):
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -33,4 +127,68 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+class BackgroundWriter:
+    """One thread running the background jobs' database work in submission order."""
+
+    def __init__(self):
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+            return self._pool
+
+    async def run(self, func, *args, **kwargs):
+        """Await ``func(*args, **kwargs)`` run on the writer thread."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_pool(), functools.partial(func, *args, **kwargs))
+
+    def shutdown(self) -> None:
+        # Let a commit in progress finish
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+background_writer = BackgroundWriter()
+
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    return parsed.set(drivername=driver).render_as_string(hide_password=False) if driver else url
+
+
+ASYNC_DATABASE_URL = os.getenv("DATABASE_ASYNC_URL") or _async_url(DATABASE_URL)
+
+try:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    async_options = _engine_options(ASYNC_DATABASE_URL)
+    if async_options:
+        # aiosqlite would otherwise open a connection per session
+        async_options["poolclass"] = AsyncAdaptedQueuePool
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, **async_options)
+    if _is_sqlite(ASYNC_DATABASE_URL):
+        event.listen(async_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    # Loaded objects stay readable after commit without another round trip
+    AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
+except ImportError as e:
+    logger.info(f"Async database engine unavailable ({e}); install aiosqlite or asyncpg")
+    async_engine = None
+    AsyncSessionLocal = None
+
+
+# Dependency to get an async DB session
+async def get_async_db():
+    if AsyncSessionLocal is None:
+        raise RuntimeError(f"No async driver installed for {ASYNC_DATABASE_URL}")
+    async with AsyncSessionLocal() as db:
+        yield db
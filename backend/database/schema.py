@@ -0,0 +1,71 @@
+"""
+Schema setup at startup.
+
+The schema is owned by the Alembic migrations (backend/migrations). On
+startup:
+
+* an empty database gets the tables of the current models and is stamped
+  with the latest migration, so later migrations apply to it;
+* a database created before migrations existed (tables but no
+  alembic_version) has the schema of the baseline migration 0001; it is
+  stamped 0001 and startup stops until ``alembic upgrade head`` has added
+  the newer tables and columns (create_all would add the tables but not
+  the columns);
+* a migrated database behind the latest migration is reported.
+
+Usage (from backend/):
+    alembic upgrade head
+"""
+import logging
+import os
+
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from database.database import Base
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations")
+# Migration describing the schema of databases created before migrations existed
+BASELINE_REVISION = "0001"
+
+
+class SchemaOutOfDate(RuntimeError):
+    pass
+
+
+def prepare_schema(engine: Engine) -> None:
+    """
+    Create a new database or check that an existing one is migrated.
+
+    Raises:
+        SchemaOutOfDate: The database predates migrations and was stamped
+            with the baseline; run ``alembic upgrade head``
+    """
+    script = ScriptDirectory(MIGRATIONS_DIR)
+    head = script.get_current_head()
+    with engine.begin() as connection:
+        context = MigrationContext.configure(connection)
+        current = context.get_current_revision()
+        if current is None:
+            if not inspect(connection).has_table("users"):
+                Base.metadata.create_all(bind=connection)
+                context.stamp(script, head)
+                logger.info(f"Created the database schema at migration {head}")
+                return
+
+            context.stamp(script, BASELINE_REVISION)
+            current = BASELINE_REVISION
+            logger.info(f"Stamped a database created before migrations with {BASELINE_REVISION}")
+
+    if current == BASELINE_REVISION and head != BASELINE_REVISION:
+        # Queries of the current models would fail on the missing columns
+        raise SchemaOutOfDate(
+            f"The database schema is at migration {BASELINE_REVISION}. "
+            "Run 'alembic upgrade head' from backend/ before starting the API."
+        )
+    if current != head:
+        logger.warning(f"Database schema is at migration {current}, latest is {head}; run 'alembic upgrade head'")
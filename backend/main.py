@@ -7,14 +7,23 @@ import os
 from dotenv import load_dotenv
 
 from api.routes import auth, users, photos, faces, events
-from database.database import engine, Base
+from database.database import async_engine, background_writer, engine
+from database.schema import prepare_schema
 from services.auth_service import get_current_user
+from services.detection_executor import detection_executor
+from services.embedding_reencoder import check_embeddings
+from services.face_descriptors import get_descriptor
+from services.job_queue import job_queue
+from services.password_hasher import password_hasher
+from services.principal_cache import principal_cache
 
 # Load environment variables
 load_dotenv()
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+# Create a new database, or check that an existing one is migrated (see database.schema)
+prepare_schema(engine)
+# Refuse to start with a descriptor the stored faces were not made by (see services.face_descriptors)
+check_embeddings(engine, get_descriptor())
 
 app = FastAPI(
     title="Facial Recognition API",
@@ -34,6 +43,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Continuation token of paginated listings
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Mount static files directory for serving photos
@@ -47,6 +58,24 @@ app.include_router(photos.router, prefix="/api")
 app.include_router(faces.router, prefix="/api")
 app.include_router(events.router, prefix="/api")
 
+@app.on_event("startup")
+async def start_background_jobs():
+    # Workers for queued photo processing jobs
+    job_queue.start()
+    
+    # Batched last_login writes of authenticated requests
+    principal_cache.start()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    await job_queue.stop()
+    background_writer.shutdown()
+    detection_executor.shutdown()
+    password_hasher.shutdown()
+    await principal_cache.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Facial Recognition API"}
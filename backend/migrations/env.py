@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -5,12 +6,13 @@ from sqlalchemy import pool
 
 from alembic import context
 from database.database import Base
-from models import user, photo, face
+from models import user, photo, face, job
 
 # Load models to ensure they are registered with SQLAlchemy
 from models.user import User, UserSubscription, SubscriptionPackage
-from models.photo import Photo, Event, Tag, PhotoTag
-from models.face import Face, FaceDetection, SharingPermission, PublicSharingLink
+from models.photo import Photo, Event, Tag, PhotoTag, StoredFile
+from models.face import Face, FaceDetection, FaceCluster, SharingPermission, PublicSharingLink
+from models.job import ProcessingJob
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -21,6 +23,10 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Use the same database as the application when it is configured
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 target_metadata = Base.metadata
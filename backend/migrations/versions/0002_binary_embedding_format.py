@@ -0,0 +1,116 @@
+"""binary embedding format
+
+Converts pickled face embeddings to the versioned binary format described
+in services.embedding_format. Runs in batches; rows that are already
+converted (e.g. by the re-encoder) are skipped.
+
+The format as of this revision is copied below rather than imported, so
+later changes to the application code do not change what this migration
+does.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 17:20:00.000000
+
+"""
+import io
+import os
+import pickle
+import struct
+
+from alembic import op
+import numpy as np
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+# (table, primary key, blob column) holding embeddings
+EMBEDDING_COLUMNS = [
+    ("faces", "face_id", "face_embedding"),
+    ("face_detections", "detection_id", "embedding"),
+]
+
+# Binary format 1: magic, format version, dtype code, pipeline version, dimension, norm
+MAGIC = b"FEMB"
+HEADER = struct.Struct("<4sBBHIf")
+DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<f2")}
+DTYPE_CODE = 2 if os.getenv("EMBEDDING_DTYPE", "float16") == "float16" else 1
+# Pickled embeddings were raw pixel vectors, pipeline version 1
+PIPELINE_VERSION = 1
+
+
+class _NumpyUnpickler(pickle.Unpickler):
+    """Unpickler that only reconstructs plain numpy arrays."""
+
+    _ALLOWED = {
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "_reconstruct"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self._ALLOWED:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from embedding blob")
+        return super().find_class(module, name)
+
+
+def _is_legacy(data: bytes) -> bool:
+    return bytes(data[:4]) != MAGIC
+
+
+def _encode(data: bytes) -> bytes:
+    embedding = _NumpyUnpickler(io.BytesIO(data)).load()
+    vector = np.ascontiguousarray(np.ravel(embedding), dtype=DTYPES[DTYPE_CODE])
+    norm = float(np.linalg.norm(vector.astype(np.float32)))
+    return HEADER.pack(MAGIC, 1, DTYPE_CODE, PIPELINE_VERSION, vector.shape[0], norm) + vector.tobytes()
+
+
+def _decode(data: bytes) -> np.ndarray:
+    _, _, dtype_code, _, dimension, _ = HEADER.unpack_from(data)
+    return np.frombuffer(data, dtype=DTYPES[dtype_code], count=dimension, offset=HEADER.size)
+
+
+def _convert(convert, needs_conversion) -> None:
+    """Rewrite every blob that needs it, BATCH_SIZE rows per query in primary key order."""
+    connection = op.get_bind()
+    for table_name, pk_name, blob_name in EMBEDDING_COLUMNS:
+        target = sa.table(table_name, sa.column(pk_name), sa.column(blob_name))
+        pk, blob = target.c[pk_name], target.c[blob_name]
+        after_pk = 0
+        while True:
+            rows = connection.execute(
+                sa.select(pk, blob).where(pk > after_pk).order_by(pk).limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            after_pk = rows[-1][0]
+
+            updates = [
+                {"_pk": row[0], "_blob": convert(row[1])}
+                for row in rows
+                if row[1] is not None and needs_conversion(row[1])
+            ]
+            if updates:
+                connection.execute(
+                    target.update().where(pk == sa.bindparam("_pk")).values({blob_name: sa.bindparam("_blob")}),
+                    updates
+                )
+
+
+def upgrade() -> None:
+    _convert(_encode, _is_legacy)
+
+
+def downgrade() -> None:
+    _convert(
+        lambda data: pickle.dumps(np.asarray(_decode(data), dtype=np.float64)),
+        lambda data: not _is_legacy(data)
+    )
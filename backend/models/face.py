@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -19,6 +19,11 @@ class Face(Base):
     # Relationships
     owner = relationship("User", back_populates="faces")
     detections = relationship("FaceDetection", back_populates="face")
+    
+    __table_args__ = (
+        # People of a user, and the matching gallery (active faces in face_id order)
+        Index("ix_faces_user_id_is_active", "user_id", "is_active", "face_id"),
+    )
 
 class FaceDetection(Base):
     __tablename__ = "face_detections"
@@ -33,10 +38,36 @@ class FaceDetection(Base):
     confidence_score = Column(Float)
     embedding = Column(LargeBinary, nullable=False)  # Serialized facial embedding
     identified = Column(Boolean, default=False)
+    # Suggested person of an unidentified detection (services.face_clustering)
+    cluster_id = Column(Integer, ForeignKey("face_clusters.cluster_id", ondelete="SET NULL"), nullable=True)
     
     # Relationships
     photo = relationship("Photo", back_populates="face_detections")
     face = relationship("Face", back_populates="detections")
+    
+    __table_args__ = (
+        Index("ix_face_detections_photo_id", "photo_id"),
+        Index("ix_face_detections_face_id", "face_id"),
+        Index("ix_face_detections_cluster_id", "cluster_id"),
+    )
+
+class FaceCluster(Base):
+    __tablename__ = "face_clusters"
+    
+    cluster_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"))
+    centroid = Column(LargeBinary, nullable=False)  # Serialized mean of the members' normalized embeddings
+    size = Column(Integer, default=0)
+    # Member closest to the centroid when it joined, shown for the cluster
+    representative_detection_id = Column(Integer)
+    representative_score = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    
+    __table_args__ = (
+        # Clusters of a user, largest first
+        Index("ix_face_clusters_user_id_size", "user_id", "size", "cluster_id"),
+    )
 
 class SharingPermission(Base):
     __tablename__ = "sharing_permissions"
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Index
+from sqlalchemy.sql import func
+
+from database.database import Base
+
+class ProcessingJob(Base):
+    __tablename__ = "processing_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String(50), nullable=False)  # 'process_photo', ...
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"))
+    photo_id = Column(Integer, ForeignKey("photos.photo_id", ondelete="CASCADE"), nullable=True)
+    event_id = Column(Integer, ForeignKey("events.event_id", ondelete="CASCADE"), nullable=True)
+    payload = Column(JSON)
+    status = Column(String(20), nullable=False, default="pending")  # 'pending', 'running', 'succeeded', 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    run_after = Column(DateTime(timezone=True), nullable=False)  # Not claimed before this time (retry backoff)
+    locked_by = Column(String(100))  # Worker holding the job while running
+    locked_at = Column(DateTime(timezone=True))  # Last heartbeat of that worker
+    last_error = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        # Claim query: next due job of a given status
+        Index("ix_processing_jobs_status_run_after", "status", "run_after"),
+        Index("ix_processing_jobs_photo_id", "photo_id"),
+    )
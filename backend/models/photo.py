@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Float, ForeignKey, Index, false
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -19,6 +19,11 @@ class Event(Base):
     # Relationships
     owner = relationship("User", back_populates="events")
     photos = relationship("Photo", back_populates="event")
+    
+    __table_args__ = (
+        # Event listing: a user's events newest first (keyset pagination order)
+        Index("ix_events_user_id_created_at", "user_id", "created_at", "event_id"),
+    )
 
 class Photo(Base):
     __tablename__ = "photos"
@@ -28,6 +33,7 @@ class Photo(Base):
     event_id = Column(Integer, ForeignKey("events.event_id", ondelete="SET NULL"), nullable=True)
     file_name = Column(String(255), nullable=False)
     storage_path = Column(String(500), nullable=False)
+    content_hash = Column(String(64), index=True)  # SHA-256 of the file (see stored_files)
     file_size = Column(Integer, nullable=False)  # in bytes
     width = Column(Integer)
     height = Column(Integer)
@@ -45,6 +51,30 @@ class Photo(Base):
     event = relationship("Event", back_populates="photos")
     face_detections = relationship("FaceDetection", back_populates="photo")
     
+    __table_args__ = (
+        # Photo listing: a user's photos newest first (keyset pagination order)
+        Index(
+            "ix_photos_user_id_upload_date", "user_id", "upload_date", "photo_id",
+            sqlite_where=is_deleted == false(), postgresql_where=is_deleted == false()
+        ),
+        # Photos of an event: counts, event processing and progress (unprocessed photos)
+        Index(
+            "ix_photos_event_id_is_processed", "event_id", "is_processed",
+            sqlite_where=is_deleted == false(), postgresql_where=is_deleted == false()
+        ),
+    )
+    
+class StoredFile(Base):
+    __tablename__ = "stored_files"
+    
+    content_hash = Column(String(64), primary_key=True)  # SHA-256 hex digest
+    storage_path = Column(String(500), nullable=False)
+    file_size = Column(Integer, nullable=False)  # in bytes
+    format = Column(String(10))
+    ref_count = Column(Integer, nullable=False, default=0)  # Photo rows using the file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    released_at = Column(DateTime(timezone=True))  # When ref_count last dropped
+    
 class Tag(Base):
     __tablename__ = "tags"
     
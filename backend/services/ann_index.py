@@ -0,0 +1,400 @@
+"""
+Nearest-neighbour indexes over normalized face embeddings.
+
+Two interchangeable implementations are provided:
+
+* ExactIndex - brute-force scoring of the whole matrix. Always exact and the
+  fastest option for small galleries.
+* IVFIndex - inverted file index with a spherical k-means coarse quantizer.
+  Each embedding lives in the list of its closest centroid and a query only
+  scores the ``n_probe`` lists whose centroids are closest to it. ``n_probe``
+  is the recall/latency knob: higher means better recall and slower queries,
+  ``n_probe == n_lists`` is exhaustive.
+
+Both expect inputs produced by services.face_matching.normalize_embeddings
+and return scores on the same correlation scale. save_index/load_index
+write an index with its structure to an .npz file, so a trained IVF index
+does not have to be rebuilt after a restart.
+"""
+import logging
+import os
+import uuid
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from services.face_matching import match_embeddings
+
+logger = logging.getLogger(__name__)
+
+# Galleries smaller than this are always searched exactly
+ANN_MIN_GALLERY_SIZE = int(os.getenv("FACE_INDEX_ANN_MIN_SIZE", "5000"))
+# Number of inverted lists scanned per query
+ANN_N_PROBE = int(os.getenv("FACE_INDEX_N_PROBE", "8"))
+# "auto" switches to IVF above ANN_MIN_GALLERY_SIZE, "exact" never does
+INDEX_KIND = os.getenv("FACE_INDEX", "auto")
+
+
+def _last_occurrences(ids: np.ndarray, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Drop repeated ids from a batch, keeping the last vector of each like sequential inserts would."""
+    if len(ids) < 2:
+        return ids, vectors
+    _, reversed_rows = np.unique(ids[::-1], return_index=True)
+    if len(reversed_rows) == len(ids):
+        return ids, vectors
+    rows = np.sort(len(ids) - 1 - reversed_rows)
+    return ids[rows], vectors[rows]
+
+
+def _empty_result(num_queries: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    return (
+        np.full((num_queries, k), -np.inf, dtype=np.float32),
+        np.full((num_queries, k), -1, dtype=np.int64)
+    )
+
+
+class ExactIndex:
+    """
+    Brute-force index over a contiguous embedding matrix.
+
+    Rows are kept in buffers with spare capacity and removals swap the last
+    row into the freed slot, so inserting, replacing and removing single
+    embeddings cost O(D) rather than a copy of the matrix.
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray):
+        ids, vectors = _last_occurrences(np.asarray(ids, dtype=np.int64), np.asarray(vectors))
+        self._ids = np.array(ids, dtype=np.int64)
+        self._vectors = np.array(vectors, dtype=np.float32, order="C")
+        self._size = len(self._ids)
+        # id -> row
+        self._positions: Dict[int, int] = {face_id: row for row, face_id in enumerate(self._ids.tolist())}
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, face_id: int) -> bool:
+        return face_id in self._positions
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._ids[:self._size]
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self._vectors[:self._size]
+
+    @property
+    def dim(self) -> Optional[int]:
+        """Embedding dimension, None while the index has never held a row."""
+        return self._vectors.shape[1] if self._vectors.shape[1] or self._size else None
+
+    @property
+    def nbytes(self) -> int:
+        return self._ids.nbytes + self._vectors.nbytes
+
+    def items(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self.ids, self.vectors
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, vectors = _last_occurrences(np.asarray(ids, dtype=np.int64), vectors.astype(np.float32, copy=False))
+        if self.dim is None:
+            self._vectors = self._vectors.reshape(0, vectors.shape[1])
+
+        # Known ids are overwritten in place
+        new = np.ones(len(ids), dtype=bool)
+        for row, face_id in enumerate(ids.tolist()):
+            position = self._positions.get(face_id)
+            if position is not None:
+                self._vectors[position] = vectors[row]
+                new[row] = False
+        ids, vectors = ids[new], vectors[new]
+
+        size = self._size
+        needed = size + len(ids)
+        if needed > len(self._ids):
+            # Grow geometrically so repeated single inserts stay amortized O(D)
+            new_capacity = max(needed, 2 * len(self._ids), 16)
+            grown_ids = np.empty(new_capacity, dtype=np.int64)
+            grown_vectors = np.empty((new_capacity, self._vectors.shape[1]), dtype=np.float32)
+            grown_ids[:size] = self._ids[:size]
+            grown_vectors[:size] = self._vectors[:size]
+            self._ids, self._vectors = grown_ids, grown_vectors
+
+        self._ids[size:needed] = ids
+        self._vectors[size:needed] = vectors
+        for offset, face_id in enumerate(ids.tolist()):
+            self._positions[face_id] = size + offset
+        self._size = needed
+
+    def remove(self, ids: np.ndarray) -> None:
+        for face_id in np.asarray(ids, dtype=np.int64).tolist():
+            position = self._positions.pop(face_id, None)
+            if position is None:
+                continue
+
+            # Swap the last row into the freed slot
+            last = self._size - 1
+            if position != last:
+                moved_id = int(self._ids[last])
+                self._ids[position] = moved_id
+                self._vectors[position] = self._vectors[last]
+                self._positions[moved_id] = position
+            self._size = last
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int = 1,
+        n_probe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, ids) shaped (M, top_k), padded with -inf / -1 (n_probe is ignored)."""
+        result_scores, result_ids = _empty_result(len(queries), top_k)
+        if self._size == 0:
+            return result_scores, result_ids
+        scores, positions = match_embeddings(queries, self.vectors, top_k=top_k, normalized=True)
+        result_scores[:, :scores.shape[1]] = scores
+        result_ids[:, :scores.shape[1]] = self.ids[positions]
+        return result_scores, result_ids
+
+
+class IVFIndex:
+    """Inverted file index with incremental insert and delete."""
+
+    def __init__(
+        self,
+        dim: int,
+        n_lists: int,
+        n_probe: int = ANN_N_PROBE,
+        seed: int = 0
+    ):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.seed = seed
+        self.centroids = np.zeros((n_lists, dim), dtype=np.float32)
+        self.trained_size = 0
+
+        self._list_ids = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._list_vectors = [np.empty((0, dim), dtype=np.float32) for _ in range(n_lists)]
+        self._list_sizes = np.zeros(n_lists, dtype=np.int64)
+        # face_id -> (list number, position within the list)
+        self._locations: Dict[int, Tuple[int, int]] = {}
+
+    @classmethod
+    def build(cls, ids: np.ndarray, vectors: np.ndarray, n_probe: int = ANN_N_PROBE) -> "IVFIndex":
+        """Train the coarse quantizer on the vectors and insert them."""
+        n_lists = max(1, int(2 * np.sqrt(len(ids))))
+        index = cls(vectors.shape[1], n_lists, n_probe=n_probe)
+        index.train(vectors)
+        index.add(ids, vectors)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._locations)
+
+    def __contains__(self, face_id: int) -> bool:
+        return face_id in self._locations
+
+    @property
+    def nbytes(self) -> int:
+        stored = sum(v.nbytes + i.nbytes for v, i in zip(self._list_vectors, self._list_ids))
+        return stored + self.centroids.nbytes
+
+    def train(self, vectors: np.ndarray, iterations: int = 10) -> None:
+        """Fit centroids with spherical k-means on a sample of the vectors."""
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), 32 * self.n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        centroids = sample[rng.choice(sample_size, self.n_lists, replace=sample_size < self.n_lists)].copy()
+        for _ in range(iterations):
+            assignment = self._nearest_lists(sample, centroids)
+            order = np.argsort(assignment, kind="stable")
+            lists, starts = np.unique(assignment[order], return_index=True)
+            sums = np.zeros_like(centroids)
+            sums[lists] = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Keep the previous centroid for lists that received no points
+            empty = norms[:, 0] == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.where(norms == 0, 1.0, norms))
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_size = len(vectors)
+
+    def items(self) -> Tuple[np.ndarray, np.ndarray]:
+        sizes = self._list_sizes
+        return (
+            np.concatenate([ids[:size] for ids, size in zip(self._list_ids, sizes)]),
+            np.concatenate([vectors[:size] for vectors, size in zip(self._list_vectors, sizes)])
+        )
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        ids, vectors = _last_occurrences(np.asarray(ids, dtype=np.int64), vectors.astype(np.float32, copy=False))
+        self.remove(ids)
+        assignment = self._nearest_lists(vectors, self.centroids)
+
+        for list_no in np.unique(assignment):
+            members = assignment == list_no
+            self._append(int(list_no), ids[members], vectors[members])
+
+    def remove(self, ids: np.ndarray) -> None:
+        for face_id in np.asarray(ids, dtype=np.int64).tolist():
+            location = self._locations.pop(face_id, None)
+            if location is None:
+                continue
+
+            # Swap the last entry of the list into the freed slot
+            list_no, position = location
+            last = self._list_sizes[list_no] - 1
+            if position != last:
+                moved_id = int(self._list_ids[list_no][last])
+                self._list_ids[list_no][position] = moved_id
+                self._list_vectors[list_no][position] = self._list_vectors[list_no][last]
+                self._locations[moved_id] = (list_no, position)
+            self._list_sizes[list_no] = last
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int = 1,
+        n_probe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (scores, ids) shaped (M, top_k), padded with -inf / -1."""
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        result_scores, result_ids = _empty_result(len(queries), top_k)
+        if len(self) == 0:
+            return result_scores, result_ids
+
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, n_probe - 1, axis=1)[:, :n_probe]
+
+        for row, query in enumerate(queries):
+            lists = [int(l) for l in probes[row] if self._list_sizes[l]]
+            if not lists:
+                continue
+
+            candidate_ids = np.concatenate([self._list_ids[l][:self._list_sizes[l]] for l in lists])
+            candidates = np.concatenate([self._list_vectors[l][:self._list_sizes[l]] for l in lists])
+            scores, positions = match_embeddings(query[np.newaxis], candidates, top_k=top_k, normalized=True)
+
+            found = scores.shape[1]
+            result_scores[row, :found] = scores[0]
+            result_ids[row, :found] = candidate_ids[positions[0]]
+
+        return result_scores, result_ids
+
+    def _append(self, list_no: int, ids: np.ndarray, vectors: np.ndarray) -> None:
+        size = self._list_sizes[list_no]
+        needed = size + len(ids)
+        capacity = len(self._list_ids[list_no])
+
+        if needed > capacity:
+            # Grow geometrically so repeated single inserts stay amortized O(1)
+            new_capacity = max(needed, 2 * capacity, 16)
+            grown_ids = np.empty(new_capacity, dtype=np.int64)
+            grown_vectors = np.empty((new_capacity, self.dim), dtype=np.float32)
+            grown_ids[:size] = self._list_ids[list_no][:size]
+            grown_vectors[:size] = self._list_vectors[list_no][:size]
+            self._list_ids[list_no] = grown_ids
+            self._list_vectors[list_no] = grown_vectors
+
+        self._list_ids[list_no][size:needed] = ids
+        self._list_vectors[list_no][size:needed] = vectors
+        for offset, face_id in enumerate(ids.tolist()):
+            self._locations[face_id] = (list_no, size + offset)
+        self._list_sizes[list_no] = needed
+
+    @staticmethod
+    def _nearest_lists(vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 4096) -> np.ndarray:
+        # Chunked so the (N, n_lists) score matrix never gets large
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = vectors[start:start + chunk_size]
+            assignment[start:start + chunk_size] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignment
+
+
+def build_index(ids: np.ndarray, vectors: np.ndarray):
+    """
+    Pick and build the right index for a gallery.
+
+    Args:
+        ids: (N,) face ids
+        vectors: (N, D) normalized embeddings
+
+    Returns:
+        IVFIndex for large galleries when ANN is enabled, ExactIndex otherwise
+    """
+    if INDEX_KIND != "exact" and len(ids) >= ANN_MIN_GALLERY_SIZE:
+        logger.info(f"Building IVF index for {len(ids)} embeddings")
+        return IVFIndex.build(ids, vectors)
+    return ExactIndex(ids, vectors)
+
+
+def needs_rebuild(index) -> bool:
+    """Whether an index has outgrown its structure after incremental inserts."""
+    if isinstance(index, IVFIndex):
+        # Lists become unbalanced once the gallery grows well past the training set
+        return len(index) > 4 * max(index.trained_size, 1)
+    return INDEX_KIND != "exact" and len(index) >= ANN_MIN_GALLERY_SIZE
+
+
+def save_index(index, path: str, **metadata) -> None:
+    """
+    Write an index to an .npz file, replacing it atomically.
+
+    Args:
+        index: ExactIndex or IVFIndex
+        path: Destination file
+        metadata: Extra scalars or arrays stored with the index (returned by load_index)
+    """
+    ids, vectors = index.items()
+    arrays = {"ids": ids, "vectors": vectors}
+    if isinstance(index, IVFIndex):
+        # items() concatenates the lists in order; their sizes split them again
+        arrays.update(
+            centroids=index.centroids,
+            list_sizes=index._list_sizes,
+            n_probe=index.n_probe,
+            trained_size=index.trained_size,
+            seed=index.seed
+        )
+    arrays.update({f"meta_{key}": value for key, value in metadata.items()})
+
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(temp_path, "wb") as out:
+            np.savez(out, **arrays)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_index(path: str) -> Tuple[object, Dict[str, object]]:
+    """
+    Read an index written by save_index.
+
+    Returns:
+        Tuple of (index, metadata)
+    """
+    with np.load(path) as data:
+        ids, vectors = data["ids"], data["vectors"]
+        metadata = {
+            key[len("meta_"):]: data[key].item() if data[key].ndim == 0 else data[key]
+            for key in data.files if key.startswith("meta_")
+        }
+        if "centroids" not in data.files:
+            return ExactIndex(ids, vectors), metadata
+
+        centroids = data["centroids"]
+        index = IVFIndex(centroids.shape[1], len(centroids), n_probe=int(data["n_probe"]), seed=int(data["seed"]))
+        index.centroids = centroids
+        index.trained_size = int(data["trained_size"])
+        offsets = np.cumsum(data["list_sizes"])[:-1]
+        for list_no, (list_ids, list_vectors) in enumerate(zip(np.split(ids, offsets), np.split(vectors, offsets))):
+            if len(list_ids):
+                index._append(list_no, list_ids, list_vectors)
+        return index, metadata
@@ -3,15 +3,17 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
 from database.database import get_db
 from models.user import User
+from services.password_hasher import password_hasher, pwd_context
+from services.principal_cache import principal_cache
 
 # Security configuration
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/token")
 
 # JWT configuration
@@ -29,11 +31,16 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(User).filter(User.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = await db.scalar(select(User).where(User.email == email).limit(1))
     if not user:
         return False
-    if not verify_password(password, user.password_hash):
+    # Give the connection back to the pool while bcrypt runs (possibly after
+    # queueing); the loaded attributes stay readable on the detached user
+    db.expunge(user)
+    await db.rollback()
+    # bcrypt runs on the password hasher pool, not on the event loop
+    if not await password_hasher.verify(password, user.password_hash):
         return False
     return user
 
@@ -49,13 +56,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    # Synchronous, so FastAPI runs it (and its queries) in the threadpool
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    # Recently verified tokens skip the JWT check and the users query
+    user = principal_cache.get(token, db)
+    if user is not None:
+        principal_cache.record_login(user.user_id)
+        return user
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         email: str = payload.get("sub")
@@ -76,9 +90,11 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+    
+    expires_at = datetime.utcfromtimestamp(payload["exp"]) if "exp" in payload else None
+    principal_cache.put(token, user, expires_at)
         
-    # Update last login time
-    user.last_login = datetime.utcnow()
-    db.commit()
+    # Update last login time; written in batches by the principal cache
+    principal_cache.record_login(user.user_id)
     
-    return user
\ No newline at end of file
+    return user
@@ -0,0 +1,179 @@
+"""
+On-disk cache of face detection results.
+
+Detection is deterministic given the file, the detector and its parameters
+and the descriptor, so results are cached under a key of
+
+    (content hash, detector, detection preset parameters, descriptor version)
+
+and a retried job, a reprocessed photo or a repeated experiment costs one
+small file read instead of a cascade run. Boxes are additionally cached
+without the descriptor version: after a descriptor change the cascade is
+skipped and only the crops are described again. The preset name is not
+part of the key, so presets with identical parameters share entries.
+
+Entries use the same size-bounded LRU directory as the renditions
+(services.disk_cache). Layout of an entry (little-endian)::
+
+    4       magic b"FDC1"
+    2       number of faces
+    per face:
+    20      x, y, width, height, confidence (float32)
+    4       embedding blob length, 0 in box-only entries
+    ...     embedding blob (services.embedding_format, float32)
+
+Settings:
+    DETECTION_CACHE_DIR      cache location (default backend/cache/detections)
+    DETECTION_CACHE_MAX_MB   size bound of the cache (default 256)
+"""
+import hashlib
+import json
+import os
+import struct
+import uuid
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from services.detection_presets import DetectionPreset
+from services.disk_cache import DiskCache
+from services.embedding_format import decode_embedding, encode_embedding
+
+# Identifies the detector model; OpenCV's version is part of the key too
+DETECTOR = "haarcascade_frontalface_default"
+
+MAGIC = b"FDC1"
+_COUNT = struct.Struct("<4sH")
+_FACE = struct.Struct("<5fI")
+
+
+def encode_detections(detections: List[dict], pipeline_version: Optional[int] = None) -> bytes:
+    """Serialize detections; embeddings are left out when ``pipeline_version`` is None."""
+    parts = [_COUNT.pack(MAGIC, len(detections))]
+    for detection in detections:
+        location = detection["location"]
+        blob = b""
+        if pipeline_version is not None:
+            blob = encode_embedding(detection["embedding"], np.float32, pipeline_version)
+        parts.append(_FACE.pack(
+            location["x"], location["y"], location["width"], location["height"],
+            detection["confidence"], len(blob)
+        ))
+        parts.append(blob)
+    return b"".join(parts)
+
+
+def decode_detections(data: bytes) -> List[dict]:
+    """Detections in FaceRecognitionService.detect_faces format (no "embedding" in box-only entries)."""
+    magic, count = _COUNT.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a detection cache entry")
+    detections = []
+    offset = _COUNT.size
+    for _ in range(count):
+        x, y, width, height, confidence, length = _FACE.unpack_from(data, offset)
+        offset += _FACE.size
+        detection = {
+            "location": {"x": x, "y": y, "width": width, "height": height},
+            "confidence": confidence
+        }
+        if length:
+            detection["embedding"] = np.array(decode_embedding(data[offset:offset + length]))
+            offset += length
+        detections.append(detection)
+    return detections
+
+
+class DetectionCache(DiskCache):
+    """Size-bounded on-disk cache of detection results keyed by input and parameters."""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        super().__init__(cache_dir, max_bytes)
+        self.box_hits = 0
+
+    def keys(self, content_hash: str, preset: DetectionPreset, descriptor_version: str) -> Tuple[str, str]:
+        """
+        Cache keys of a photo's results.
+
+        Args:
+            content_hash: SHA-256 of the photo file
+            preset: Detection preset in effect
+            descriptor_version: Version string of the face descriptor
+
+        Returns:
+            (key of full results, key of boxes only)
+        """
+        # Every preset field but the name
+        parameters = [content_hash, DETECTOR, cv2.__version__, *preset[1:]]
+        boxes_key = hashlib.sha256(json.dumps(parameters).encode()).hexdigest()
+        faces_key = hashlib.sha256(json.dumps([*parameters, descriptor_version]).encode()).hexdigest()
+        return faces_key, boxes_key
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.fdc")
+
+    def _read(self, key: str) -> Optional[List[dict]]:
+        path = self.path_for(key)
+        try:
+            # Refresh the recency used by eviction
+            os.utime(path)
+            with open(path, "rb") as f:
+                return decode_detections(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, struct.error):
+            # Damaged entry; recomputed and overwritten by the caller
+            return None
+
+    def lookup(self, faces_key: str, boxes_key: str) -> Tuple[Optional[List[dict]], Optional[List[dict]]]:
+        """
+        Cached results of a photo.
+
+        Blocking; call from a worker thread. A hit on the boxes alone counts
+        as a miss (the descriptor still runs) and as a box hit.
+
+        Returns:
+            (full detections or None, boxes or None when full detections are cached)
+        """
+        faces = self._read(faces_key)
+        if faces is not None:
+            with self._lock:
+                self.hits += 1
+            return faces, None
+        boxes = self._read(boxes_key)
+        with self._lock:
+            self.misses += 1
+            if boxes is not None:
+                self.box_hits += 1
+        return None, boxes
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats["box_hits"] = self.box_hits
+        return stats
+
+    def put(self, key: str, detections: List[dict], pipeline_version: Optional[int] = None) -> None:
+        """Store detections (with embeddings when ``pipeline_version`` is given); blocking."""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(encode_detections(detections, pipeline_version))
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        self._stored(path)
+
+
+detection_cache = DetectionCache(
+    cache_dir=os.path.abspath(os.getenv(
+        "DETECTION_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "detections")
+    )),
+    max_bytes=int(float(os.getenv("DETECTION_CACHE_MAX_MB", "256")) * 1024 * 1024)
+)
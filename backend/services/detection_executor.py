@@ -0,0 +1,170 @@
+"""
+Worker pool running face detection off the asyncio event loop.
+
+Each worker process holds its own preloaded FaceRecognitionService (and so
+its own CascadeClassifier and descriptor) and limits OpenCV to a fixed number
+of threads, so N workers use a predictable N * threads cores. Submissions
+beyond ``max_pending`` wait for a free slot instead of piling up in the pool.
+
+Settings:
+    DETECTION_WORKERS              worker processes, 0 runs on a single thread
+                                   of the API process (default: CPU count / 2)
+    DETECTION_THREADS_PER_WORKER   cv2.setNumThreads in each worker (default 1)
+    DETECTION_MAX_PENDING          queued + running submissions (default 4 per worker)
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+# Service instance of the current worker, created by _init_worker
+_worker_service = None
+
+
+def _init_worker(threads: int) -> None:
+    global _worker_service
+    from services.face_recognition_service import FaceRecognitionService
+
+    cv2.setNumThreads(threads)
+    _worker_service = FaceRecognitionService()
+
+
+def _detect(image_path: str, preset: Optional[str], boxes: Optional[List[dict]]) -> List[dict]:
+    return _worker_service.detect_faces_sync(image_path, preset, boxes)
+
+
+def _ingest(
+    image_path: str,
+    preset: Optional[str],
+    rendition_sizes: List[int],
+    content_hash: Optional[str],
+    boxes: Optional[List[dict]]
+):
+    from services.ingest_pipeline import ingest
+
+    return ingest(_worker_service, image_path, preset, rendition_sizes, content_hash, boxes=boxes)
+
+
+class DetectionExecutor:
+    """Bounded pool of face detection workers awaited from coroutines."""
+
+    def __init__(self, workers: int, threads_per_worker: int = 1, max_pending: Optional[int] = None):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker
+        self.max_pending = max_pending or max(workers, 1) * 4
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._waiting = 0
+
+    def _get_pool(self) -> Executor:
+        with self._pool_lock:
+            if self._pool is None:
+                if self.workers > 0:
+                    # spawn: workers must not inherit the API's threads, sockets or DB connections
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.threads_per_worker,)
+                    )
+                else:
+                    self._pool = ThreadPoolExecutor(
+                        max_workers=1,
+                        thread_name_prefix="face-detection",
+                        initializer=_init_worker,
+                        initargs=(self.threads_per_worker,)
+                    )
+                logger.info(f"Started face detection pool with {self.workers} workers")
+            return self._pool
+
+    async def detect(
+        self,
+        image_path: str,
+        preset: Optional[str] = None,
+        boxes: Optional[List[dict]] = None
+    ) -> List[dict]:
+        """
+        Detect faces in an image on a worker and await the result.
+
+        Args:
+            image_path: Path to the image file
+            preset: Detection preset name, None for the default
+            boxes: Known face boxes to describe instead of running the cascade
+
+        Returns:
+            Same result as FaceRecognitionService.detect_faces_sync
+        """
+        return await self._run(_detect, image_path, preset, boxes)
+
+    async def ingest(
+        self,
+        image_path: str,
+        preset: Optional[str] = None,
+        rendition_sizes: Sequence[int] = (),
+        content_hash: Optional[str] = None,
+        boxes: Optional[List[dict]] = None
+    ):
+        """
+        Run the single-decode ingest pipeline on a worker and await the result.
+
+        Returns:
+            services.ingest_pipeline.IngestResult
+        """
+        return await self._run(_ingest, image_path, preset, list(rendition_sizes), content_hash, boxes)
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        # Wait for a free slot so the pool queue stays bounded
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        try:
+            self.submitted += 1
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._get_pool(), fn, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "waiting": self._waiting,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+detection_executor = DetectionExecutor(
+    workers=int(os.getenv("DETECTION_WORKERS", str(max((os.cpu_count() or 2) // 2, 1)))),
+    threads_per_worker=int(os.getenv("DETECTION_THREADS_PER_WORKER", "1")),
+    max_pending=int(os.getenv("DETECTION_MAX_PENDING", "0")) or None
+)
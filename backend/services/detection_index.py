@@ -0,0 +1,391 @@
+"""
+Persistent per-user index of detection embeddings, for search by face.
+
+POST /faces/search looks for a face among every detection of a user, named
+or not. Scoring the stored blobs on each query would decode the whole
+library every time, so each user gets a nearest-neighbour index over the
+normalized embeddings of all their detections (services.ann_index; an IVF
+index once the library is large), keyed by detection_id.
+
+An index is built once from the database and saved to
+DETECTION_INDEX_DIR/<user_id>.npz with the structure of the IVF index, the
+descriptor pipeline version and the highest detection_id it contains.
+Before every search, detections with a higher id are read (an empty range
+scan when nothing is new) and added, and the file is rewritten once
+DETECTION_INDEX_SAVE_EVERY detections were added since the last save. An
+index of another pipeline version is rebuilt. Detections of deleted photos
+are not added. Detections that are deleted (reprocessed photos) or whose
+photo is deleted later are removed when a search finds them: the results
+are checked against the database, and the search is repeated until the
+top_k it returns are all live.
+
+Ids are not committed in order on PostgreSQL: a transaction that allocated
+an id may commit after a catch-up has passed it. Every catch-up therefore
+also reads the ids of the last DETECTION_INDEX_CATCH_UP_WINDOW ids below
+the high-water mark and adds the ones the index is missing. A detection
+committed later than that is only added by a rebuild
+(``python -m services.detection_index rebuild``); with SQLite, writes are
+serialized and ids commit in order.
+
+Detections made by another pipeline version (before a descriptor change,
+or by a worker still running the old descriptor) are skipped, and their ids
+are kept with the index. Every catch-up reads the version field of those
+blobs only, adds the detections that were re-described in place since
+(services.embedding_reencoder --redescribe) and forgets deleted ones. That
+pass also invalidates every index when it is done: it deletes the files and
+bumps DETECTION_INDEX_DIR/generation, which every process checks before a
+search. Indexes of an older generation, in memory or saved by a worker that
+was still using one, are rebuilt.
+
+Settings:
+    DETECTION_INDEX_DIR           index files (default backend/cache/detection_index)
+    DETECTION_INDEX_CACHE_MAX_MB  indexes kept in memory (default 1024)
+    DETECTION_INDEX_SAVE_EVERY    new detections between saves (default 1000)
+    DETECTION_INDEX_CATCH_UP_WINDOW  ids below the high-water mark re-read for late commits (default 10000)
+    FACE_SEARCH_N_PROBE           inverted lists scanned per search (default 32)
+
+Usage (from backend/):
+    python -m services.detection_index rebuild --user-id 1
+"""
+import argparse
+import logging
+import glob
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.face import FaceDetection
+from models.photo import Photo
+from services.ann_index import build_index, load_index, save_index
+from services.embedding_format import (
+    PIPELINE_VERSION_OFFSET,
+    decode_embeddings,
+    encode_pipeline_version,
+    pipeline_version_of,
+)
+from services.face_matching import normalize_embeddings
+from services.gallery_cache import Gallery, GalleryCache
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.path.abspath(os.getenv(
+    "DETECTION_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "detection_index")
+))
+SAVE_EVERY = int(os.getenv("DETECTION_INDEX_SAVE_EVERY", "1000"))
+# More than the matching default: search wants every photo of a person, not just the best one
+SEARCH_N_PROBE = int(os.getenv("FACE_SEARCH_N_PROBE", "32"))
+CATCH_UP_CHUNK_SIZE = 10000
+# Ids a transaction can allocate before an earlier one commits
+CATCH_UP_WINDOW = int(os.getenv("DETECTION_INDEX_CATCH_UP_WINDOW", "10000"))
+GENERATION_FILE = "generation"
+
+
+class DetectionIndex:
+    """A user's detection gallery and how far into face_detections it reaches."""
+
+    def __init__(
+        self,
+        gallery: Gallery,
+        pipeline_version: int,
+        max_detection_id: int = 0,
+        generation: int = 0,
+        stale_ids: Iterable[int] = ()
+    ):
+        self.gallery = gallery
+        self.pipeline_version = pipeline_version
+        self.max_detection_id = max_detection_id
+        self.generation = generation
+        # Detections up to max_detection_id made by another pipeline version
+        self.stale_ids = set(int(detection_id) for detection_id in stale_ids)
+        self.unsaved = 0
+
+    def __len__(self) -> int:
+        return len(self.gallery)
+
+    @property
+    def nbytes(self) -> int:
+        return self.gallery.nbytes
+
+
+class DetectionIndexStore:
+    """Loads, catches up, saves and caches the users' detection indexes."""
+
+    def __init__(self, index_dir: str, max_bytes: int, save_every: int = SAVE_EVERY):
+        self.index_dir = index_dir
+        self.save_every = save_every
+        self.cache = GalleryCache(max_bytes)
+        self._locks: Dict[int, threading.Lock] = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+
+    def path_for(self, user_id: int) -> str:
+        return os.path.join(self.index_dir, f"{user_id}.npz")
+
+    def get(self, db: Session, user_id: int, pipeline_version: int) -> DetectionIndex:
+        """
+        The user's index, up to date with the database.
+
+        Blocking (may build the index on first use); call from a worker thread.
+        """
+        generation = self._generation()
+        with self._locks_guard:
+            lock = self._locks[user_id]
+        with lock:
+            index = self.cache.get(user_id)
+            if (index is None or index.pipeline_version != pipeline_version
+                    or index.generation != generation):
+                index = self._load(user_id, pipeline_version, generation)
+
+            added = self._catch_up(db, user_id, index)
+            index.unsaved += added
+            if index.unsaved >= self.save_every:
+                self.save(user_id, index)
+            # Re-accounts the size when the index grew
+            self.cache.put(user_id, index)
+            return index
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        pipeline_version: int,
+        embedding: np.ndarray,
+        top_k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Closest detections of a user to a face embedding.
+
+        Returns:
+            Tuple of (scores, detection_ids), best first, at most top_k
+        """
+        index = self.get(db, user_id, pipeline_version)
+        while True:
+            scores, detection_ids = index.gallery.search(
+                normalize_embeddings(embedding), top_k=top_k, n_probe=SEARCH_N_PROBE
+            )
+            found = detection_ids[0] >= 0
+            scores, detection_ids = scores[0][found], detection_ids[0][found]
+
+            # Deleted since they were indexed: drop them and search again
+            dead = self._dead_ids(db, user_id, detection_ids)
+            if not dead:
+                return scores, detection_ids
+            self._forget(user_id, index, dead)
+
+    def save(self, user_id: int, index: DetectionIndex) -> None:
+        os.makedirs(self.index_dir, exist_ok=True)
+        with index.gallery._lock:
+            save_index(
+                index.gallery.index,
+                self.path_for(user_id),
+                pipeline_version=index.pipeline_version,
+                max_detection_id=index.max_detection_id,
+                generation=index.generation,
+                stale_ids=np.array(sorted(index.stale_ids), dtype=np.int64)
+            )
+        index.unsaved = 0
+
+    def rebuild(self, db: Session, user_id: int, pipeline_version: int) -> DetectionIndex:
+        """Drop the saved index and build it again from the database."""
+        with self._locks_guard:
+            lock = self._locks[user_id]
+        with lock:
+            self.cache.invalidate(user_id)
+            if os.path.exists(self.path_for(user_id)):
+                os.remove(self.path_for(user_id))
+        return self.get(db, user_id, pipeline_version)
+
+    def invalidate_all(self) -> None:
+        """Make every process rebuild every index, e.g. after embeddings were rewritten."""
+        os.makedirs(self.index_dir, exist_ok=True)
+        marker = os.path.join(self.index_dir, GENERATION_FILE)
+        # Strictly newer than the current generation, whatever the clock resolution
+        generation = max(time.time_ns(), self._generation() + 1)
+        with open(marker, "a"):
+            pass
+        os.utime(marker, ns=(generation, generation))
+        for path in glob.glob(os.path.join(self.index_dir, "*.npz")):
+            os.remove(path)
+        self.cache.clear()
+
+    def _generation(self) -> int:
+        try:
+            return os.stat(os.path.join(self.index_dir, GENERATION_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _load(self, user_id: int, pipeline_version: int, generation: int) -> DetectionIndex:
+        path = self.path_for(user_id)
+        if os.path.exists(path):
+            try:
+                ann_index, metadata = load_index(path)
+                if (metadata.get("pipeline_version") == pipeline_version
+                        and metadata.get("generation", 0) == generation):
+                    return DetectionIndex(
+                        Gallery.from_index(ann_index), pipeline_version,
+                        int(metadata["max_detection_id"]), generation, metadata.get("stale_ids", ())
+                    )
+                logger.info(f"Detection index of user {user_id} is out of date; rebuilding")
+            except Exception as e:
+                logger.error(f"Unreadable detection index of user {user_id}, rebuilding: {str(e)}")
+
+        empty = Gallery(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+        return DetectionIndex(empty, pipeline_version, generation=generation)
+
+    def _catch_up(self, db: Session, user_id: int, index: DetectionIndex) -> int:
+        """
+        Add the user's detections newer than the index, ones that committed
+        late, and stale ones that were re-described; returns how many were
+        added.
+        """
+        new_ids, new_vectors = self._recheck_stale(db, index)
+        late_ids, late_vectors = self._recheck_window(db, user_id, index)
+        new_ids += late_ids
+        new_vectors += late_vectors
+        while True:
+            rows = db.query(FaceDetection.detection_id, FaceDetection.embedding).join(Photo).filter(
+                Photo.user_id == user_id,
+                Photo.is_deleted == False,
+                FaceDetection.detection_id > index.max_detection_id
+            ).order_by(FaceDetection.detection_id).limit(CATCH_UP_CHUNK_SIZE).all()
+            if not rows:
+                break
+            index.max_detection_id = rows[-1].detection_id
+            self._split_current(rows, index, new_ids, new_vectors)
+
+        if not new_ids:
+            return 0
+        ids, vectors = np.concatenate(new_ids), np.concatenate(new_vectors)
+        if len(index.gallery) == 0:
+            # First build: one training pass over everything instead of growing step by step
+            logger.info(f"Building detection index of user {user_id} ({len(ids)} detections)")
+            index.gallery = Gallery.from_index(build_index(ids, vectors))
+            # Saved right away
+            index.unsaved = self.save_every
+        else:
+            index.gallery.add_faces(ids, vectors)
+        return len(ids)
+
+    def _dead_ids(self, db: Session, user_id: int, detection_ids: np.ndarray) -> List[int]:
+        """Ids among ``detection_ids`` whose detection or photo was deleted."""
+        if not len(detection_ids):
+            return []
+        live = {
+            detection_id for detection_id, in db.query(FaceDetection.detection_id).join(Photo).filter(
+                FaceDetection.detection_id.in_(detection_ids.tolist()),
+                Photo.user_id == user_id,
+                Photo.is_deleted == False
+            )
+        }
+        return [detection_id for detection_id in detection_ids.tolist() if detection_id not in live]
+
+    def _forget(self, user_id: int, index: DetectionIndex, detection_ids: List[int]) -> None:
+        with self._locks_guard:
+            lock = self._locks[user_id]
+        with lock:
+            for detection_id in detection_ids:
+                index.gallery.remove_face(detection_id)
+            # The saved file still has them; found again after a reload, they are dropped again
+            index.unsaved += len(detection_ids)
+
+    def _recheck_window(self, db: Session, user_id: int, index: DetectionIndex) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Detections below the high-water mark, within CATCH_UP_WINDOW of it,
+        that committed after the catch-up passed their id; returns their ids
+        and vectors, and marks the stale ones.
+        """
+        new_ids, new_vectors = [], []
+        if not index.max_detection_id or CATCH_UP_WINDOW <= 0:
+            return new_ids, new_vectors
+
+        # Ids only; the embeddings of the missing ones are read below
+        missing = [
+            detection_id for detection_id, in db.query(FaceDetection.detection_id).join(Photo).filter(
+                Photo.user_id == user_id,
+                Photo.is_deleted == False,
+                FaceDetection.detection_id > index.max_detection_id - CATCH_UP_WINDOW,
+                FaceDetection.detection_id <= index.max_detection_id
+            )
+            if detection_id not in index.gallery and detection_id not in index.stale_ids
+        ]
+        for start in range(0, len(missing), CATCH_UP_CHUNK_SIZE):
+            rows = db.query(FaceDetection.detection_id, FaceDetection.embedding).filter(
+                FaceDetection.detection_id.in_(missing[start:start + CATCH_UP_CHUNK_SIZE])
+            ).all()
+            self._split_current(rows, index, new_ids, new_vectors)
+        return new_ids, new_vectors
+
+    @staticmethod
+    def _split_current(rows, index: DetectionIndex, new_ids: List[np.ndarray], new_vectors: List[np.ndarray]) -> None:
+        """Append the ids and vectors of the rows of the index's pipeline version; mark the others stale."""
+        current = []
+        for row in rows:
+            if pipeline_version_of(row.embedding) == index.pipeline_version:
+                current.append(row)
+            else:
+                index.stale_ids.add(row.detection_id)
+        if current:
+            new_ids.append(np.array([row.detection_id for row in current], dtype=np.int64))
+            new_vectors.append(normalize_embeddings(decode_embeddings([row.embedding for row in current])))
+
+    def _recheck_stale(self, db: Session, index: DetectionIndex) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """
+        Take the stale detections that are now current, or deleted, out of
+        index.stale_ids; returns the ids and vectors of the current ones.
+        """
+        new_ids, new_vectors = [], []
+        if not index.stale_ids:
+            return new_ids, new_vectors
+
+        # Compares the version field of the blobs, not their payload
+        is_current = func.substr(FaceDetection.embedding, PIPELINE_VERSION_OFFSET + 1, 2) == encode_pipeline_version(
+            index.pipeline_version
+        )
+        stale_ids = sorted(index.stale_ids)
+        for start in range(0, len(stale_ids), CATCH_UP_CHUNK_SIZE):
+            chunk = stale_ids[start:start + CATCH_UP_CHUNK_SIZE]
+            rows = db.query(FaceDetection.detection_id, is_current).filter(
+                FaceDetection.detection_id.in_(chunk)
+            ).all()
+            index.stale_ids.difference_update(chunk)
+            index.stale_ids.update(detection_id for detection_id, current in rows if not current)
+
+            current_ids = [detection_id for detection_id, current in rows if current]
+            if current_ids:
+                current = db.query(FaceDetection.detection_id, FaceDetection.embedding).filter(
+                    FaceDetection.detection_id.in_(current_ids)
+                ).all()
+                new_ids.append(np.array([row.detection_id for row in current], dtype=np.int64))
+                new_vectors.append(normalize_embeddings(decode_embeddings([row.embedding for row in current])))
+        return new_ids, new_vectors
+
+
+detection_index = DetectionIndexStore(
+    INDEX_DIR,
+    max_bytes=int(os.getenv("DETECTION_INDEX_CACHE_MAX_MB", "1024")) * 1024 * 1024
+)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the detection search indexes")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="Build a user's index again from the database")
+    rebuild_parser.add_argument("--user-id", type=int, required=True)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from database.database import SessionLocal
+    from services.face_descriptors import get_descriptor
+
+    session = SessionLocal()
+    try:
+        rebuilt = detection_index.rebuild(session, args.user_id, get_descriptor().pipeline_version)
+    finally:
+        session.close()
+    print(f"Indexed {len(rebuilt)} detections of user {args.user_id}")
@@ -0,0 +1,88 @@
+"""
+Named speed/recall trade-offs for Haar cascade face detection.
+
+The cascade scans an image pyramid from ``minSize`` up to ``maxSize``; on a
+24-megapixel photo most levels look for faces a few pixels wide, far below
+anything the descriptors can use. A preset downsamples the photo to a
+working resolution before detection, bounds the searched face sizes
+relative to the image and maps the boxes back to original coordinates.
+
+* ``fast``     - 640px working image, coarse pyramid, crops described at
+  working resolution.
+* ``balanced`` - 1280px working image, crops re-cut from the full-resolution
+  image. Default. Faces narrower than ~3% of the photo's short side (about
+  24px at working resolution) are missed.
+* ``thorough`` - full resolution with the original detector parameters.
+
+The active preset is set with ``FACE_DETECTION_PRESET``; individual jobs
+may request another one.
+"""
+import os
+from typing import NamedTuple, Optional
+
+
+class DetectionPreset(NamedTuple):
+    name: str
+    # Longest side of the working image in pixels (None: full resolution)
+    max_side: Optional[int]
+    scale_factor: float
+    min_neighbors: int
+    # Face size bounds as fractions of the working image's short side
+    min_face_fraction: float
+    max_face_fraction: Optional[float]
+    # Lower bound of minSize at working resolution (the cascade window is 24px)
+    min_face_pixels: int
+    # Describe faces from the full-resolution image instead of the working image
+    recrop_full_resolution: bool
+
+
+PRESETS = {
+    "fast": DetectionPreset(
+        name="fast",
+        max_side=640,
+        scale_factor=1.2,
+        min_neighbors=4,
+        min_face_fraction=0.05,
+        max_face_fraction=0.9,
+        min_face_pixels=24,
+        recrop_full_resolution=False
+    ),
+    "balanced": DetectionPreset(
+        name="balanced",
+        max_side=1280,
+        scale_factor=1.1,
+        min_neighbors=5,
+        min_face_fraction=0.02,
+        max_face_fraction=1.0,
+        min_face_pixels=24,
+        recrop_full_resolution=True
+    ),
+    "thorough": DetectionPreset(
+        name="thorough",
+        max_side=None,
+        scale_factor=1.1,
+        min_neighbors=5,
+        min_face_fraction=0.0,
+        max_face_fraction=None,
+        min_face_pixels=30,
+        recrop_full_resolution=True
+    ),
+}
+
+DEFAULT_PRESET = os.getenv("FACE_DETECTION_PRESET", "balanced")
+
+
+def get_preset(name: Optional[str] = None) -> DetectionPreset:
+    """
+    Look up a detection preset.
+
+    Args:
+        name: Preset name; defaults to the FACE_DETECTION_PRESET setting
+
+    Returns:
+        The preset
+    """
+    name = name or DEFAULT_PRESET
+    if name not in PRESETS:
+        raise ValueError(f"Unknown detection preset: {name}")
+    return PRESETS[name]
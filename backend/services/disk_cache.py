@@ -0,0 +1,105 @@
+"""
+Size-bounded directory of cache files with least-recently-used eviction.
+
+Files live in two-character shard directories under ``cache_dir``. A hit
+refreshes the file's mtime; when the total size grows past ``max_bytes``
+the oldest files are removed until the cache is at 90% of its bound. The
+size total is scanned once and then kept up to date in memory, so separate
+processes sharing a directory each enforce the bound from their own view.
+"""
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """Base of the on-disk caches (services.renditions, services.detection_cache)."""
+
+    def __init__(self, cache_dir: str, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._total_bytes: Optional[int] = None
+
+    def _lookup(self, path: str) -> bool:
+        """Count a hit and refresh its recency if ``path`` is cached, else count a miss."""
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def _stored(self, path: str) -> None:
+        """Account for a file just written to the cache, evicting if over the bound."""
+        written = os.path.getsize(path)
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_size()
+            else:
+                self._total_bytes += written
+            over = self._total_bytes > self.max_bytes
+        if over:
+            self.evict()
+
+    def _files(self) -> List[os.DirEntry]:
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for shard in os.scandir(self.cache_dir):
+            if shard.is_dir():
+                entries.extend(entry for entry in os.scandir(shard.path) if entry.is_file())
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(entry.stat().st_size for entry in self._files())
+
+    def evict(self) -> int:
+        """
+        Remove least recently used files until the cache is at 90% of its bound.
+
+        Returns:
+            Number of files removed
+        """
+        with self._lock:
+            entries = sorted(
+                ((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in self._files()),
+            )
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            removed = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+            self._total_bytes = total
+            self.evictions += removed
+        if removed:
+            logger.info(f"Evicted {removed} files from {self.cache_dir}")
+        return removed
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self._total_bytes if self._total_bytes is not None else -1,
+                "max_bytes": self.max_bytes
+            }
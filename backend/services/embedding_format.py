@@ -0,0 +1,181 @@
+"""
+Binary storage format for face embeddings.
+
+Layout (all little-endian)::
+
+    offset  size  field
+    0       4     magic b"FEMB"
+    4       1     format version (currently 1)
+    5       1     dtype code (1 = float32, 2 = float16)
+    6       2     pipeline version of the descriptor that produced the vector
+    8       4     dimension
+    12      4     L2 norm of the stored vector (float32)
+    16      ...   raw vector, dimension * itemsize bytes
+
+Decoding is a header parse plus np.frombuffer, so the returned array is a
+read-only view on the blob rather than a copy. Blobs written before this
+format existed are pickled numpy arrays; they are still readable through a
+restricted unpickler until the re-encoder has converted them.
+"""
+import io
+import os
+import pickle
+import struct
+from collections import namedtuple
+from typing import Sequence
+
+import numpy as np
+
+MAGIC = b"FEMB"
+FORMAT_VERSION = 1
+# Pipeline version of embeddings that do not carry one (legacy pickled pixel vectors)
+PIPELINE_VERSION = 1
+
+_HEADER = struct.Struct("<4sBBHIf")
+HEADER_SIZE = _HEADER.size
+_PIPELINE_VERSION_FIELD = struct.Struct("<H")
+# Where the pipeline version is, so it can be read without the payload (also in SQL)
+PIPELINE_VERSION_OFFSET = 6
+
+_DTYPES = {
+    1: np.dtype("<f4"),
+    2: np.dtype("<f2"),
+}
+_DTYPE_CODES = {dtype: code for code, dtype in _DTYPES.items()}
+
+# float16 halves storage again and is plenty for normalized pixel/histogram values
+DEFAULT_DTYPE = np.dtype("<f2") if os.getenv("EMBEDDING_DTYPE", "float16") == "float16" else np.dtype("<f4")
+
+EmbeddingHeader = namedtuple(
+    "EmbeddingHeader",
+    ["format_version", "dtype", "pipeline_version", "dimension", "norm"]
+)
+
+
+def encode_embedding(
+    embedding: np.ndarray,
+    dtype: np.dtype = DEFAULT_DTYPE,
+    pipeline_version: int = PIPELINE_VERSION
+) -> bytes:
+    """
+    Serialize an embedding into the versioned binary format.
+
+    Args:
+        embedding: 1-D embedding vector
+        dtype: Storage dtype, float32 or float16
+        pipeline_version: Version of the pipeline that produced the vector
+
+    Returns:
+        Header followed by the raw little-endian payload
+    """
+    dtype = np.dtype(dtype).newbyteorder("<")
+    if dtype not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype: {dtype}")
+
+    vector = np.ascontiguousarray(np.ravel(embedding), dtype=dtype)
+    norm = float(np.linalg.norm(vector.astype(np.float32)))
+    header = _HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        _DTYPE_CODES[dtype],
+        pipeline_version,
+        vector.shape[0],
+        norm
+    )
+    return header + vector.tobytes()
+
+
+def is_legacy(data: bytes) -> bool:
+    """Whether a blob predates the binary format (pickled array)."""
+    return bytes(data[:4]) != MAGIC
+
+
+def read_header(data: bytes) -> EmbeddingHeader:
+    """Parse the header of an encoded embedding without touching the payload."""
+    if is_legacy(data):
+        raise ValueError("Not a binary embedding blob")
+
+    magic, format_version, dtype_code, pipeline_version, dimension, norm = _HEADER.unpack_from(data)
+    if format_version != FORMAT_VERSION or dtype_code not in _DTYPES:
+        raise ValueError(f"Unsupported embedding format {format_version}/{dtype_code}")
+
+    return EmbeddingHeader(format_version, _DTYPES[dtype_code], pipeline_version, dimension, norm)
+
+
+def pipeline_version_of(data: bytes) -> int:
+    """Pipeline version of the descriptor that produced an embedding blob."""
+    if is_legacy(data):
+        return PIPELINE_VERSION
+    # Only the version field; called per row when scanning detections
+    return _PIPELINE_VERSION_FIELD.unpack_from(data, PIPELINE_VERSION_OFFSET)[0]
+
+
+def encode_pipeline_version(pipeline_version: int) -> bytes:
+    """The pipeline version field as stored at PIPELINE_VERSION_OFFSET."""
+    return _PIPELINE_VERSION_FIELD.pack(pipeline_version)
+
+
+def decode_embedding(data: bytes) -> np.ndarray:
+    """
+    Deserialize an embedding blob.
+
+    Args:
+        data: Blob produced by encode_embedding, or a legacy pickled array
+
+    Returns:
+        1-D array; for binary blobs this is a read-only view on ``data``
+    """
+    if is_legacy(data):
+        return _decode_legacy(data)
+
+    header = read_header(data)
+    return np.frombuffer(data, dtype=header.dtype, count=header.dimension, offset=HEADER_SIZE)
+
+
+def decode_embeddings(blobs: Sequence[bytes]) -> np.ndarray:
+    """
+    Deserialize many embedding blobs into one (N, D) matrix.
+
+    Blobs of one layout (same dtype, pipeline version and dimension) are
+    decoded with a single np.frombuffer over their concatenation instead of
+    a header parse per blob; anything else falls back to decode_embedding.
+
+    Returns:
+        (N, D) array in the blobs' storage dtype
+    """
+    if not blobs:
+        return np.empty((0, 0), dtype=np.float32)
+
+    first = blobs[0]
+    if not is_legacy(first):
+        # Everything but the per-vector norm must match
+        prefix = bytes(first[:12])
+        if all(len(blob) == len(first) and blob[:12] == prefix for blob in blobs):
+            header = read_header(first)
+            rows = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), len(first))
+            return np.ascontiguousarray(rows[:, HEADER_SIZE:]).view(header.dtype)
+
+    return np.stack([decode_embedding(blob) for blob in blobs])
+
+
+class _NumpyUnpickler(pickle.Unpickler):
+    """Unpickler that only reconstructs plain numpy arrays."""
+
+    _ALLOWED = {
+        ("numpy", "ndarray"),
+        ("numpy", "dtype"),
+        ("numpy.core.multiarray", "_reconstruct"),
+        ("numpy._core.multiarray", "_reconstruct"),
+    }
+
+    def find_class(self, module, name):
+        if (module, name) not in self._ALLOWED:
+            raise pickle.UnpicklingError(f"Refusing to load {module}.{name} from embedding blob")
+        return super().find_class(module, name)
+
+
+def _decode_legacy(data: bytes) -> np.ndarray:
+    embedding = _NumpyUnpickler(io.BytesIO(data)).load()
+    if not isinstance(embedding, np.ndarray):
+        raise ValueError("Legacy embedding blob does not contain an array")
+    return embedding
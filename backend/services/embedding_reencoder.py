@@ -0,0 +1,364 @@
+"""
+Batched maintenance of stored embedding blobs.
+
+* Re-encoding converts legacy pickled blobs to the binary format.
+* Re-describing recomputes embeddings made by another descriptor than the
+  active one (see services.face_descriptors) from the original photos, then
+  copies each face's embedding from one of its detections and recomputes
+  the cluster means from their members.
+
+Rows are walked in primary-key order in fixed-size batches, each batch is a
+separate short transaction, and rows that are already up to date are left
+untouched, so the jobs can run next to live traffic, be interrupted and be
+restarted at any time.
+
+This is a one-shot maintenance command, run once after upgrading or after
+changing FACE_DESCRIPTOR; the API does not start it. Running API workers
+pick up the results without a restart: re-described faces and clusters get
+a new updated_at, which changes the versions their caches are checked
+against (services.gallery_cache, services.face_clustering), and the
+detection search indexes are invalidated once the pass is done
+(services.detection_index). Until it has run, check_embeddings stops the
+API from starting with a descriptor none of the stored faces were made by.
+
+Usage (from backend/):
+    python -m services.embedding_reencoder [--batch-size 500] [--redescribe]
+"""
+import argparse
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from sqlalchemy import bindparam, column, func, select, table
+from sqlalchemy.engine import Connection, Engine
+
+from services.embedding_format import (
+    HEADER_SIZE,
+    decode_embedding,
+    encode_embedding,
+    is_legacy,
+    pipeline_version_of,
+)
+from services.face_matching import normalize_embeddings
+
+logger = logging.getLogger(__name__)
+
+# (table, primary key, blob column) holding embeddings
+EMBEDDING_COLUMNS = [
+    ("faces", "face_id", "face_embedding"),
+    ("face_detections", "detection_id", "embedding"),
+]
+
+
+class EmbeddingsOutOfDate(RuntimeError):
+    pass
+
+
+def check_embeddings(engine: Engine, descriptor) -> None:
+    """
+    Check that the stored faces were described by ``descriptor``.
+
+    Galleries skip faces of other descriptors, so a deployment that changed
+    FACE_DESCRIPTOR without re-describing would match nothing. Only the
+    headers of the faces are read; faces are few compared to detections.
+
+    Raises:
+        EmbeddingsOutOfDate: Faces are stored but none by ``descriptor``;
+            run ``python -m services.embedding_reencoder --redescribe``
+    """
+    faces = table("faces", column("face_embedding"))
+    with engine.connect() as connection:
+        headers = connection.execute(
+            select(func.substr(faces.c.face_embedding, 1, HEADER_SIZE))
+        ).scalars().all()
+
+    stale = sum(pipeline_version_of(header) != descriptor.pipeline_version for header in headers)
+    if stale and stale == len(headers):
+        raise EmbeddingsOutOfDate(
+            f"None of the {stale} stored faces were described by the {descriptor.name} descriptor "
+            "(FACE_DESCRIPTOR). Run 'python -m services.embedding_reencoder --redescribe' from "
+            "backend/ before starting the API."
+        )
+    if stale:
+        logger.warning(f"{stale} stored faces were not described by the {descriptor.name} descriptor; "
+                       "run 'python -m services.embedding_reencoder --redescribe'")
+
+
+def reencode_batch(
+    connection: Connection,
+    table_name: str,
+    pk_name: str,
+    blob_name: str,
+    after_pk: int,
+    batch_size: int
+) -> Optional[int]:
+    """
+    Convert one batch of rows with primary key greater than ``after_pk``.
+
+    Returns:
+        Last primary key seen, or None when the table is exhausted. The
+        number of converted rows is logged by the caller.
+    """
+    target = table(table_name, column(pk_name), column(blob_name))
+    pk = target.c[pk_name]
+    blob = target.c[blob_name]
+
+    rows = connection.execute(
+        select(pk, blob).where(pk > after_pk).order_by(pk).limit(batch_size)
+    ).all()
+    if not rows:
+        return None
+
+    updates = [
+        {"_pk": row[0], "_blob": encode_embedding(decode_embedding(row[1]))}
+        for row in rows
+        if row[1] is not None and is_legacy(row[1])
+    ]
+    if updates:
+        connection.execute(
+            target.update().where(pk == bindparam("_pk")).values({blob_name: bindparam("_blob")}),
+            updates
+        )
+        logger.info(f"Re-encoded {len(updates)} embeddings in {table_name} up to {pk_name}={rows[-1][0]}")
+
+    return rows[-1][0]
+
+
+def reencode_all(engine: Engine, batch_size: int = 500, pause: float = 0.0) -> Dict[str, int]:
+    """
+    Convert every legacy embedding blob, one transaction per batch.
+
+    Args:
+        engine: Database engine
+        batch_size: Rows read per batch
+        pause: Seconds to sleep between batches to leave room for other writers
+
+    Returns:
+        Number of batches processed per table
+    """
+    batches = {}
+    for table_name, pk_name, blob_name in EMBEDDING_COLUMNS:
+        after_pk = 0
+        batches[table_name] = 0
+        while True:
+            with engine.begin() as connection:
+                after_pk = reencode_batch(connection, table_name, pk_name, blob_name, after_pk, batch_size)
+            if after_pk is None:
+                break
+            batches[table_name] += 1
+            if pause:
+                time.sleep(pause)
+    return batches
+
+
+def redescribe_detections_batch(
+    connection: Connection,
+    descriptor,
+    after_pk: int,
+    batch_size: int
+) -> Optional[int]:
+    """
+    Recompute stale detection embeddings with primary key greater than ``after_pk``.
+
+    Each photo of the batch is decoded once; detections whose photo file is
+    missing keep their stale embedding.
+
+    Returns:
+        Last detection_id seen, or None when the table is exhausted
+    """
+    detections = table(
+        "face_detections",
+        column("detection_id"), column("photo_id"), column("embedding"),
+        column("bounding_box_x"), column("bounding_box_y"),
+        column("bounding_box_width"), column("bounding_box_height")
+    )
+    photos = table("photos", column("photo_id"), column("storage_path"))
+
+    rows = connection.execute(
+        select(detections, photos.c.storage_path)
+        .join(photos, photos.c.photo_id == detections.c.photo_id)
+        .where(detections.c.detection_id > after_pk)
+        .order_by(detections.c.detection_id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None
+
+    images = {}
+    updates = []
+    for row in rows:
+        if pipeline_version_of(row.embedding) == descriptor.pipeline_version:
+            continue
+        if row.storage_path not in images:
+            images[row.storage_path] = cv2.imread(row.storage_path, cv2.IMREAD_GRAYSCALE)
+        gray = images[row.storage_path]
+        if gray is None:
+            continue
+
+        x, y = int(row.bounding_box_x), int(row.bounding_box_y)
+        w, h = int(row.bounding_box_width), int(row.bounding_box_height)
+        embedding = descriptor.describe(gray[y:y + h, x:x + w])
+        updates.append({
+            "_pk": row.detection_id,
+            "_blob": encode_embedding(embedding, pipeline_version=descriptor.pipeline_version)
+        })
+
+    if updates:
+        connection.execute(
+            detections.update()
+            .where(detections.c.detection_id == bindparam("_pk"))
+            .values(embedding=bindparam("_blob")),
+            updates
+        )
+        logger.info(f"Re-described {len(updates)} detections up to detection_id={rows[-1].detection_id}")
+
+    return rows[-1].detection_id
+
+
+def redescribe_faces_batch(
+    connection: Connection,
+    descriptor,
+    after_pk: int,
+    batch_size: int
+) -> Optional[int]:
+    """
+    Refresh stale face embeddings from an up-to-date detection of the same face.
+
+    Returns:
+        Last face_id seen, or None when the table is exhausted
+    """
+    faces = table("faces", column("face_id"), column("face_embedding"), column("updated_at"))
+    detections = table("face_detections", column("detection_id"), column("face_id"), column("embedding"))
+
+    rows = connection.execute(
+        select(faces.c.face_id, faces.c.face_embedding)
+        .where(faces.c.face_id > after_pk)
+        .order_by(faces.c.face_id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None
+
+    stale_ids = [
+        row.face_id for row in rows
+        if pipeline_version_of(row.face_embedding) != descriptor.pipeline_version
+    ]
+    updates = {}
+    if stale_ids:
+        candidates = connection.execute(
+            select(detections.c.face_id, detections.c.embedding)
+            .where(detections.c.face_id.in_(stale_ids))
+            .order_by(detections.c.detection_id)
+        )
+        for face_id, embedding in candidates:
+            if face_id not in updates and pipeline_version_of(embedding) == descriptor.pipeline_version:
+                updates[face_id] = embedding
+
+    if updates:
+        connection.execute(
+            faces.update()
+            .where(faces.c.face_id == bindparam("_pk"))
+            .values(face_embedding=bindparam("_blob"), updated_at=func.now()),
+            [{"_pk": face_id, "_blob": blob} for face_id, blob in updates.items()]
+        )
+        logger.info(f"Re-described {len(updates)} faces up to face_id={rows[-1].face_id}")
+
+    return rows[-1].face_id
+
+
+def redescribe_clusters_batch(
+    connection: Connection,
+    descriptor,
+    after_pk: int,
+    batch_size: int
+) -> Optional[int]:
+    """
+    Recompute stale cluster means from the up-to-date embeddings of their members.
+
+    Returns:
+        Last cluster_id seen, or None when the table is exhausted
+    """
+    clusters = table("face_clusters", column("cluster_id"), column("centroid"), column("updated_at"))
+    detections = table("face_detections", column("detection_id"), column("cluster_id"), column("embedding"))
+
+    rows = connection.execute(
+        select(clusters.c.cluster_id, clusters.c.centroid)
+        .where(clusters.c.cluster_id > after_pk)
+        .order_by(clusters.c.cluster_id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return None
+
+    stale_ids = [
+        row.cluster_id for row in rows
+        if pipeline_version_of(row.centroid) != descriptor.pipeline_version
+    ]
+    members = defaultdict(list)
+    if stale_ids:
+        for cluster_id, embedding in connection.execute(
+            select(detections.c.cluster_id, detections.c.embedding)
+            .where(detections.c.cluster_id.in_(stale_ids))
+            .order_by(detections.c.detection_id)
+        ):
+            if pipeline_version_of(embedding) == descriptor.pipeline_version:
+                members[cluster_id].append(decode_embedding(embedding))
+
+    if members:
+        # Same mean of normalized embeddings that services.face_clustering keeps
+        updates = [
+            {
+                "_pk": cluster_id,
+                "_blob": encode_embedding(
+                    normalize_embeddings(vectors).mean(axis=0), np.float32, descriptor.pipeline_version
+                )
+            }
+            for cluster_id, vectors in members.items()
+        ]
+        connection.execute(
+            clusters.update()
+            .where(clusters.c.cluster_id == bindparam("_pk"))
+            .values(centroid=bindparam("_blob"), updated_at=func.now()),
+            updates
+        )
+        logger.info(f"Re-described {len(updates)} clusters up to cluster_id={rows[-1].cluster_id}")
+
+    return rows[-1].cluster_id
+
+
+def redescribe_all(engine: Engine, descriptor, batch_size: int = 200, pause: float = 0.0) -> None:
+    """
+    Recompute every embedding not produced by ``descriptor``, detections first.
+
+    Detection search indexes are invalidated at the end: the detections were
+    rewritten in place, below the ids the indexes had already caught up to.
+    """
+    from services.detection_index import detection_index
+
+    for batch in (redescribe_detections_batch, redescribe_faces_batch, redescribe_clusters_batch):
+        after_pk = 0
+        while after_pk is not None:
+            with engine.begin() as connection:
+                after_pk = batch(connection, descriptor, after_pk, batch_size)
+            if pause:
+                time.sleep(pause)
+    detection_index.invalidate_all()
+
+
+if __name__ == "__main__":
+    from database.database import engine
+
+    parser = argparse.ArgumentParser(description="Convert pickled embeddings to the binary format")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--redescribe", action="store_true", help="Also recompute embeddings of other descriptors")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(reencode_all(engine, batch_size=args.batch_size))
+    if args.redescribe:
+        from services.face_descriptors import get_descriptor
+
+        redescribe_all(engine, get_descriptor(), batch_size=args.batch_size)
@@ -0,0 +1,335 @@
+"""
+Incremental clustering of unidentified faces into suggested people.
+
+A detection that matches no named face joins the closest cluster of the
+user's unknown faces, or starts a new one. A cluster keeps the running mean
+of its members' normalized embeddings, and new detections are compared with
+these means only, searched through a per-user index like the face
+galleries (services.gallery_cache). Assigning a detection costs one index
+search and one cluster row update instead of a comparison with every
+unidentified detection, and memory grows with the number of clusters, not
+with the square of the number of detections.
+
+Clustering is greedy: a detection stays where it was put, and the
+representative shown for a cluster is the member that was closest to the
+mean when it joined. Naming a cluster (POST /faces/clusters/{id}/name)
+identifies all of its members with one UPDATE.
+
+Centroids record the descriptor pipeline version (services.embedding_format);
+clusters of another pipeline are not searched until the re-describe pass of
+services.embedding_reencoder recomputes them. ``backfill --rebuild``
+re-clusters a user from scratch.
+
+The cached index of a user's cluster means is checked against
+cluster_version (count, highest id and last update of the clusters) before
+each batch, so clusters created or moved by other workers, or re-described,
+are picked up.
+
+Settings:
+    FACE_CLUSTER_THRESHOLD     minimum correlation with a cluster mean to join (default: the
+                               cluster_threshold calibrated for the descriptor, see
+                               services.face_descriptors)
+    FACE_CLUSTER_CACHE_MAX_MB  size bound of the cached cluster indexes (default 128)
+
+Usage (from backend/):
+    python -m services.face_clustering backfill --user-id 1 [--batch-size 1000] [--rebuild]
+"""
+import argparse
+import logging
+import os
+from collections import defaultdict
+from typing import Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.face import FaceCluster, FaceDetection
+from models.photo import Photo
+from services.embedding_format import decode_embedding, encode_embedding, pipeline_version_of
+from services.face_matching import normalize_embeddings
+from services.gallery_cache import Gallery, GalleryCache
+
+logger = logging.getLogger(__name__)
+
+# Per-user indexes of cluster means, keyed by cluster_id
+cluster_cache = GalleryCache(
+    max_bytes=int(os.getenv("FACE_CLUSTER_CACHE_MAX_MB", "128")) * 1024 * 1024
+)
+
+
+def load_clusters(db: Session, user_id: int, pipeline_version: int) -> Gallery:
+    """
+    Build the index of a user's cluster means from the database.
+
+    Args:
+        db: Database session
+        user_id: Owner of the clusters
+        pipeline_version: Active descriptor pipeline; clusters of others are skipped
+
+    Returns:
+        Gallery keyed by cluster_id
+    """
+    cluster_ids, centroids = [], []
+    for cluster_id, centroid in db.query(FaceCluster.cluster_id, FaceCluster.centroid).filter(
+        FaceCluster.user_id == user_id
+    ).order_by(FaceCluster.cluster_id).yield_per(1000):
+        if pipeline_version_of(centroid) == pipeline_version:
+            cluster_ids.append(cluster_id)
+            centroids.append(decode_embedding(centroid))
+
+    if not cluster_ids:
+        return Gallery(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+    return Gallery(np.array(cluster_ids, dtype=np.int64), normalize_embeddings(centroids))
+
+
+def cluster_version(db: Session, user_id: int) -> Tuple:
+    """Cheap fingerprint of a user's clusters for cluster_cache (see gallery_version)."""
+    return tuple(db.query(
+        func.count(FaceCluster.cluster_id), func.max(FaceCluster.cluster_id), func.max(FaceCluster.updated_at)
+    ).filter(FaceCluster.user_id == user_id).one())
+
+
+def assign_detections(
+    db: Session,
+    user_id: int,
+    detections: Sequence[FaceDetection],
+    embeddings: Sequence[np.ndarray],
+    pipeline_version: int,
+    threshold: float
+) -> int:
+    """
+    Put unidentified detections into their closest cluster, or new clusters.
+
+    Detections are assigned one after another, so faces of the same new
+    person within a batch end up together. The changes are left in the
+    session for the caller to commit; invalidate the user in cluster_cache
+    if the transaction is rolled back instead.
+
+    Args:
+        db: Database session
+        user_id: Owner of the detections
+        detections: Flushed detections (with ids)
+        embeddings: Their embeddings, made by the active descriptor
+        pipeline_version: Pipeline version of the embeddings
+        threshold: Minimum correlation with a cluster mean to join it; stricter
+            than the match threshold, as a wrong join drags the mean towards
+            another person
+
+    Returns:
+        Number of clusters created
+    """
+    if not len(detections):
+        return 0
+
+    gallery = cluster_cache.get_or_load(
+        user_id,
+        lambda: load_clusters(db, user_id, pipeline_version),
+        version=cluster_version(db, user_id)
+    )
+    created = 0
+    # Clusters touched by this batch; the session's identity map only holds weak references
+    clusters = {}
+    for detection, vector in zip(detections, normalize_embeddings(embeddings)):
+        scores, cluster_ids = gallery.search(vector[np.newaxis], top_k=1)
+        cluster = None
+        if scores[0, 0] >= threshold:
+            cluster_id = int(cluster_ids[0, 0])
+            if cluster_id not in clusters:
+                # None if the row was deleted meanwhile
+                clusters[cluster_id] = db.get(FaceCluster, cluster_id)
+            cluster = clusters[cluster_id]
+        if cluster is None:
+            # Inserted with its first member, so only later joins update the row
+            cluster = FaceCluster(
+                user_id=user_id,
+                size=1,
+                centroid=encode_embedding(vector, np.float32, pipeline_version),
+                representative_detection_id=detection.detection_id,
+                representative_score=1.0
+            )
+            db.add(cluster)
+            # Its id keys the index before the next detection is searched
+            db.flush()
+            clusters[cluster.cluster_id] = cluster
+            created += 1
+            detection.cluster_id = cluster.cluster_id
+            gallery.add_face(cluster.cluster_id, vector)
+            continue
+
+        gallery.add_face(cluster.cluster_id, _join(cluster, detection, vector, pipeline_version))
+
+    # The index grew in place; account for its new size, under the version including these changes
+    db.flush()
+    cluster_cache.put(user_id, gallery, version=cluster_version(db, user_id))
+    return created
+
+
+def _join(cluster: FaceCluster, detection: FaceDetection, vector: np.ndarray, pipeline_version: int) -> np.ndarray:
+    """Add a normalized embedding to a cluster's running mean and return the new mean."""
+    size = cluster.size or 0
+    mean = np.array(decode_embedding(cluster.centroid), dtype=np.float32)
+    mean += (vector - mean) / (size + 1)
+    cluster.centroid = encode_embedding(mean, np.float32, pipeline_version)
+    cluster.size = size + 1
+
+    score = float(normalize_embeddings(mean)[0] @ vector)
+    if cluster.representative_score is None or score > cluster.representative_score:
+        cluster.representative_detection_id = detection.detection_id
+        cluster.representative_score = score
+    detection.cluster_id = cluster.cluster_id
+    return mean
+
+
+def detach_detections(db: Session, user_id: int, detections: Sequence) -> None:
+    """
+    Take detections out of their clusters, e.g. once they are identified.
+
+    Members' embeddings are subtracted from the cluster means and emptied
+    clusters are deleted. The detections themselves are not changed: the
+    caller clears their cluster_id (on the objects or with an UPDATE) and
+    commits.
+
+    Args:
+        db: Database session
+        user_id: Owner of the detections
+        detections: FaceDetection objects or rows with detection_id, cluster_id and embedding
+    """
+    members = defaultdict(list)
+    for detection in detections:
+        if detection.cluster_id is not None:
+            members[detection.cluster_id].append(detection)
+    if not members:
+        return
+
+    # New means by cluster_id, None for deleted clusters
+    means = {}
+    for cluster_id, leaving in members.items():
+        cluster = db.get(FaceCluster, cluster_id)
+        if cluster is None:
+            continue
+
+        remaining = (cluster.size or 0) - len(leaving)
+        if remaining <= 0:
+            db.delete(cluster)
+            means[cluster_id] = None
+            continue
+
+        # Members made by the cluster's own pipeline leave the mean; others never entered it
+        version = pipeline_version_of(cluster.centroid)
+        current = [d.embedding for d in leaving if pipeline_version_of(d.embedding) == version]
+        mean = np.array(decode_embedding(cluster.centroid), dtype=np.float32)
+        if current:
+            vectors = normalize_embeddings([decode_embedding(data) for data in current])
+            mean = (mean * cluster.size - vectors.sum(axis=0)) / remaining
+            cluster.centroid = encode_embedding(mean, np.float32, version)
+        cluster.size = remaining
+
+        leaving_ids = [d.detection_id for d in leaving]
+        if cluster.representative_detection_id in leaving_ids:
+            cluster.representative_detection_id = db.query(FaceDetection.detection_id).filter(
+                FaceDetection.cluster_id == cluster_id,
+                FaceDetection.detection_id.notin_(leaving_ids)
+            ).limit(1).scalar()
+            cluster.representative_score = None
+        means[cluster_id] = mean
+
+    # Write through under the version including these changes (see assign_detections)
+    db.flush()
+    version = cluster_version(db, user_id)
+    for cluster_id, mean in means.items():
+        if mean is None:
+            cluster_cache.remove_face(user_id, cluster_id, version=version)
+        else:
+            cluster_cache.add_face(user_id, cluster_id, mean, version=version)
+
+
+def backfill(
+    db: Session,
+    user_id: int,
+    pipeline_version: int,
+    threshold: float,
+    batch_size: int = 1000,
+    rebuild: bool = False
+) -> Tuple[int, int]:
+    """
+    Cluster a user's unidentified detections that are in no cluster yet.
+
+    Detections are read in detection_id order, ``batch_size`` at a time,
+    and each batch is committed on its own.
+
+    Args:
+        db: Database session
+        user_id: Owner of the detections
+        pipeline_version: Active descriptor pipeline; other embeddings are skipped
+        threshold: Minimum correlation with a cluster mean to join it
+        batch_size: Detections per transaction
+        rebuild: Delete the user's clusters first
+
+    Returns:
+        (detections assigned, clusters created)
+    """
+    if rebuild:
+        cluster_ids = db.query(FaceCluster.cluster_id).filter(FaceCluster.user_id == user_id)
+        db.query(FaceDetection).filter(FaceDetection.cluster_id.in_(cluster_ids.scalar_subquery())).update(
+            {FaceDetection.cluster_id: None}, synchronize_session=False
+        )
+        db.query(FaceCluster).filter(FaceCluster.user_id == user_id).delete(synchronize_session=False)
+        db.commit()
+        cluster_cache.invalidate(user_id)
+
+    assigned, created = 0, 0
+    after_id = 0
+    while True:
+        batch = db.query(FaceDetection).join(Photo).filter(
+            Photo.user_id == user_id,
+            FaceDetection.face_id.is_(None),
+            FaceDetection.cluster_id.is_(None),
+            FaceDetection.detection_id > after_id
+        ).order_by(FaceDetection.detection_id).limit(batch_size).all()
+        if not batch:
+            return assigned, created
+        after_id = batch[-1].detection_id
+
+        current = [d for d in batch if pipeline_version_of(d.embedding) == pipeline_version]
+        try:
+            created += assign_detections(
+                db, user_id, current, [decode_embedding(d.embedding) for d in current], pipeline_version, threshold
+            )
+            db.commit()
+        except Exception:
+            cluster_cache.invalidate(user_id)
+            raise
+        assigned += len(current)
+        # Keep the session from growing with every batch
+        db.expunge_all()
+        logger.info(f"Clustered {assigned} detections of user {user_id} into {created} new clusters")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain clusters of unidentified faces")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Cluster detections processed before clustering")
+    backfill_parser.add_argument("--user-id", type=int, required=True)
+    backfill_parser.add_argument("--batch-size", type=int, default=1000)
+    backfill_parser.add_argument("--rebuild", action="store_true", help="Delete the user's clusters first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from database.database import SessionLocal
+    from services.face_descriptors import get_descriptor, threshold_setting
+
+    descriptor = get_descriptor()
+    session = SessionLocal()
+    try:
+        assigned, created = backfill(
+            session,
+            args.user_id,
+            descriptor.pipeline_version,
+            threshold_setting("FACE_CLUSTER_THRESHOLD", descriptor.cluster_threshold),
+            args.batch_size,
+            args.rebuild
+        )
+    finally:
+        session.close()
+    print(f"Clustered {assigned} detections, {created} new clusters")
@@ -0,0 +1,140 @@
+"""
+Face descriptors: turn a grayscale face crop into a fixed-length vector.
+
+Available descriptors, selected per deployment with ``FACE_DESCRIPTOR``:
+
+* ``lbp``   - spatial histograms of uniform local binary patterns on a 3x3
+  grid (531 values, ~19x smaller, far better rank-1 accuracy). Default.
+* ``pixel`` - the original flattened 100x100 crop (10,000 values). Every
+  embedding stored before descriptors existed is one; deployments upgrading
+  from then re-describe them once (below), or keep ``pixel`` explicitly.
+
+Every descriptor has a ``pipeline_version`` that is stamped into the stored
+embedding header (see services.embedding_format). Embeddings produced by
+different descriptors are not comparable and are never matched against each
+other. After changing FACE_DESCRIPTOR, recompute the stored embeddings once
+with ``python -m services.embedding_reencoder --redescribe``; until then the
+API refuses to start (services.embedding_reencoder.check_embeddings).
+
+Scores of unrelated faces differ a lot between descriptors, so each one
+carries its own ``similarity_threshold`` for matching named faces and a
+stricter ``cluster_threshold`` for joining a cluster of unknown faces,
+calibrated with benchmarks.bench_descriptors. They apply when
+``FACE_SIMILARITY_THRESHOLD`` and ``FACE_CLUSTER_THRESHOLD`` are unset;
+re-calibrate on real crops with ``--dataset`` before overriding them.
+"""
+import os
+from typing import Optional
+
+import cv2
+import numpy as np
+
+# Pipeline versions stamped on stored embeddings
+PIXEL_PIPELINE_VERSION = 1
+LBP_PIPELINE_VERSION = 2
+
+
+def _build_uniform_table() -> np.ndarray:
+    """Map each 8-bit LBP code to its uniform-pattern bin (0-58)."""
+    table = np.empty(256, dtype=np.int64)
+    next_bin = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            table[code] = next_bin
+            next_bin += 1
+        else:
+            table[code] = -1
+    # All non-uniform patterns share the last bin
+    table[table == -1] = next_bin
+    return table
+
+
+class PixelDescriptor:
+    """Flattened, [0, 1]-scaled 100x100 crop."""
+
+    name = "pixel"
+    version = "pixel-100x100/v1"
+    pipeline_version = PIXEL_PIPELINE_VERSION
+    dimension = 100 * 100
+    # Calibrated with benchmarks.bench_descriptors at a 0.1% false-accept rate
+    similarity_threshold = 0.7
+    # and against cluster means at 0.01%
+    cluster_threshold = 0.74
+
+    def describe(self, face_gray: np.ndarray) -> np.ndarray:
+        face_resized = cv2.resize(face_gray, (100, 100))
+        return face_resized.flatten() / 255.0
+
+
+class LBPDescriptor:
+    """Spatial histograms of uniform LBP codes (radius 2, 8 neighbours)."""
+
+    name = "lbp"
+    version = "lbp-u2-3x3-r2/v1"
+    pipeline_version = LBP_PIPELINE_VERSION
+
+    GRID = 3
+    CELL = 32
+    RADIUS = 2
+    BINS = 59
+    dimension = GRID * GRID * BINS
+    # Histograms of unrelated faces still correlate strongly (mean ~0.73);
+    # calibrated with benchmarks.bench_descriptors at a 0.1% false-accept rate
+    similarity_threshold = 0.82
+    # Means of several faces score even higher (p99.9 ~0.84); 0.01% against cluster means
+    cluster_threshold = 0.85
+
+    # Neighbour directions (dy, dx), clockwise from the top-left pixel
+    _DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+    _UNIFORM = _build_uniform_table()
+
+    def __init__(self):
+        side = self.GRID * self.CELL
+        rows, cols = np.divmod(np.arange(side * side), side)
+        # Histogram slot offset of every interior pixel
+        self._cell_offsets = ((rows // self.CELL) * self.GRID + cols // self.CELL) * self.BINS
+
+    def describe(self, face_gray: np.ndarray) -> np.ndarray:
+        side = self.GRID * self.CELL
+        r = self.RADIUS
+        # Border of RADIUS pixels so every interior pixel has all neighbours
+        image = cv2.resize(face_gray, (side + 2 * r, side + 2 * r)).astype(np.float32)
+        # Pixel-level noise otherwise flips a large share of the comparisons
+        image = cv2.GaussianBlur(image, (0, 0), 1.5)
+        center = image[r:-r, r:-r]
+
+        codes = np.zeros((side, side), dtype=np.uint8)
+        for bit, (dy, dx) in enumerate(self._DIRECTIONS):
+            neighbour = image[r + dy * r:r + dy * r + side, r + dx * r:r + dx * r + side]
+            codes |= (neighbour >= center).astype(np.uint8) << bit
+
+        slots = self._cell_offsets + self._UNIFORM[codes.ravel()]
+        histogram = np.bincount(slots, minlength=self.dimension).astype(np.float32)
+        # Square root (Hellinger) keeps dominant flat-region bins from swamping the rest
+        return np.sqrt(histogram / (self.CELL * self.CELL))
+
+
+def threshold_setting(name: str, calibrated: float) -> float:
+    """The threshold set in the ``name`` setting, or ``calibrated`` when unset."""
+    value = os.getenv(name)
+    return float(value) if value else calibrated
+
+
+def get_descriptor(name: Optional[str] = None):
+    """
+    Create the descriptor configured for this deployment.
+
+    Args:
+        name: Descriptor name; defaults to the FACE_DESCRIPTOR setting
+
+    Returns:
+        Descriptor instance exposing describe(), dimension and pipeline_version
+    """
+    name = name or os.getenv("FACE_DESCRIPTOR", "lbp")
+    if name == "pixel":
+        return PixelDescriptor()
+    if name == "lbp":
+        return LBPDescriptor()
+    raise ValueError(f"Unknown face descriptor: {name}")
@@ -0,0 +1,91 @@
+"""
+Vectorized matching of face embeddings.
+
+Similarity scale
+----------------
+All scores produced here are Pearson correlations between two embeddings:
+each vector is mean-centred and scaled to unit L2 norm, so the score is a
+plain dot product in the range [-1.0, 1.0]. A score of 1.0 means the two
+embeddings are identical up to brightness/contrast, 0.0 means unrelated and
+negative values mean anti-correlated. Thresholds such as
+``FACE_SIMILARITY_THRESHOLD`` are expressed on this scale. Where unrelated
+faces land on it depends on the descriptor (see services.face_descriptors).
+"""
+from typing import Sequence, Tuple, Union
+
+import numpy as np
+
+EmbeddingBatch = Union[np.ndarray, Sequence[np.ndarray]]
+
+
+def normalize_embeddings(embeddings: EmbeddingBatch) -> np.ndarray:
+    """
+    Stack embeddings into a float32 matrix of centred, unit-norm rows.
+
+    Args:
+        embeddings: A single (D,) vector, an (N, D) matrix or a list of (D,) vectors
+
+    Returns:
+        (N, D) float32 matrix ready to be used with match_embeddings
+    """
+    matrix = np.array(embeddings, dtype=np.float32, ndmin=2)
+    if matrix.size == 0:
+        return matrix
+
+    matrix -= matrix.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    # Constant vectors have no direction; leave them as zeros (score 0.0)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def match_embeddings(
+    queries: EmbeddingBatch,
+    gallery: EmbeddingBatch,
+    top_k: int = 1,
+    normalized: bool = False
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every query against every gallery embedding and keep the best k.
+
+    Args:
+        queries: (M, D) query embeddings, e.g. all faces found in one photo
+        gallery: (N, D) gallery embeddings, e.g. all named faces of a user
+        top_k: Number of best matches to return per query
+        normalized: Set when both inputs already went through normalize_embeddings
+
+    Returns:
+        Tuple of (scores, indices), both shaped (M, min(top_k, N)) and sorted
+        by descending score; indices refer to rows of the gallery
+    """
+    if not normalized:
+        queries = normalize_embeddings(queries)
+        gallery = normalize_embeddings(gallery)
+
+    num_queries = queries.shape[0]
+    num_gallery = gallery.shape[0]
+    k = min(max(top_k, 0), num_gallery)
+
+    if num_queries == 0 or k == 0:
+        return (
+            np.empty((num_queries, 0), dtype=np.float32),
+            np.empty((num_queries, 0), dtype=np.int64)
+        )
+
+    # One matrix product scores the whole batch
+    scores = queries @ gallery.T
+
+    if k < num_gallery:
+        # Partial selection: O(N) per query instead of a full sort
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(num_gallery), (num_queries, 1))
+
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+
+    return (
+        np.take_along_axis(top_scores, order, axis=1),
+        np.take_along_axis(indices, order, axis=1)
+    )
@@ -1,14 +1,21 @@
 import os
 import numpy as np
-import pickle
-from typing import List, Tuple
+from typing import List, Optional, Sequence, Tuple
 import cv2
 import logging
 from fastapi import UploadFile, HTTPException
-from PIL import Image
-import io
+from starlette.concurrency import run_in_threadpool
 import time
 
+from services.detection_cache import detection_cache
+from services.detection_executor import detection_executor
+from services.detection_presets import get_preset
+from services.embedding_format import decode_embedding, encode_embedding, pipeline_version_of
+from services.face_descriptors import get_descriptor, threshold_setting
+from services.face_matching import match_embeddings
+from services.ingest_pipeline import IngestResult
+from services.upload_service import stream_upload
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -21,83 +28,263 @@ class FaceRecognitionService:
             cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
         )
         
-        self.face_recognizer = cv2.face.LBPHFaceRecognizer_create()
-        self.distance_metric = "euclidean"
-        self.similarity_threshold = 0.6
+        # Turns face crops into compact fixed-length vectors (FACE_DESCRIPTOR)
+        self.descriptor = get_descriptor()
+        # Minimum Pearson correlation (see services.face_matching) for a match,
+        # by default the one calibrated for the descriptor
+        self.similarity_threshold = threshold_setting(
+            "FACE_SIMILARITY_THRESHOLD", self.descriptor.similarity_threshold
+        )
+        # Minimum correlation with a cluster mean to join the cluster (see services.face_clustering)
+        self.cluster_threshold = threshold_setting(
+            "FACE_CLUSTER_THRESHOLD", self.descriptor.cluster_threshold
+        )
         
         # Ensure models directory exists
         models_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
         os.makedirs(models_path, exist_ok=True)
         
-        logger.info(f"OpenCV Face recognition service initialized")
+        logger.info(f"OpenCV Face recognition service initialized with {self.descriptor.version} descriptor")
 
-    async def detect_faces(self, image_path: str) -> List[dict]:
+    async def detect_faces(
+        self,
+        image_path: str,
+        preset: Optional[str] = None,
+        content_hash: Optional[str] = None
+    ) -> List[dict]:
         """
         Detect faces in an image and return face locations and features.
         
+        The work runs in the detection worker pool (services.detection_executor)
+        so the event loop keeps serving other requests meanwhile. With a
+        content hash, results are served from and stored in the detection
+        cache (services.detection_cache).
+        
         Args:
             image_path: Path to the image file
+            preset: Detection preset name (services.detection_presets); defaults
+                to FACE_DETECTION_PRESET
+            content_hash: SHA-256 of the file, enables the detection cache
             
         Returns:
             List of dictionaries containing face location and features
         """
         try:
-            # Measure processing time
-            start_time = time.time()
+            keys, cached, boxes = await self._cached_detections(content_hash, preset)
+            if cached is not None:
+                return cached
+            detections = await detection_executor.detect(image_path, preset, boxes)
+            await self._cache_detections(keys, detections)
+            return detections
+        except Exception as e:
+            logger.error(f"Error detecting faces: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Face detection failed: {str(e)}")
+    
+    async def ingest_photo(
+        self,
+        image_path: str,
+        preset: Optional[str] = None,
+        rendition_sizes: Sequence[int] = (),
+        content_hash: Optional[str] = None
+    ) -> IngestResult:
+        """
+        Detect faces and generate missing renditions from a single decode.
+        
+        Runs services.ingest_pipeline on the detection worker pool, unless
+        the detections are cached (services.detection_cache); the photo is
+        then not read at all.
+        
+        Args:
+            image_path: Path to the image file
+            preset: Detection preset name; defaults to FACE_DETECTION_PRESET
+            rendition_sizes: JPEG rendition sizes to generate if not cached yet
+            content_hash: SHA-256 of the file, enables the detection cache
             
-            logger.info(f"Detecting faces in image: {image_path}")
+        Returns:
+            services.ingest_pipeline.IngestResult
+        """
+        try:
+            start = time.perf_counter()
+            keys, cached, boxes = await self._cached_detections(content_hash, preset)
+            if cached is not None:
+                return IngestResult(
+                    format=None,
+                    width=None,
+                    height=None,
+                    faces=cached,
+                    renditions=[],
+                    decoded_size=None,
+                    decoded_color=False,
+                    timings={"cache": time.perf_counter() - start},
+                    peak_memory=None
+                )
+            result = await detection_executor.ingest(image_path, preset, rendition_sizes, content_hash, boxes)
+            await self._cache_detections(keys, result.faces)
+            return result
+        except Exception as e:
+            logger.error(f"Error ingesting photo: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"Face detection failed: {str(e)}")
+    
+    async def _cached_detections(self, content_hash: Optional[str], preset: Optional[str]):
+        # (cache keys, cached detections, cached boxes); keys are None without a content hash
+        if not content_hash:
+            return None, None, None
+        keys = detection_cache.keys(content_hash, get_preset(preset), self.descriptor.version)
+        cached, boxes = await run_in_threadpool(detection_cache.lookup, *keys)
+        return keys, cached, boxes
+    
+    async def _cache_detections(self, keys: Optional[Tuple[str, str]], detections: List[dict]) -> None:
+        if keys is None:
+            return
+        faces_key, boxes_key = keys
+        await run_in_threadpool(detection_cache.put, faces_key, detections, self.descriptor.pipeline_version)
+        await run_in_threadpool(detection_cache.put, boxes_key, detections)
+    
+    def detect_faces_sync(
+        self,
+        image_path: str,
+        preset: Optional[str] = None,
+        boxes: Optional[List[dict]] = None
+    ) -> List[dict]:
+        """
+        Detect faces in an image on the calling thread.
+        
+        Args:
+            image_path: Path to the image file
+            preset: Detection preset name; defaults to FACE_DETECTION_PRESET
+            boxes: Known face boxes to describe instead of running the cascade
             
-            # Read the image using OpenCV
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError(f"Failed to read image at {image_path}")
+        Returns:
+            List of dictionaries containing face location (in original image
+            coordinates) and features
+        """
+        logger.info(f"Detecting faces in image: {image_path}")
+        
+        # Read the image directly as grayscale, the only form used below
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise ValueError(f"Failed to read image at {image_path}")
+        
+        return self.detect_faces_in_image(gray, preset, boxes=boxes)
+    
+    def detect_faces_in_image(
+        self,
+        gray: np.ndarray,
+        preset: Optional[str] = None,
+        original_size: Optional[Tuple[int, int]] = None,
+        boxes: Optional[List[dict]] = None
+    ) -> List[dict]:
+        """
+        Detect faces in an already decoded grayscale image.
+        
+        Args:
+            gray: Grayscale image, possibly decoded at reduced resolution
+            preset: Detection preset name; defaults to FACE_DETECTION_PRESET
+            original_size: (width, height) of the full-resolution image the
+                locations are reported in; defaults to the size of ``gray``
+            boxes: Detections of an earlier run with the same preset (see
+                services.detection_cache); only their crops are described
             
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        Returns:
+            List of dictionaries containing face location (in original image
+            coordinates) and features
+        """
+        # Measure processing time
+        start_time = time.time()
+        detection_preset = get_preset(preset)
+        
+        # Scale of the decoded image relative to the original
+        width, height = original_size or (gray.shape[1], gray.shape[0])
+        decoded_scale = gray.shape[1] / width
+        
+        # Downsample to the preset's working resolution
+        scale = decoded_scale
+        if detection_preset.max_side and max(height, width) * scale > detection_preset.max_side:
+            scale = detection_preset.max_side / max(height, width)
+        if scale < decoded_scale:
+            working = cv2.resize(
+                gray,
+                (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)),
+                interpolation=cv2.INTER_AREA
+            )
+        else:
+            working = gray
+            scale = decoded_scale
+        
+        # Face boxes as (working image box, original image box)
+        regions = []
+        if boxes is None:
+            # Search only face sizes that are plausible for this image
+            short_side = min(working.shape)
+            min_size = max(int(short_side * detection_preset.min_face_fraction), detection_preset.min_face_pixels)
+            detect_kwargs = {"minSize": (min_size, min_size)}
+            if detection_preset.max_face_fraction:
+                max_size = max(int(short_side * detection_preset.max_face_fraction), min_size)
+                detect_kwargs["maxSize"] = (max_size, max_size)
             
             # Detect faces
             faces = self.face_cascade.detectMultiScale(
-                gray, 
-                scaleFactor=1.1, 
-                minNeighbors=5, 
-                minSize=(30, 30)
+                working,
+                scaleFactor=detection_preset.scale_factor,
+                minNeighbors=detection_preset.min_neighbors,
+                **detect_kwargs
             )
             
-            if len(faces) == 0:
-                logger.info(f"No faces detected in image: {image_path}")
-                return []
-            
-            results = []
-            
             for (x, y, w, h) in faces:
-                # Extract face ROI
-                face_roi = gray[y:y+h, x:x+w]
-                
-                # Use the face region as a simple feature vector
-                # In a real app, we'd use a proper face embedding here
-                face_resized = cv2.resize(face_roi, (100, 100))
-                face_flattened = face_resized.flatten() / 255.0  # Normalize
-                
-                # Store results
-                results.append({
-                    "location": {
-                        "x": float(x),
-                        "y": float(y),
-                        "width": float(w),
-                        "height": float(h)
-                    },
-                    "embedding": face_flattened,
-                    "confidence": 1.0
-                })
-            
-            processing_time = time.time() - start_time
-            logger.info(f"Detected {len(results)} faces in {processing_time:.2f} seconds")
+                # Map the box back to original image coordinates
+                regions.append(((x, y, w, h), (
+                    min(int(round(x / scale)), width - 1),
+                    min(int(round(y / scale)), height - 1),
+                    min(int(round((x + w) / scale)), width),
+                    min(int(round((y + h) / scale)), height)
+                )))
+        else:
+            # Reuse known boxes; map them to working image coordinates
+            for box in boxes:
+                location = box["location"]
+                x0, y0 = int(location["x"]), int(location["y"])
+                x1, y1 = x0 + int(location["width"]), y0 + int(location["height"])
+                x, y = int(round(x0 * scale)), int(round(y0 * scale))
+                regions.append((
+                    (x, y, max(int(round(x1 * scale)) - x, 1), max(int(round(y1 * scale)) - y, 1)),
+                    (x0, y0, x1, y1)
+                ))
+        
+        if not regions:
+            logger.info(f"No faces detected ({detection_preset.name})")
+            return []
+        
+        results = []
+        
+        for (x, y, w, h), (x0, y0, x1, y1) in regions:
+            # Extract face ROI
+            if detection_preset.recrop_full_resolution:
+                face_roi = gray[
+                    int(y0 * decoded_scale):max(int(y1 * decoded_scale), int(y0 * decoded_scale) + 1),
+                    int(x0 * decoded_scale):max(int(x1 * decoded_scale), int(x0 * decoded_scale) + 1)
+                ]
+            else:
+                face_roi = working[y:y+h, x:x+w]
             
-            return results
+            # Describe the face region as a compact feature vector
+            embedding = self.descriptor.describe(face_roi)
             
-        except Exception as e:
-            logger.error(f"Error detecting faces: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Face detection failed: {str(e)}")
+            # Store results
+            results.append({
+                "location": {
+                    "x": float(x0),
+                    "y": float(y0),
+                    "width": float(x1 - x0),
+                    "height": float(y1 - y0)
+                },
+                "embedding": embedding,
+                "confidence": 1.0
+            })
+        
+        processing_time = time.time() - start_time
+        logger.info(f"Detected {len(results)} faces in {processing_time:.2f} seconds ({detection_preset.name})")
+        
+        return results
     
     async def compare_faces(self, source_embedding: np.ndarray, target_embeddings: List[np.ndarray]) -> List[Tuple[float, int]]:
         """
@@ -108,22 +295,40 @@ class FaceRecognitionService:
             target_embeddings: List of target face embeddings to compare against
             
         Returns:
-            List of tuples containing (similarity_score, target_index)
+            List of tuples containing (similarity_score, target_index), best first.
+            Scores use the correlation scale documented in services.face_matching.
         """
-        results = []
-        
-        for i, target_embedding in enumerate(target_embeddings):
-            # Calculate Euclidean distance
-            distance = np.linalg.norm(source_embedding - target_embedding)
-            # Convert distance to similarity score (1 - normalized distance)
-            similarity = 1.0 - min(distance / 100.0, 1.0)  # Larger normalization for pixel-based features
-            results.append((similarity, i))
+        if len(target_embeddings) == 0:
+            return []
         
-        # Sort by similarity (higher is better)
-        results.sort(reverse=True)
+        scores, indices = match_embeddings(
+            source_embedding,
+            target_embeddings,
+            top_k=len(target_embeddings)
+        )
         
-        return results
-    
+        return [(float(score), int(index)) for score, index in zip(scores[0], indices[0])]
+
+    async def match_faces(
+        self,
+        query_embeddings: Sequence[np.ndarray],
+        gallery_embeddings: Sequence[np.ndarray],
+        top_k: int = 1
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Match a batch of face embeddings, e.g. all faces of a photo, against a gallery.
+
+        Args:
+            query_embeddings: Face embeddings to identify
+            gallery_embeddings: Embeddings of the known faces, raw or already normalized
+            top_k: Number of best matches to return per query
+
+        Returns:
+            Tuple of (scores, indices) shaped (M, min(top_k, N)), best first;
+            indices refer to gallery_embeddings (see services.face_matching)
+        """
+        return match_embeddings(query_embeddings, gallery_embeddings, top_k=top_k)
+
     def _cosine_similarity(self, embedding1: np.ndarray, embedding2: np.ndarray) -> float:
         """
         Calculate cosine similarity between two embeddings.
@@ -151,42 +356,24 @@ class FaceRecognitionService:
             Path to the saved image
         """
         try:
-            # Create uploads directory if it doesn't exist
-            upload_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Generate a safe filename
-            timestamp = int(time.time())
-            safe_filename = f"{timestamp}_{file.filename}"
-            file_path = os.path.join(upload_dir, safe_filename)
-            
-            # Read file content
-            contents = await file.read()
-            
-            # Check if it's a valid image
-            try:
-                # Try to open with PIL to verify it's a valid image
-                image = Image.open(io.BytesIO(contents))
-                image.verify()  # Verify it's an image
-            except Exception:
-                raise HTTPException(status_code=400, detail="Invalid image file")
-            
-            # Save the image
-            with open(file_path, "wb") as f:
-                f.write(contents)
-                
-            logger.info(f"Saved uploaded image to {file_path}")
-            
-            return file_path
+            # Streamed to disk in chunks, validated and moved into place
+            stored = await stream_upload(file)
+            return stored.path
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error processing uploaded image: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Image processing failed: {str(e)}")
     
     def serialize_embedding(self, embedding: np.ndarray) -> bytes:
-        """Serialize a numpy embedding to bytes for storage"""
-        return pickle.dumps(embedding)
+        """Serialize a numpy embedding to bytes for storage (see services.embedding_format)"""
+        return encode_embedding(embedding, pipeline_version=self.descriptor.pipeline_version)
     
     def deserialize_embedding(self, data: bytes) -> np.ndarray:
-        """Deserialize bytes to a numpy embedding"""
-        return pickle.loads(data)
\ No newline at end of file
+        """Deserialize bytes to a read-only numpy embedding without copying"""
+        return decode_embedding(data)
+    
+    def is_current_embedding(self, data: bytes) -> bool:
+        """Whether a stored embedding was produced by the active descriptor"""
+        return pipeline_version_of(data) == self.descriptor.pipeline_version
\ No newline at end of file
@@ -0,0 +1,327 @@
+"""
+Process-level cache of per-user face galleries.
+
+A gallery is a nearest-neighbour index over the normalized embeddings of a
+user's active faces, keyed by face_id. Galleries are built once from the
+database and then kept up to date through write-through calls from the
+routes that change faces.
+
+Write-through only reaches the cache of the process that made the change.
+Callers that pass a version to get_or_load (gallery_version: count, highest
+id and last update of the user's faces) reload a gallery cached under
+another version, so changes made by other workers are picked up on the
+next lookup. Write-through calls then pass the version including their own
+change, read after flushing it in the same transaction, so the gallery they
+update stays cached under the version the next lookup sees.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from models.face import Face
+from services.ann_index import build_index, needs_rebuild
+from services.face_matching import normalize_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class Gallery:
+    """
+    Searchable set of a user's active faces.
+
+    Wraps an ExactIndex or IVFIndex (see services.ann_index) and upgrades
+    between them as faces are added. Methods are thread-safe.
+    """
+
+    def __init__(self, face_ids: np.ndarray, embeddings: np.ndarray, index=None):
+        self.index = index if index is not None else build_index(np.asarray(face_ids, dtype=np.int64), embeddings)
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_index(cls, index) -> "Gallery":
+        """Wrap an index that is already built, e.g. by services.ann_index.load_index."""
+        return cls(None, None, index=index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def nbytes(self) -> int:
+        return self.index.nbytes
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: int = 1,
+        n_probe: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest faces for a batch of normalized query embeddings.
+
+        Args:
+            queries: (M, D) normalized embeddings
+            top_k: Candidates per query
+            n_probe: Inverted lists to scan when the index is an IVFIndex
+
+        Returns:
+            Tuple of (scores, face_ids) shaped (M, top_k), best match first,
+            padded with -inf / -1 when fewer candidates exist
+        """
+        with self._lock:
+            return self.index.search(queries, top_k=top_k, n_probe=n_probe)
+
+    def add_face(self, face_id: int, embedding: np.ndarray) -> None:
+        """Insert a face, or replace its embedding if already present."""
+        self.add_faces(np.array([face_id]), normalize_embeddings(embedding))
+
+    def add_faces(self, face_ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """Insert or replace a batch of faces given as (N, D) normalized embeddings."""
+        with self._lock:
+            if self.index.dim is not None and self.index.dim != embeddings.shape[1]:
+                raise ValueError("Embedding dimension does not match gallery")
+
+            self.index.add(np.asarray(face_ids, dtype=np.int64), embeddings)
+            if needs_rebuild(self.index):
+                ids, vectors = self.index.items()
+                self.index = build_index(ids, vectors)
+
+    def remove_face(self, face_id: int) -> None:
+        with self._lock:
+            self.index.remove(np.array([face_id]))
+
+    def __contains__(self, face_id: int) -> bool:
+        return face_id in self.index
+
+
+def load_gallery(
+    db: Session,
+    user_id: int,
+    deserialize: Callable[[bytes], np.ndarray],
+    is_current: Optional[Callable[[bytes], bool]] = None
+) -> Gallery:
+    """
+    Build a user's gallery from the database.
+
+    Args:
+        db: Database session
+        user_id: Owner of the faces
+        deserialize: Function turning a stored embedding blob into an array
+        is_current: Optional filter skipping embeddings made by another descriptor
+
+    Returns:
+        Gallery of all active faces of the user
+    """
+    rows = db.query(Face.face_id, Face.face_embedding).filter(
+        Face.user_id == user_id,
+        Face.is_active == True
+    ).order_by(Face.face_id).all()
+
+    if is_current is not None:
+        current = [row for row in rows if is_current(row.face_embedding)]
+        if len(current) < len(rows):
+            logger.warning(f"Skipping {len(rows) - len(current)} faces of user {user_id} with stale embeddings")
+        rows = current
+
+    if not rows:
+        return Gallery(np.empty(0, dtype=np.int64), np.empty((0, 0), dtype=np.float32))
+
+    return Gallery(
+        np.array([row.face_id for row in rows], dtype=np.int64),
+        normalize_embeddings([deserialize(row.face_embedding) for row in rows])
+    )
+
+
+def gallery_version(db: Session, user_id: int) -> Tuple:
+    """
+    Cheap fingerprint of a user's faces for GalleryCache.get_or_load.
+
+    Changes whenever a face is created, updated or deactivated (updated_at
+    is set on every UPDATE).
+    """
+    return tuple(db.query(
+        func.count(Face.face_id), func.max(Face.face_id), func.max(Face.updated_at)
+    ).filter(Face.user_id == user_id).one())
+
+
+class GalleryCache:
+    """LRU cache of galleries keyed by user_id, bounded by total bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._galleries: "OrderedDict[int, Gallery]" = OrderedDict()
+        # Size each gallery was accounted with, galleries grow in place
+        self._sizes: Dict[int, int] = {}
+        # Version each gallery was loaded at (see get_or_load)
+        self._versions: Dict[int, Hashable] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # One loader per user at a time
+        self._load_locks: Dict[int, threading.Lock] = {}
+        # Bumped by every change, so a load that raced with one is not cached
+        self._generations: Dict[int, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id: int, version: Optional[Hashable] = None) -> Optional[Gallery]:
+        """The cached gallery, or None if missing or cached under another version."""
+        with self._lock:
+            return self._lookup(user_id, version)
+
+    def get_or_load(
+        self,
+        user_id: int,
+        loader: Callable[[], Gallery],
+        version: Optional[Hashable] = None
+    ) -> Gallery:
+        """
+        Return the cached gallery, building and caching it on a miss.
+
+        Concurrent misses for the same user wait for a single load. A load
+        that overlapped a write-through or invalidation is returned but not
+        cached, since it may not contain the change.
+
+        Args:
+            user_id: Owner of the gallery
+            loader: Builds the gallery from the database
+            version: Fingerprint of the data (e.g. gallery_version); a gallery
+                cached under another version is reloaded
+        """
+        with self._lock:
+            gallery = self._lookup(user_id, version)
+            if gallery is not None:
+                return gallery
+            load_lock = self._load_locks.setdefault(user_id, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                # Loaded by another caller while we waited
+                gallery = self._galleries.get(user_id)
+                if gallery is not None and (version is None or self._versions.get(user_id) == version):
+                    self._galleries.move_to_end(user_id)
+                    return gallery
+                generation = (self._epoch, self._generations.get(user_id, 0))
+
+            gallery = loader()
+            with self._lock:
+                if generation == (self._epoch, self._generations.get(user_id, 0)):
+                    self._store(user_id, gallery, version)
+            return gallery
+
+    def put(self, user_id: int, gallery: Gallery, version: Optional[Hashable] = None) -> None:
+        with self._lock:
+            self._changed(user_id)
+            self._store(user_id, gallery, version)
+
+    def add_face(
+        self,
+        user_id: int,
+        face_id: int,
+        embedding: np.ndarray,
+        version: Optional[Hashable] = None
+    ) -> None:
+        """
+        Write-through for a created or changed face; no-op if the user is not cached.
+
+        Args:
+            user_id: Owner of the face
+            face_id: Face to insert or replace
+            embedding: Its embedding
+            version: Version of the data including this change (e.g. gallery_version);
+                without one the gallery keeps the version it was cached under
+        """
+        with self._lock:
+            self._changed(user_id)
+            gallery = self._galleries.get(user_id)
+            if gallery is None:
+                return
+            try:
+                gallery.add_face(face_id, embedding)
+                self._store(user_id, gallery, self._versions.get(user_id) if version is None else version)
+            except ValueError:
+                # Mixed embedding formats; rebuild from the database next time
+                self._discard(user_id)
+
+    def remove_face(self, user_id: int, face_id: int, version: Optional[Hashable] = None) -> None:
+        """Write-through for a deactivated face; no-op if the user is not cached (see add_face)."""
+        with self._lock:
+            self._changed(user_id)
+            gallery = self._galleries.get(user_id)
+            if gallery is not None:
+                gallery.remove_face(face_id)
+                self._store(user_id, gallery, self._versions.get(user_id) if version is None else version)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._changed(user_id)
+            self._discard(user_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._galleries.clear()
+            self._sizes.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "users": len(self._galleries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes
+            }
+
+    def _lookup(self, user_id: int, version: Optional[Hashable]) -> Optional[Gallery]:
+        gallery = self._galleries.get(user_id)
+        if gallery is not None and version is not None and self._versions.get(user_id) != version:
+            # Changed by another process since it was loaded
+            self._discard(user_id)
+            gallery = None
+        if gallery is None:
+            self.misses += 1
+            return None
+        self._galleries.move_to_end(user_id)
+        self.hits += 1
+        return gallery
+
+    def _changed(self, user_id: int) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def _store(self, user_id: int, gallery: Gallery, version: Optional[Hashable] = None) -> None:
+        self._discard(user_id)
+        size = gallery.nbytes
+        if size > self.max_bytes:
+            logger.warning(f"Gallery of user {user_id} ({size} bytes) exceeds cache budget")
+            return
+
+        self._galleries[user_id] = gallery
+        self._sizes[user_id] = size
+        self._versions[user_id] = version
+        self._bytes += size
+
+        # Evict least recently used users until we are back under budget
+        while self._bytes > self.max_bytes:
+            evicted_user_id = next(iter(self._galleries))
+            self._discard(evicted_user_id)
+            self.evictions += 1
+
+    def _discard(self, user_id: int) -> None:
+        if self._galleries.pop(user_id, None) is not None:
+            self._bytes -= self._sizes.pop(user_id)
+            self._versions.pop(user_id, None)
+
+
+gallery_cache = GalleryCache(
+    max_bytes=int(os.getenv("GALLERY_CACHE_MAX_MB", "256")) * 1024 * 1024
+)
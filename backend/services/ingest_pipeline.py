@@ -0,0 +1,194 @@
+"""
+Single-decode ingest of a stored photo.
+
+Processing a photo used to read it several times: the header for format and
+dimensions, a grayscale decode for face detection and one more decode per
+rendition. Here the file is decoded once and the pixels are handed from
+stage to stage:
+
+    header      format, dimensions and EXIF orientation (services.photo_metadata),
+                rejects files that are not images
+    decode      one cv2.imread (grayscale unless renditions are still
+                missing, at reduced resolution when no stage needs more),
+                rotated upright
+    detect      face detection on the decoded pixels
+    renditions  missing RENDITION_EAGER_SIZES renditions from the same pixels
+
+Huffman decoding costs about the same whatever the output resolution, so
+one shared decode beats a cheap decode per stage. JPEG files are decoded
+at 1/2, 1/4 or 1/8 scale (libjpeg DCT scaling) when the preset detects on a
+downsampled working image without re-cropping at full resolution. The one
+exception: when detection needs the full-resolution image, a rendition of
+at most 1/8 of the photo's long side is rendered from its own 1/8-scale
+decode, which is cheaper than decoding the whole photo in color (and keeps
+a 24-megapixel color buffer out of memory).
+
+Each result carries per-stage timings and, with INGEST_TRACE_MEMORY=1, the
+peak memory allocated while ingesting (tracemalloc; numpy and OpenCV output
+buffers included, library-internal scratch memory not).
+"""
+import logging
+import os
+import time
+import tracemalloc
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import cv2
+
+from services.detection_presets import get_preset
+from services.photo_metadata import apply_orientation, read_metadata
+from services.renditions import rendition_cache
+
+logger = logging.getLogger(__name__)
+
+TRACE_MEMORY = os.getenv("INGEST_TRACE_MEMORY", "").lower() in ("1", "true", "yes")
+
+# cv2.imread flags per reduction factor
+_COLOR_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+_GRAY_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+class IngestResult(NamedTuple):
+    # Header data; None when the detections came from services.detection_cache
+    format: Optional[str]
+    width: Optional[int]
+    height: Optional[int]
+    # Detections in FaceRecognitionService.detect_faces format
+    faces: List[dict]
+    # Rendition sizes generated by this ingest
+    renditions: List[int]
+    # Decoded (width, height) and whether color was decoded
+    decoded_size: Optional[Tuple[int, int]]
+    decoded_color: bool
+    # Seconds per stage
+    timings: Dict[str, float]
+    # Peak traced bytes, None unless memory tracing is on
+    peak_memory: Optional[int]
+
+
+def decode_reduction(
+    image_format: str,
+    width: int,
+    height: int,
+    preset: Optional[str],
+    rendition_sizes: Sequence[int]
+) -> int:
+    """
+    Largest JPEG reduction factor that leaves every stage enough pixels.
+
+    Orientation does not matter here, only the long side.
+
+    Returns:
+        1, 2, 4 or 8
+    """
+    detection_preset = get_preset(preset)
+    if image_format != "JPEG" or not detection_preset.max_side or detection_preset.recrop_full_resolution:
+        return 1
+    needed = max([detection_preset.max_side, *rendition_sizes])
+    long_side = max(width, height)
+    for factor in (8, 4, 2):
+        if -(-long_side // factor) >= needed:
+            return factor
+    return 1
+
+
+def ingest(
+    service,
+    image_path: str,
+    preset: Optional[str] = None,
+    rendition_sizes: Sequence[int] = (),
+    content_hash: Optional[str] = None,
+    trace_memory: bool = TRACE_MEMORY,
+    boxes: Optional[List[dict]] = None
+) -> IngestResult:
+    """
+    Validate, measure, detect faces in and render a stored photo from one decode.
+
+    Blocking; runs on a detection worker (services.detection_executor).
+
+    Args:
+        service: FaceRecognitionService used for detection
+        image_path: Path to the image file
+        preset: Detection preset name; defaults to FACE_DETECTION_PRESET
+        rendition_sizes: JPEG rendition sizes to generate if not cached yet
+        content_hash: SHA-256 of the file, keys the rendition cache
+        trace_memory: Record peak memory with tracemalloc
+        boxes: Known face boxes to describe instead of running the cascade
+
+    Returns:
+        Header data, detections, generated renditions, timings and peak memory
+
+    Raises:
+        ValueError: The file cannot be decoded
+    """
+    timings = {}
+    tracing = trace_memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    try:
+        # Format, upright dimensions and orientation from the header, without decoding pixels
+        start = time.perf_counter()
+        metadata = read_metadata(image_path)
+        image_format, width, height = metadata.format, metadata.width, metadata.height
+        missing = rendition_cache.missing(image_path, list(rendition_sizes), "jpeg", content_hash)
+        timings["header"] = time.perf_counter() - start
+
+        # Decode once, in the cheapest form every stage can use
+        start = time.perf_counter()
+        factor = decode_reduction(image_format, width, height, preset, missing)
+        shared = missing
+        if factor == 1 and image_format == "JPEG":
+            # Small renditions come cheaper from their own 1/8-scale decode than from a full color one
+            shared = [size for size in missing if size * 8 > max(width, height)]
+        flags = (_COLOR_FLAGS if shared else _GRAY_FLAGS)[factor]
+        # Rotated from the orientation read above, the same for every format
+        image = cv2.imread(image_path, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+        if image is None:
+            raise ValueError(f"Failed to decode image at {image_path}")
+        if metadata.orientation != 1:
+            image = apply_orientation(image, metadata.orientation)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        timings["decode"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        faces = service.detect_faces_in_image(gray, preset, (width, height), boxes)
+        timings["detect"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for size in missing:
+            rendition_cache.get(
+                image_path, size, "jpeg", content_hash, image=image if size in shared else None
+            )
+        timings["renditions"] = time.perf_counter() - start
+
+        peak_memory = tracemalloc.get_traced_memory()[1] if tracing else None
+    finally:
+        if tracing:
+            tracemalloc.stop()
+
+    logger.info(
+        f"Ingested {image_path}: "
+        + ", ".join(f"{stage} {seconds * 1000:.0f} ms" for stage, seconds in timings.items())
+        + (f", peak {peak_memory / (1024 * 1024):.1f} MB" if peak_memory is not None else "")
+    )
+    return IngestResult(
+        format=image_format,
+        width=width,
+        height=height,
+        faces=faces,
+        renditions=missing,
+        decoded_size=(gray.shape[1], gray.shape[0]),
+        decoded_color=image.ndim == 3,
+        timings=timings,
+        peak_memory=peak_memory
+    )
@@ -0,0 +1,312 @@
+"""
+Durable job queue stored in the processing_jobs table.
+
+Jobs survive restarts and need no external broker. Worker loops run on the
+API's event loop; their queries (claiming, heartbeats, recording outcomes)
+run on the database's ``background_writer`` thread, so the loop never
+blocks on the database. Jobs are claimed with a conditional UPDATE
+(``status = 'pending'`` -> ``'running'``), so two workers, in this process
+or another, never run the same job. A running job's ``locked_at`` is
+refreshed by a heartbeat; jobs whose heartbeat is older than the lease
+(their worker crashed or was killed) are put back in the queue.
+
+Failed jobs are retried with exponential backoff until ``max_attempts`` is
+reached. Each job runs with its own database session, which handlers must
+not use on the event loop either: short database sections go to
+``background_writer``, long scans to the threadpool so they do not delay
+the heartbeats queued behind them.
+
+Settings:
+    JOB_WORKERS             concurrent worker loops per process (default 2)
+    JOB_MAX_ATTEMPTS        attempts before a job is marked failed (default 3)
+    JOB_RETRY_BASE_SECONDS  first retry delay, doubled per attempt (default 5)
+    JOB_LEASE_SECONDS       heartbeat age after which a running job is recovered (default 60)
+    JOB_POLL_INTERVAL       seconds between polls of an idle worker (default 1)
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from database.database import SessionLocal, background_writer
+from models.job import ProcessingJob
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+JobHandler = Callable[[Session, ProcessingJob], Awaitable[None]]
+
+
+class JobQueue:
+    """Table-backed queue with a pool of asyncio worker loops."""
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_attempts: int = 3,
+        retry_base_seconds: float = 5.0,
+        lease_seconds: float = 60.0,
+        poll_interval: float = 1.0
+    ):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._handlers: Dict[str, JobHandler] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_recovery = 0.0
+        self._worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def handler(self, job_type: str) -> Callable[[JobHandler], JobHandler]:
+        """Register the coroutine running jobs of ``job_type``."""
+        def register(func: JobHandler) -> JobHandler:
+            self._handlers[job_type] = func
+            return func
+        return register
+
+    def enqueue(
+        self,
+        db: Session,
+        job_type: str,
+        user_id: int,
+        photo_id: Optional[int] = None,
+        event_id: Optional[int] = None,
+        payload: Optional[dict] = None
+    ) -> ProcessingJob:
+        """
+        Add a job to the queue and commit it.
+
+        Args:
+            db: Database session
+            job_type: Registered job type
+            user_id: Owner of the job
+            photo_id: Photo the job works on, if any
+            event_id: Event the job works on, if any
+            payload: Extra JSON-serializable arguments
+
+        Returns:
+            The committed job
+        """
+        job = ProcessingJob(
+            job_type=job_type,
+            user_id=user_id,
+            photo_id=photo_id,
+            event_id=event_id,
+            payload=payload or {},
+            status=PENDING,
+            attempts=0,
+            max_attempts=self.max_attempts,
+            run_after=datetime.utcnow()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self.notify()
+        return job
+
+    def active_job_for_photo(self, db: Session, photo_id: int, job_type: str) -> Optional[ProcessingJob]:
+        """Pending or running job of ``job_type`` for a photo, if one exists."""
+        return db.query(ProcessingJob).filter(
+            ProcessingJob.photo_id == photo_id,
+            ProcessingJob.job_type == job_type,
+            ProcessingJob.status.in_([PENDING, RUNNING])
+        ).first()
+
+    def notify(self) -> None:
+        """Wake idle workers of this process instead of waiting for their next poll."""
+        if self._wakeup is not None:
+            # Routes enqueue from the threadpool; the event belongs to the workers' loop
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def claim(self, db: Session, worker_id: str) -> Optional[ProcessingJob]:
+        """
+        Atomically take the next due job.
+
+        Returns:
+            The claimed job (now running), or None when no job is due
+        """
+        # Another worker may win the race for a candidate; try the next one
+        for _ in range(5):
+            now = datetime.utcnow()
+            candidate = db.query(ProcessingJob.job_id).filter(
+                ProcessingJob.status == PENDING,
+                ProcessingJob.run_after <= now
+            ).order_by(ProcessingJob.run_after, ProcessingJob.job_id).first()
+            if candidate is None:
+                return None
+
+            claimed = db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.job_id == candidate.job_id, ProcessingJob.status == PENDING)
+                .values(
+                    status=RUNNING,
+                    attempts=ProcessingJob.attempts + 1,
+                    locked_by=worker_id,
+                    locked_at=now
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.get(ProcessingJob, candidate.job_id)
+        return None
+
+    def recover_stale_jobs(self, db: Session) -> int:
+        """
+        Re-queue running jobs whose worker stopped sending heartbeats.
+
+        Returns:
+            Number of recovered jobs
+        """
+        expired = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+        recovered = db.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.status == RUNNING, ProcessingJob.locked_at < expired)
+            .values(status=PENDING, locked_by=None, locked_at=None, run_after=datetime.utcnow())
+        ).rowcount
+        db.commit()
+        if recovered:
+            logger.warning(f"Recovered {recovered} interrupted jobs")
+        return recovered
+
+    def _finish(self, db: Session, job: ProcessingJob, error: Optional[Exception]) -> None:
+        now = datetime.utcnow()
+        job.locked_by = None
+        job.locked_at = None
+        if error is None:
+            job.status = SUCCEEDED
+            job.last_error = None
+            job.finished_at = now
+        elif job.attempts >= job.max_attempts:
+            job.status = FAILED
+            job.last_error = str(error)
+            job.finished_at = now
+            logger.error(f"Job {job.job_id} ({job.job_type}) failed after {job.attempts} attempts: {error}")
+        else:
+            delay = self.retry_base_seconds * 2 ** (job.attempts - 1)
+            job.status = PENDING
+            job.last_error = str(error)
+            job.run_after = now + timedelta(seconds=delay)
+            logger.warning(f"Job {job.job_id} ({job.job_type}) failed, retrying in {delay:.0f}s: {error}")
+        db.commit()
+
+    def _release(self, db: Session, job: ProcessingJob) -> None:
+        # Shutdown: hand the job back without counting the attempt
+        db.rollback()
+        job.status = PENDING
+        job.attempts -= 1
+        job.locked_by = None
+        job.locked_at = None
+        db.commit()
+
+    def _touch(self, job_id: int, worker_id: str) -> None:
+        db = SessionLocal()
+        try:
+            db.execute(
+                update(ProcessingJob)
+                .where(ProcessingJob.job_id == job_id, ProcessingJob.locked_by == worker_id)
+                .values(locked_at=datetime.utcnow())
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _poll(self, db: Session, worker_id: str) -> Optional[ProcessingJob]:
+        if time.monotonic() - self._last_recovery > self.lease_seconds / 2:
+            self._last_recovery = time.monotonic()
+            self.recover_stale_jobs(db)
+        return self.claim(db, worker_id)
+
+    async def _heartbeat(self, job_id: int, worker_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await background_writer.run(self._touch, job_id, worker_id)
+            except Exception as e:
+                logger.error(f"Heartbeat of job {job_id} failed: {str(e)}")
+
+    async def run_job(self, db: Session, job: ProcessingJob, worker_id: str) -> None:
+        """Run a claimed job and record its outcome."""
+        handler = self._handlers.get(job.job_type)
+        heartbeat = asyncio.create_task(self._heartbeat(job.job_id, worker_id))
+        error = None
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job type {job.job_type}")
+            await handler(db, job)
+        except asyncio.CancelledError:
+            await background_writer.run(self._release, db, job)
+            raise
+        except Exception as e:
+            await background_writer.run(db.rollback)
+            error = e
+        finally:
+            heartbeat.cancel()
+        await background_writer.run(self._finish, db, job, error)
+
+    async def _worker_loop(self, worker_id: str) -> None:
+        while True:
+            db = SessionLocal()
+            try:
+                job = await background_writer.run(self._poll, db, worker_id)
+                if job is not None:
+                    await self.run_job(db, job, worker_id)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} error: {str(e)}")
+            finally:
+                await background_writer.run(db.close)
+
+            # Idle: sleep until the next poll or an enqueue in this process
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        """Start the worker loops on the running event loop."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        for index in range(self.workers):
+            worker_id = f"{self._worker_prefix}:{index}"
+            self._tasks.append(asyncio.create_task(self._worker_loop(worker_id)))
+        logger.info(f"Started {self.workers} job workers")
+
+    async def stop(self) -> None:
+        """
+        Stop the worker loops.
+
+        Jobs interrupted here go back to the queue; jobs of a process that
+        dies without stopping are recovered once their lease expires.
+        """
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._wakeup = None
+
+
+job_queue = JobQueue(
+    workers=int(os.getenv("JOB_WORKERS", "2")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    retry_base_seconds=float(os.getenv("JOB_RETRY_BASE_SECONDS", "5")),
+    lease_seconds=float(os.getenv("JOB_LEASE_SECONDS", "60")),
+    poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "1"))
+)
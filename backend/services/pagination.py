@@ -0,0 +1,93 @@
+"""
+Keyset (cursor) pagination for listings ordered newest first.
+
+``skip``/``limit`` pages make the database read and discard every earlier
+row, and rows inserted while a client pages shift everything after them.
+A cursor instead names the last row of the previous page, and the next page
+is the rows strictly after it in ``(timestamp desc, id desc)`` order, a
+range an index on the same columns serves directly at any depth.
+
+Cursors are opaque URL-safe tokens carrying the timestamp and id of that
+row. The timestamp is compared against the row's stored value, read in the
+same query, because SQLite stores ``CURRENT_TIMESTAMP`` defaults as text in
+a different format than SQLAlchemy binds datetimes and equal instants would
+not compare equal. The token's own copy is only used if the row has been
+deleted since; on SQLite it is bound in the format of those defaults.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import DateTime, func, literal, select, tuple_
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.orm import aliased
+
+# Timestamps of the listings are server defaults, "YYYY-MM-DD HH:MM:SS" text on SQLite
+_SERVER_TIMESTAMP = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite"
+)
+
+
+def encode_cursor(position: datetime, row_id: int) -> str:
+    """Cursor pointing after the row with ``position`` and ``row_id``."""
+    payload = json.dumps([position.isoformat(), row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Timestamp and id of a cursor.
+
+    Raises:
+        ValueError: The cursor was not produced by encode_cursor
+    """
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position, row_id = json.loads(payload)
+        return datetime.fromisoformat(position), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+
+def after_cursor(model, order_key: str, id_key: str, cursor: str):
+    """
+    Filter selecting the rows after a cursor in ``(order_key desc, id_key desc)`` order.
+
+    Args:
+        model: Mapped class of the listing
+        order_key: Timestamp attribute the listing is ordered by
+        id_key: Primary key attribute, the tie breaker
+        cursor: Token from encode_cursor
+
+    Raises:
+        ValueError: Invalid cursor
+    """
+    position, row_id = decode_cursor(cursor)
+    cursor_row = aliased(model)
+    boundary = func.coalesce(
+        select(getattr(cursor_row, order_key))
+        .where(getattr(cursor_row, id_key) == row_id)
+        .scalar_subquery(),
+        literal(position, _SERVER_TIMESTAMP)
+    )
+    return tuple_(getattr(model, order_key), getattr(model, id_key)) < tuple_(boundary, row_id)
+
+
+def next_cursor(rows: Sequence, limit: int, order_key: str, id_key: str) -> Optional[str]:
+    """
+    Cursor of the page after ``rows``.
+
+    Args:
+        rows: Rows fetched with ``limit + 1``; the extra row only signals more pages
+        limit: Requested page size
+
+    Returns:
+        Cursor after the last row of the page, None on the last page
+    """
+    if len(rows) <= limit or limit <= 0:
+        return None
+    last = rows[limit - 1]
+    return encode_cursor(getattr(last, order_key), getattr(last, id_key))
@@ -0,0 +1,109 @@
+"""
+Password hashing and verification off the asyncio event loop.
+
+bcrypt costs a few hundred milliseconds of CPU per call by design. Run
+inline in an ``async def`` route it stalls every other request of the
+process, so a burst of logins (a whole event's guests signing in at once)
+freezes uploads, galleries and polling alike. Calls are run on a small
+dedicated thread pool instead; the bcrypt backend releases the GIL while
+hashing, so the event loop keeps serving. Submissions beyond ``workers``
+wait in line on the event loop, which caps the CPU a login storm can take
+from the rest of the API; the queue is reported by ``stats``.
+
+Settings:
+    PASSWORD_HASH_WORKERS   concurrent hash/verify calls (default: CPU count / 2)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+class PasswordHasher:
+    """Bounded thread pool for bcrypt awaited from coroutines."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.submitted = 0
+        self.completed = 0
+        self.peak_waiting = 0
+        self._waiting = 0
+        self._running = 0
+        self._queue_seconds = 0.0
+        self._max_queue_seconds = 0.0
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+            return self._pool
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        # Wait for a free worker; the wait is the queueing delay of a login
+        self.submitted += 1
+        self._waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self._waiting)
+        queued_at = time.perf_counter()
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+        waited = time.perf_counter() - queued_at
+        self._queue_seconds += waited
+        self._max_queue_seconds = max(self._max_queue_seconds, waited)
+
+        self._running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), fn, *args)
+        finally:
+            self._running -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        """bcrypt hash of a password."""
+        return await self._run(pwd_context.hash, password)
+
+    async def verify(self, password: str, password_hash: str) -> bool:
+        """Whether a password matches its stored hash."""
+        return await self._run(pwd_context.verify, password, password_hash)
+
+    def stats(self) -> Dict[str, float]:
+        started = self.submitted - self._waiting
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "waiting": self._waiting,
+            "peak_waiting": self.peak_waiting,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "mean_queue_ms": self._queue_seconds / started * 1000 if started else 0.0,
+            "max_queue_ms": self._max_queue_seconds * 1000
+        }
+
+    def shutdown(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+password_hasher = PasswordHasher(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+)
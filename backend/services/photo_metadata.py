@@ -0,0 +1,326 @@
+"""
+Photo metadata read from the file header, without decoding pixels.
+
+For JPEG files the marker segments are walked up to the first scan: the
+frame header gives the dimensions and the APP1 Exif segment the
+orientation, capture time, GPS position and camera. Only those segments
+are read, so extraction costs tens of microseconds per file and can run
+inline with uploads. Other formats go through PIL's header parser.
+
+Dimensions are reported upright: for EXIF orientations 5-8 (rotated by 90
+degrees) width and height are swapped, matching the pixels that
+cv2.imread and ImageOps.exif_transpose produce and so the coordinates face
+detections are stored in.
+
+Usage (from backend/):
+    python -m services.photo_metadata backfill [--batch-size 500] [--all]
+"""
+import argparse
+import logging
+import struct
+from datetime import datetime, timedelta, timezone
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# TIFF tags
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_ORIENTATION = 0x0112
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_OFFSET_TIME_ORIGINAL = 0x9011
+TAG_GPS_LATITUDE_REF = 0x0001
+TAG_GPS_LATITUDE = 0x0002
+TAG_GPS_LONGITUDE_REF = 0x0003
+TAG_GPS_LONGITUDE = 0x0004
+
+# Bytes per value of each TIFF field type
+_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+
+# JPEG start-of-frame markers (the others in C0-CF are DHT, JPG and DAC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class PhotoMetadata(NamedTuple):
+    format: str
+    # Upright dimensions (after applying the orientation)
+    width: int
+    height: int
+    # EXIF orientation, 1 (upright) to 8
+    orientation: int = 1
+    taken_at: Optional[datetime] = None
+    location_lat: Optional[float] = None
+    location_long: Optional[float] = None
+    camera_model: Optional[str] = None
+
+
+def _read_ifd(tiff: bytes, offset: int, endian: str) -> Dict[int, object]:
+    """Tag values of one IFD: str for ASCII, float for rationals, int otherwise."""
+    values = {}
+    (count,) = struct.unpack_from(endian + "H", tiff, offset)
+    for index in range(count):
+        tag, field_type, value_count, value_offset = struct.unpack_from(
+            endian + "HHII", tiff, offset + 2 + index * 12
+        )
+        size = _TYPE_SIZES.get(field_type)
+        if size is None:
+            continue
+        start = offset + 2 + index * 12 + 8
+        if size * value_count > 4:
+            start = value_offset
+        data = tiff[start:start + size * value_count]
+        if len(data) < size * value_count:
+            continue
+
+        if field_type == 2:
+            values[tag] = data.split(b"\x00", 1)[0].decode("utf-8", "replace").strip()
+        elif field_type in (5, 10):
+            numbers = struct.unpack(endian + ("I" if field_type == 5 else "i") * (2 * value_count), data)
+            values[tag] = [
+                numerator / denominator if denominator else 0.0
+                for numerator, denominator in zip(numbers[::2], numbers[1::2])
+            ]
+        elif field_type in (3, 4, 9):
+            code = {3: "H", 4: "I", 9: "i"}[field_type]
+            numbers = struct.unpack(endian + code * value_count, data)
+            values[tag] = numbers[0] if value_count == 1 else list(numbers)
+    return values
+
+
+def parse_exif(tiff: bytes) -> Dict[int, object]:
+    """
+    Tags of IFD0, the Exif IFD and the GPS IFD of a TIFF-structured EXIF block.
+
+    GPS tags are offset by 0x10000 so they do not collide with IFD0 tags.
+    Malformed blocks yield whatever was parsed before the damage.
+    """
+    tags = {}
+    if tiff[:2] == b"II":
+        endian = "<"
+    elif tiff[:2] == b"MM":
+        endian = ">"
+    else:
+        return tags
+    try:
+        (ifd0,) = struct.unpack_from(endian + "I", tiff, 4)
+        tags.update(_read_ifd(tiff, ifd0, endian))
+        if isinstance(tags.get(TAG_EXIF_IFD), int):
+            tags.update(_read_ifd(tiff, tags[TAG_EXIF_IFD], endian))
+        if isinstance(tags.get(TAG_GPS_IFD), int):
+            for tag, value in _read_ifd(tiff, tags[TAG_GPS_IFD], endian).items():
+                tags[0x10000 + tag] = value
+    except (struct.error, IndexError):
+        logger.debug("Truncated EXIF block")
+    return tags
+
+
+def _read_jpeg_header(f):
+    """Dimensions and raw EXIF block of a JPEG file positioned after its SOI marker."""
+    size = None
+    exif = b""
+    while size is None:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            break
+        code = marker[1]
+        # Fill bytes and standalone markers
+        if code == 0xFF:
+            f.seek(-1, 1)
+            continue
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue
+        if code in (0xD9, 0xDA):
+            break
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            break
+        (length,) = struct.unpack(">H", length_bytes)
+        if code in _SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) == 5:
+                height, width = struct.unpack(">HH", frame[1:5])
+                size = (width, height)
+            break
+        if code == 0xE1 and not exif:
+            segment = f.read(length - 2)
+            if segment.startswith(b"Exif\x00\x00"):
+                exif = segment[6:]
+            continue
+        f.seek(length - 2, 1)
+    return size, exif
+
+
+def _exif_datetime(value, offset) -> Optional[datetime]:
+    if not isinstance(value, str):
+        return None
+    try:
+        taken_at = datetime.strptime(value[:19], "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    # OffsetTimeOriginal, e.g. "+02:00"
+    if isinstance(offset, str) and len(offset) == 6 and offset[0] in "+-":
+        try:
+            hours, minutes = int(offset[1:3]), int(offset[4:6])
+            delta = timedelta(hours=hours, minutes=minutes)
+            taken_at = taken_at.replace(tzinfo=timezone(delta if offset[0] == "+" else -delta))
+        except ValueError:
+            pass
+    return taken_at
+
+
+def _gps_coordinate(value, ref, negative_ref: str, limit: float) -> Optional[float]:
+    if not isinstance(value, list) or len(value) != 3:
+        return None
+    degrees = value[0] + value[1] / 60 + value[2] / 3600
+    if not 0 <= degrees <= limit:
+        return None
+    return -degrees if ref == negative_ref else degrees
+
+
+def metadata_from_exif(image_format: str, width: int, height: int, tags: Dict[int, object]) -> PhotoMetadata:
+    """Build PhotoMetadata from header dimensions and parsed EXIF tags."""
+    orientation = tags.get(TAG_ORIENTATION)
+    if not isinstance(orientation, int) or not 1 <= orientation <= 8:
+        orientation = 1
+    if orientation >= 5:
+        width, height = height, width
+
+    make, model = tags.get(TAG_MAKE), tags.get(TAG_MODEL)
+    camera_model = model if isinstance(model, str) and model else None
+    if camera_model and isinstance(make, str) and make:
+        # "Apple" + "iPhone 12", but not "Canon" + "Canon EOS R5"
+        if not camera_model.lower().startswith(make.split()[0].lower()):
+            camera_model = f"{make} {camera_model}"
+
+    return PhotoMetadata(
+        format=image_format,
+        width=width,
+        height=height,
+        orientation=orientation,
+        taken_at=_exif_datetime(
+            tags.get(TAG_DATETIME_ORIGINAL, tags.get(TAG_DATETIME)),
+            tags.get(TAG_OFFSET_TIME_ORIGINAL)
+        ),
+        location_lat=_gps_coordinate(
+            tags.get(0x10000 + TAG_GPS_LATITUDE), tags.get(0x10000 + TAG_GPS_LATITUDE_REF), "S", 90
+        ),
+        location_long=_gps_coordinate(
+            tags.get(0x10000 + TAG_GPS_LONGITUDE), tags.get(0x10000 + TAG_GPS_LONGITUDE_REF), "W", 180
+        ),
+        camera_model=camera_model[:100] if camera_model else None
+    )
+
+
+def read_metadata(path: str) -> PhotoMetadata:
+    """
+    Format, upright dimensions and EXIF metadata of an image file.
+
+    Args:
+        path: Image file
+
+    Returns:
+        The photo's metadata; fields missing from the file are None
+
+    Raises:
+        ValueError: The file is not a readable image
+    """
+    with open(path, "rb") as f:
+        if f.read(3) == b"\xff\xd8\xff":
+            f.seek(2)
+            size, exif = _read_jpeg_header(f)
+            if size is None or not all(size):
+                raise ValueError(f"No frame header in JPEG file {path}")
+            return metadata_from_exif("JPEG", size[0], size[1], parse_exif(exif) if exif else {})
+
+    try:
+        with Image.open(path) as image:
+            image_format, width, height = image.format, image.width, image.height
+            exif = image.getexif()
+            raw_exif = exif.tobytes() if exif else b""
+    except Exception as e:
+        raise ValueError(f"Not a readable image: {path} ({e})")
+    # Exif.tobytes() starts with the "Exif\0\0" header
+    tags = parse_exif(raw_exif[6:]) if raw_exif.startswith(b"Exif\x00\x00") else {}
+    return metadata_from_exif(image_format, width, height, tags)
+
+
+def apply_orientation(image: np.ndarray, orientation: int) -> np.ndarray:
+    """Rotate/flip pixels decoded without orientation handling to upright."""
+    if orientation in (5, 6, 7, 8):
+        # Transpose first: 5 is a plain transpose, the others add a flip
+        image = image.swapaxes(0, 1)
+        orientation = {5: 1, 6: 2, 7: 3, 8: 4}[orientation]
+    if orientation in (2, 3):
+        image = image[:, ::-1]
+    if orientation in (3, 4):
+        image = image[::-1]
+    return np.ascontiguousarray(image)
+
+
+def backfill(db: Session, batch_size: int = 500, all_photos: bool = False) -> int:
+    """
+    Fill metadata columns of photos uploaded before extraction at upload.
+
+    Args:
+        db: Database session
+        batch_size: Photos per transaction
+        all_photos: Re-read every photo, not only those without a capture time
+
+    Returns:
+        Number of photos updated
+    """
+    from models.photo import Photo
+
+    updated = 0
+    after_id = 0
+    while True:
+        query = db.query(Photo).filter(Photo.photo_id > after_id, Photo.is_deleted == False)
+        if not all_photos:
+            query = query.filter(Photo.taken_at.is_(None))
+        photos = query.order_by(Photo.photo_id).limit(batch_size).all()
+        if not photos:
+            return updated
+
+        for photo in photos:
+            try:
+                metadata = read_metadata(photo.storage_path)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping photo {photo.photo_id}: {e}")
+                continue
+            photo.format = metadata.format
+            photo.width = metadata.width
+            photo.height = metadata.height
+            for column in ("taken_at", "location_lat", "location_long", "camera_model"):
+                value = getattr(metadata, column)
+                if value is not None:
+                    setattr(photo, column, value)
+            updated += 1
+
+        db.commit()
+        after_id = photos[-1].photo_id
+        logger.info(f"Read metadata of photos up to photo_id={after_id}")
+
+
+if __name__ == "__main__":
+    from database.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain photo metadata columns")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Read metadata of existing photos")
+    backfill_parser.add_argument("--batch-size", type=int, default=500)
+    backfill_parser.add_argument("--all", action="store_true", help="Also photos that already have a capture time")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        print(f"Updated {backfill(session, args.batch_size, args.all)} photos")
+    finally:
+        session.close()
@@ -0,0 +1,289 @@
+"""
+Content-addressed photo storage.
+
+Each distinct file is stored once, named by its SHA-256 and sharded two
+levels deep so no directory grows past a few thousand entries:
+
+    UPLOAD_DIR/ab/cd/abcd0123...ef.jpg
+
+The stored_files table counts the Photo rows referencing each file. A file
+whose count drops to zero is kept for a grace period (an identical upload
+may revive it) and then removed by purge_unreferenced. The purge deletes the
+row and the file in one transaction, after checking again that nothing
+references the file; an upload of the same content that waited for that
+transaction finds the file gone and fails instead of referencing it.
+
+Usage (from backend/):
+    python -m services.photo_store backfill [--batch-size 200]
+    python -m services.photo_store purge [--grace-hours 24]
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from models.photo import Photo, StoredFile
+
+logger = logging.getLogger(__name__)
+
+# Absolute, so stored paths do not depend on the working directory
+UPLOAD_DIR = os.path.abspath(os.getenv(
+    "UPLOAD_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "uploads")
+))
+
+# File extension per image format, so the static mount serves a sensible type
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "GIF": ".gif",
+    "BMP": ".bmp",
+    "TIFF": ".tif",
+    "WEBP": ".webp",
+}
+
+
+def content_path(sha256: str, image_format: Optional[str] = None, upload_dir: str = UPLOAD_DIR) -> str:
+    """Storage path of the file with the given SHA-256 hex digest."""
+    extension = FORMAT_EXTENSIONS.get(image_format or "", "")
+    return os.path.join(upload_dir, sha256[:2], sha256[2:4], sha256 + extension)
+
+
+def acquire(db: Session, stored) -> None:
+    """
+    Add a reference to a stored file, registering it on first use.
+
+    The caller commits, together with the Photo row holding the reference.
+
+    Args:
+        db: Database session
+        stored: StoredUpload of the file (see services.upload_service)
+    """
+    def increment() -> int:
+        return db.query(StoredFile).filter(
+            StoredFile.content_hash == stored.sha256
+        ).update(
+            {StoredFile.ref_count: StoredFile.ref_count + 1, StoredFile.released_at: None},
+            synchronize_session=False
+        )
+
+    if increment():
+        return
+
+    try:
+        with db.begin_nested():
+            db.add(StoredFile(
+                content_hash=stored.sha256,
+                storage_path=stored.path,
+                file_size=stored.size,
+                format=stored.format,
+                ref_count=1
+            ))
+    except IntegrityError:
+        # Registered concurrently by an identical upload
+        increment()
+        return
+
+    # The row was missing: new content, or purged after the upload found the file in place
+    if not os.path.exists(stored.path):
+        raise FileNotFoundError(f"Stored file {stored.path} was purged during the upload")
+
+
+def abandon(db: Session, stored) -> None:
+    """
+    Hand the file of an upload that got no Photo row over to the purge.
+
+    The upload is rolled back and its file registered without references,
+    so purge_unreferenced removes it after the grace period unless an
+    identical upload takes it first. A file that is already registered is
+    left as it is. Commits.
+
+    Args:
+        db: Database session
+        stored: StoredUpload of the file (see services.upload_service)
+    """
+    db.rollback()
+    try:
+        with db.begin_nested():
+            db.add(StoredFile(
+                content_hash=stored.sha256,
+                storage_path=stored.path,
+                file_size=stored.size,
+                format=stored.format,
+                ref_count=0,
+                released_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        pass
+    db.commit()
+
+
+def release(db: Session, content_hash: Optional[str]) -> None:
+    """Drop a reference to a stored file; the caller commits."""
+    if not content_hash:
+        return
+    db.query(StoredFile).filter(
+        StoredFile.content_hash == content_hash,
+        StoredFile.ref_count > 0
+    ).update(
+        {StoredFile.ref_count: StoredFile.ref_count - 1, StoredFile.released_at: datetime.utcnow()},
+        synchronize_session=False
+    )
+
+
+def purge_unreferenced(db: Session, grace: timedelta = timedelta(hours=24)) -> int:
+    """
+    Delete files that have had no references for longer than ``grace``.
+
+    Returns:
+        Number of files removed
+    """
+    cutoff = datetime.utcnow() - grace
+    removed = 0
+    for content_hash, storage_path in db.query(StoredFile.content_hash, StoredFile.storage_path).filter(
+        StoredFile.ref_count == 0,
+        StoredFile.released_at < cutoff
+    ).all():
+        # Counts checked again by the DELETE itself, which locks the row until
+        # the commit: references taken since the listing, or photos the count
+        # missed, keep the file
+        live_photos = db.query(Photo.photo_id).filter(
+            Photo.content_hash == content_hash,
+            Photo.is_deleted == False
+        ).exists()
+        deleted = db.query(StoredFile).filter(
+            StoredFile.content_hash == content_hash,
+            StoredFile.ref_count == 0,
+            ~live_photos
+        ).delete(synchronize_session=False)
+        try:
+            # Only the session that deletes the row removes the file, before
+            # committing so no upload can take a reference in between
+            if deleted and os.path.exists(storage_path):
+                os.remove(storage_path)
+                removed += 1
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+    logger.info(f"Purged {removed} unreferenced files")
+    return removed
+
+
+def _hash_file(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _copy_file(source: str, target: str) -> None:
+    """Hard-link ``source`` to ``target``, or copy it, replacing ``target`` atomically."""
+    temp_path = f"{target}.{uuid.uuid4().hex}.part"
+    try:
+        try:
+            os.link(source, temp_path)
+        except OSError:
+            shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def backfill(db: Session, batch_size: int = 200) -> int:
+    """
+    Move photos stored before content addressing into the store.
+
+    Duplicates are collapsed onto one file; photos whose file is missing, and
+    deleted photos (which hold no reference), are skipped. All photos sharing
+    a legacy file are repointed in one transaction once the file is in the
+    store, and the original is removed only after that commit, when no row
+    references it any more, so the command can be interrupted and restarted.
+
+    Returns:
+        Number of photos moved
+    """
+    from services.upload_service import StoredUpload, read_image_header
+
+    moved = 0
+    after_id = 0
+    while True:
+        photos = db.query(Photo).filter(
+            Photo.content_hash.is_(None),
+            Photo.is_deleted == False,
+            Photo.photo_id > after_id
+        ).order_by(Photo.photo_id).limit(batch_size).all()
+        if not photos:
+            return moved
+
+        for photo in photos:
+            # Repointed with an earlier photo of the batch sharing its file
+            if photo.content_hash is not None or not os.path.exists(photo.storage_path):
+                continue
+            try:
+                image_format, width, height = read_image_header(photo.storage_path)
+            except Exception:
+                image_format, width, height = None, photo.width, photo.height
+
+            source = photo.storage_path
+            sha256 = _hash_file(source)
+            target = content_path(sha256, image_format)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                _copy_file(source, target)
+
+            stored = StoredUpload(
+                path=target,
+                size=os.path.getsize(target),
+                sha256=sha256,
+                format=image_format,
+                width=width,
+                height=height
+            )
+            # Every photo of the legacy file; deleted ones hold no reference
+            for sharing in db.query(Photo).filter(
+                Photo.storage_path == source,
+                Photo.content_hash.is_(None)
+            ).all():
+                if not sharing.is_deleted:
+                    acquire(db, stored)
+                    moved += 1
+                sharing.content_hash = sha256
+                sharing.storage_path = target
+            db.commit()
+            if source != target and db.query(Photo.photo_id).filter(Photo.storage_path == source).first() is None:
+                os.remove(source)
+
+        after_id = photos[-1].photo_id
+        logger.info(f"Moved photos up to photo_id={after_id} into the content store")
+
+
+if __name__ == "__main__":
+    from database.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed photo store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="Move existing photos into the store")
+    backfill_parser.add_argument("--batch-size", type=int, default=200)
+    purge_parser = subparsers.add_parser("purge", help="Delete files without references")
+    purge_parser.add_argument("--grace-hours", type=float, default=24)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        if args.command == "backfill":
+            print(f"Moved {backfill(session, args.batch_size)} photos")
+        else:
+            print(f"Removed {purge_unreferenced(session, timedelta(hours=args.grace_hours))} files")
+    finally:
+        session.close()
@@ -0,0 +1,198 @@
+"""
+In-process cache of authenticated users and coalesced last_login writes.
+
+Every authenticated request resolves its bearer token to a user. Verified
+principals are kept for a short TTL keyed by token, so repeated requests
+skip the JWT check and the ``users`` query; an entry never outlives its
+token's expiry. The cached row is attached to the request's session
+without a query (``Session.merge(load=False)``), so routes can keep
+changing and committing ``current_user``.
+
+``last_login`` is recorded in memory and written by a background loop in
+one batched UPDATE per interval, so read-only requests no longer open a
+write transaction and each user is written at most once per interval.
+
+Entries of a user are dropped with ``invalidate_user`` whenever the user's
+email, password or active flag changes in this process. Other processes
+see such changes once their entries expire.
+
+Settings:
+    AUTH_PRINCIPAL_TTL_SECONDS     lifetime of a cached principal (default 30, 0 disables)
+    AUTH_PRINCIPAL_CACHE_SIZE      maximum cached tokens (default 10000)
+    AUTH_LAST_LOGIN_FLUSH_SECONDS  interval of last_login writes (default 60)
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Set, Tuple
+
+from sqlalchemy import update
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from database.database import SessionLocal
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+class PrincipalCache:
+    """Token -> user cache with a TTL, plus the pending last_login writes."""
+
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10000, flush_interval: float = 60.0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # token -> (monotonic expiry, column values of the user)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, object]]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+        self._last_login: Dict[int, datetime] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, token: str, db: Session) -> Optional[User]:
+        """
+        Cached user of a token, attached to ``db`` without a query.
+
+        Returns:
+            The user, or None when the token is not cached or has expired
+        """
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            values = entry[1]
+
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, token: str, user: User, token_expires_at: Optional[datetime] = None) -> None:
+        """
+        Cache the verified user of a token.
+
+        Args:
+            token: Bearer token
+            user: Active user the token resolved to
+            token_expires_at: The token's ``exp`` claim (UTC); the entry expires no later
+        """
+        if self.ttl_seconds <= 0:
+            return
+        lifetime = self.ttl_seconds
+        if token_expires_at is not None:
+            lifetime = min(lifetime, (token_expires_at - datetime.utcnow()).total_seconds())
+        if lifetime <= 0:
+            return
+        values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+        with self._lock:
+            self._remove(token)
+            self._entries[token] = (time.monotonic() + lifetime, values)
+            self._tokens_by_user.setdefault(user.user_id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is None:
+            return
+        user_id = entry[1]["user_id"]
+        tokens = self._tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._tokens_by_user[user_id]
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Drop every cached token of a user (after email, password or is_active changes)."""
+        with self._lock:
+            for token in list(self._tokens_by_user.get(user_id, ())):
+                self._remove(token)
+
+    def record_login(self, user_id: int, when: Optional[datetime] = None) -> None:
+        """Remember a user's latest activity for the next flush."""
+        with self._lock:
+            self._last_login[user_id] = when or datetime.utcnow()
+
+    def flush(self, db: Session) -> int:
+        """
+        Write pending last_login values in one batched UPDATE.
+
+        Returns:
+            Number of users updated
+        """
+        with self._lock:
+            pending, self._last_login = self._last_login, {}
+        if not pending:
+            return 0
+        try:
+            db.execute(
+                update(User),
+                [{"user_id": user_id, "last_login": when} for user_id, when in pending.items()]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep the values for the next flush unless newer ones arrived meanwhile
+            with self._lock:
+                for user_id, when in pending.items():
+                    self._last_login.setdefault(user_id, when)
+            raise
+        return len(pending)
+
+    def _flush_now(self) -> None:
+        db = SessionLocal()
+        try:
+            updated = self.flush(db)
+            if updated:
+                logger.debug(f"Wrote last_login of {updated} users")
+        except Exception as e:
+            logger.error(f"Writing last_login failed: {str(e)}")
+        finally:
+            db.close()
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self._flush_now()
+
+    def start(self) -> None:
+        """Start the periodic last_login flush on the running event loop."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and write what is still pending."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._flush_now()
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "pending_last_login": len(self._last_login)
+            }
+
+
+principal_cache = PrincipalCache(
+    ttl_seconds=float(os.getenv("AUTH_PRINCIPAL_TTL_SECONDS", "30")),
+    max_entries=int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000")),
+    flush_interval=float(os.getenv("AUTH_LAST_LOGIN_FLUSH_SECONDS", "60"))
+)
@@ -0,0 +1,240 @@
+"""
+Resized renditions of photos, cached on disk.
+
+Renditions are bounded to a square of RENDITION_SIZES pixels (aspect ratio
+kept, never upscaled), rotated upright from the EXIF orientation and encoded
+as JPEG or WebP. JPEG sources are decoded at reduced resolution (libjpeg
+DCT scaling via ``Image.draft``), so a 256px thumbnail of a 24-megapixel
+photo decodes about 1/64 of the pixels.
+
+Renditions are rendered from the original file, or from an image the caller
+has already decoded (see services.ingest_pipeline). Face crops (square
+thumbnails of one detection, FACE_CROP_SIZES pixels) use the same reduced
+decode and cache.
+
+Cached files are keyed by the photo's content hash (services.photo_store),
+so byte-identical photos share renditions. Each hit refreshes the file's
+mtime; when the cache grows past RENDITION_CACHE_MAX_MB the least recently
+used files are removed.
+
+Settings:
+    RENDITION_CACHE_DIR      cache location (default backend/cache/renditions)
+    RENDITION_CACHE_MAX_MB   size bound of the cache (default 1024)
+    RENDITION_EAGER_SIZES    sizes generated right after upload (default 256)
+"""
+import hashlib
+import os
+import uuid
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+from services.disk_cache import DiskCache
+
+RENDITION_SIZES = (256, 1024, 2048)
+RENDITION_FORMATS = {
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "webp": ("WEBP", ".webp", "image/webp"),
+}
+FACE_CROP_SIZES = (128, 256)
+# Context kept around a face box, as a fraction of its size on each side
+FACE_CROP_MARGIN = 0.3
+EAGER_SIZES = [int(size) for size in os.getenv("RENDITION_EAGER_SIZES", "256").split(",") if size.strip()]
+
+QUALITY = 82
+
+
+def _source_key(source_path: str, content_hash: Optional[str]) -> str:
+    if content_hash:
+        return content_hash
+    # Photos stored before content addressing: path and modification time
+    stat = os.stat(source_path)
+    return hashlib.sha256(f"{source_path}:{stat.st_mtime_ns}".encode()).hexdigest()
+
+
+def render(source_path: str, output_path: str, size: int, output_format: str) -> None:
+    """
+    Write a rendition of an image, bounded to ``size`` x ``size`` pixels.
+
+    Args:
+        source_path: Original image
+        output_path: Rendition file to write (replaced atomically)
+        size: Longest side in pixels
+        output_format: Key of RENDITION_FORMATS
+    """
+    with Image.open(source_path) as image:
+        # Reduced-resolution JPEG decode: at least ``size`` pixels remain on each side
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.thumbnail((size, size), Image.LANCZOS, reducing_gap=3.0)
+        _save(image, output_path, output_format)
+
+
+def render_array(image: np.ndarray, output_path: str, size: int, output_format: str) -> None:
+    """
+    Write a rendition of a decoded image, bounded to ``size`` x ``size`` pixels.
+
+    Args:
+        image: Upright BGR or grayscale pixels, as returned by cv2.imread
+        output_path: Rendition file to write (replaced atomically)
+        size: Longest side in pixels
+        output_format: Key of RENDITION_FORMATS
+    """
+    height, width = image.shape[:2]
+    scale = size / max(height, width)
+    if scale < 0.5:
+        # Integer-factor area reduction takes OpenCV's fast path; the exact size follows
+        factor = int(1 / scale)
+        image = cv2.resize(image, None, fx=1 / factor, fy=1 / factor, interpolation=cv2.INTER_AREA)
+        height, width = image.shape[:2]
+        scale = size / max(height, width)
+    if scale < 1.0:
+        image = cv2.resize(
+            image,
+            (max(int(round(width * scale)), 1), max(int(round(height * scale)), 1)),
+            interpolation=cv2.INTER_AREA
+        )
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    _save(Image.fromarray(image), output_path, output_format)
+
+
+def render_face(
+    source_path: str,
+    output_path: str,
+    box: Tuple[float, float, float, float],
+    size: int,
+    output_format: str
+) -> None:
+    """
+    Write a square crop around a face, bounded to ``size`` x ``size`` pixels.
+
+    Args:
+        source_path: Original image
+        output_path: Crop file to write (replaced atomically)
+        box: (x, y, width, height) of the face in upright full-resolution pixels
+        size: Side in pixels
+        output_format: Key of RENDITION_FORMATS
+    """
+    x, y, width, height = box
+    side = max(width, height) * (1 + 2 * FACE_CROP_MARGIN)
+    center_x, center_y = x + width / 2, y + height / 2
+    with Image.open(source_path) as image:
+        full_width = image.width
+        # Reduced-resolution JPEG decode: at least ``size`` pixels remain across the crop
+        reduction = min(size / side, 1.0)
+        image.draft("RGB", (max(int(image.width * reduction), 1), max(int(image.height * reduction), 1)))
+        scale = image.width / full_width
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image = image.crop((
+            max(int((center_x - side / 2) * scale), 0),
+            max(int((center_y - side / 2) * scale), 0),
+            min(int(round((center_x + side / 2) * scale)), image.width),
+            min(int(round((center_y + side / 2) * scale)), image.height)
+        ))
+        image.thumbnail((size, size), Image.LANCZOS)
+        _save(image, output_path, output_format)
+
+
+def _save(image: Image.Image, output_path: str, output_format: str) -> None:
+    temp_path = f"{output_path}.{uuid.uuid4().hex}.part"
+    try:
+        image.save(temp_path, RENDITION_FORMATS[output_format][0], quality=QUALITY)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+class RenditionCache(DiskCache):
+    """Size-bounded on-disk cache of renditions with least-recently-used eviction."""
+
+    def path_for(self, key: str, size: int, output_format: str, variant: str = "") -> str:
+        extension = RENDITION_FORMATS[output_format][1]
+        return os.path.join(self.cache_dir, key[:2], f"{key}{variant}_{size}{extension}")
+
+    def missing(
+        self,
+        source_path: str,
+        sizes: List[int],
+        output_format: str = "jpeg",
+        content_hash: Optional[str] = None
+    ) -> List[int]:
+        """Sizes of a photo that have no cached rendition yet."""
+        key = _source_key(source_path, content_hash)
+        return [size for size in sizes if not os.path.exists(self.path_for(key, size, output_format))]
+
+    def get(
+        self,
+        source_path: str,
+        size: int,
+        output_format: str = "jpeg",
+        content_hash: Optional[str] = None,
+        image: Optional[np.ndarray] = None
+    ) -> str:
+        """
+        Path of a rendition, generating it on a miss.
+
+        Blocking; call from a worker thread.
+
+        Args:
+            source_path: Original image
+            size: One of RENDITION_SIZES
+            output_format: Key of RENDITION_FORMATS
+            content_hash: SHA-256 of the original, if known
+            image: Decoded pixels of the original (see render_array) to render
+                from on a miss instead of reading the file again
+
+        Returns:
+            Path of the cached rendition
+        """
+        path = self.path_for(_source_key(source_path, content_hash), size, output_format)
+        if self._lookup(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if image is not None:
+            render_array(image, path, size, output_format)
+        else:
+            render(source_path, path, size, output_format)
+        self._stored(path)
+        return path
+
+    def get_face(
+        self,
+        source_path: str,
+        box: Tuple[float, float, float, float],
+        size: int,
+        output_format: str = "jpeg",
+        content_hash: Optional[str] = None
+    ) -> str:
+        """
+        Path of a face crop (see render_face), generating it on a miss.
+
+        Blocking; call from a worker thread.
+        """
+        variant = "_face" + "-".join(str(int(round(value))) for value in box)
+        path = self.path_for(_source_key(source_path, content_hash), size, output_format, variant)
+        if self._lookup(path):
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        render_face(source_path, path, box, size, output_format)
+        self._stored(path)
+        return path
+
+
+rendition_cache = RenditionCache(
+    cache_dir=os.path.abspath(os.getenv(
+        "RENDITION_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "renditions")
+    )),
+    max_bytes=int(float(os.getenv("RENDITION_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+)
@@ -0,0 +1,179 @@
+"""
+Retroactive identification of a user's earlier detections.
+
+Photos are matched against the faces known when they are processed, so
+naming a person only identifies the one detection the face was created
+from. The retro_match job (queued by the face routes when a face is
+created, renamed or created from a cluster) scores that face against all
+of the user's unidentified detections instead:
+
+* embedding blobs are streamed in detection_id order, RETRO_MATCH_CHUNK_SIZE
+  rows per query, so memory is bounded by one chunk;
+* each chunk is decoded into one matrix (services.embedding_format.
+  decode_embeddings) and scored with one matrix-vector product;
+* detections that score at least RETRO_MATCH_MARGIN above the similarity
+  threshold, and whose best match in the user's gallery is this face by
+  the same margin over the next person, are identified with one UPDATE per
+  chunk, and each chunk is committed on its own.
+
+The margin is there because nobody reviews these matches: a photo being
+processed gets one detection identified at the plain threshold, while this
+job identifies every detection of the user that clears the bar. Scores of
+unrelated faces near the threshold would otherwise all go to the first
+person named. 0.02 above the calibrated thresholds of
+services.face_descriptors is about a 0.01% false-accept rate for each
+descriptor (benchmarks.bench_descriptors).
+
+Detections made by another descriptor pipeline are skipped.
+
+Settings:
+    RETRO_MATCH_CHUNK_SIZE  detections per chunk (default 5000)
+    RETRO_MATCH_MARGIN      required above the threshold and over the next best person (default 0.02)
+
+Usage (from backend/):
+    python -m services.retro_match --user-id 1 --face-id 7 [--chunk-size 5000]
+"""
+import argparse
+import logging
+import os
+import time
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from models.face import Face, FaceDetection
+from models.photo import Photo
+from services.embedding_format import decode_embedding, decode_embeddings, pipeline_version_of
+from services.face_clustering import detach_detections
+from services.face_matching import normalize_embeddings
+from services.gallery_cache import gallery_cache, gallery_version, load_gallery
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = int(os.getenv("RETRO_MATCH_CHUNK_SIZE", "5000"))
+MARGIN = float(os.getenv("RETRO_MATCH_MARGIN", "0.02"))
+
+
+def retro_match(
+    db: Session,
+    user_id: int,
+    face_id: int,
+    pipeline_version: int,
+    threshold: float,
+    chunk_size: int = CHUNK_SIZE,
+    margin: float = MARGIN
+) -> Dict[str, float]:
+    """
+    Identify the user's unidentified detections of a face.
+
+    Args:
+        db: Database session
+        user_id: Owner of the face
+        face_id: Face to look for
+        pipeline_version: Active descriptor pipeline
+        threshold: Match threshold of the descriptor, on the scale of services.face_matching
+        chunk_size: Detections scored (and updated) per round trip
+        margin: Required above the threshold, and between this face and the
+            detection's next best match
+
+    Returns:
+        Counts of detections scanned and matched, seconds taken and detections per second
+    """
+    start = time.perf_counter()
+    scanned = matched = 0
+
+    face = db.query(Face).filter(
+        Face.face_id == face_id,
+        Face.user_id == user_id,
+        Face.is_active == True
+    ).first()
+    if face is None or pipeline_version_of(face.face_embedding) != pipeline_version:
+        logger.info(f"Face {face_id} is inactive or has a stale embedding; nothing to match")
+        return {"scanned": 0, "matched": 0, "seconds": 0.0, "detections_per_second": 0.0}
+    query = normalize_embeddings(decode_embedding(face.face_embedding))[0]
+
+    # Best match check: a detection closer to another person is left to them
+    gallery = gallery_cache.get_or_load(
+        user_id,
+        lambda: load_gallery(db, user_id, decode_embedding, lambda data: pipeline_version_of(data) == pipeline_version),
+        version=gallery_version(db, user_id)
+    )
+
+    after_id = 0
+    while True:
+        rows = db.query(FaceDetection.detection_id, FaceDetection.cluster_id, FaceDetection.embedding).join(
+            Photo
+        ).filter(
+            Photo.user_id == user_id,
+            FaceDetection.face_id.is_(None),
+            FaceDetection.detection_id > after_id
+        ).order_by(FaceDetection.detection_id).limit(chunk_size).all()
+        if not rows:
+            break
+        after_id = rows[-1].detection_id
+        scanned += len(rows)
+
+        rows = [row for row in rows if pipeline_version_of(row.embedding) == pipeline_version]
+        if not rows:
+            continue
+        vectors = normalize_embeddings(decode_embeddings([row.embedding for row in rows]))
+        candidates = np.flatnonzero(vectors @ query >= threshold + margin)
+        if not len(candidates):
+            continue
+
+        # Runner-up scores are -inf when the gallery has one face
+        scores, best_ids = gallery.search(vectors[candidates], top_k=2)
+        clear = (best_ids[:, 0] == face_id) & (scores[:, 0] - scores[:, 1] >= margin)
+        hits = [rows[i] for i in candidates[clear]]
+        if not hits:
+            continue
+
+        detach_detections(db, user_id, hits)
+        db.execute(
+            update(FaceDetection)
+            .where(FaceDetection.detection_id.in_([row.detection_id for row in hits]))
+            .values(face_id=face_id, identified=True, cluster_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        matched += len(hits)
+
+    seconds = time.perf_counter() - start
+    rate = scanned / seconds if seconds else 0.0
+    logger.info(
+        f"Retro-matched face {face_id} of user {user_id}: {matched} of {scanned} detections "
+        f"in {seconds:.2f}s ({rate:.0f} detections/s)"
+    )
+    return {"scanned": scanned, "matched": matched, "seconds": seconds, "detections_per_second": rate}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Identify earlier detections of a face")
+    parser.add_argument("--user-id", type=int, required=True)
+    parser.add_argument("--face-id", type=int, required=True)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from database.database import SessionLocal
+    from services.face_descriptors import get_descriptor, threshold_setting
+
+    descriptor = get_descriptor()
+    session = SessionLocal()
+    try:
+        result = retro_match(
+            session,
+            args.user_id,
+            args.face_id,
+            descriptor.pipeline_version,
+            threshold_setting("FACE_SIMILARITY_THRESHOLD", descriptor.similarity_threshold),
+            args.chunk_size
+        )
+    finally:
+        session.close()
+    print(
+        f"Matched {result['matched']} of {result['scanned']} detections "
+        f"({result['detections_per_second']:.0f} detections/s)"
+    )
@@ -0,0 +1,221 @@
+"""
+Streaming ingest of uploaded photos.
+
+Uploads are copied to a temporary file next to their final location in
+fixed-size chunks with non-blocking writes (aiofiles), so neither the whole
+file nor a blocking write ever sits on the event loop. The SHA-256 and byte
+count are computed on the fly, the size limit is enforced as soon as it is
+exceeded (or before reading when the client announces the size), the image
+type is checked from the first bytes and the header, and the finished file
+is renamed into place atomically under its content address (see
+services.photo_store); an identical file already in the store is reused.
+Rejected uploads leave nothing behind.
+
+The multipart parser spools each upload to its own temporary file before the
+route runs; the copy here reads from that spool, so memory use per upload
+stays at one chunk either way.
+
+Settings:
+    UPLOAD_DIR              where photos are stored (see services.photo_store)
+    UPLOAD_MAX_MB           per-upload size limit (default 50)
+    UPLOAD_CHUNK_KB         read/write chunk size (default 1024)
+    DEFAULT_STORAGE_LIMIT_GB  storage quota of users without a subscription
+                            (default unset: unlimited)
+"""
+import hashlib
+import logging
+import os
+import uuid
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.photo import Photo
+from models.user import SubscriptionPackage, UserSubscription
+from services.photo_metadata import PhotoMetadata, read_metadata
+from services.photo_store import UPLOAD_DIR, content_path
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+
+# Leading bytes of the accepted image formats
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "JPEG"),
+    (b"\x89PNG\r\n\x1a\n", "PNG"),
+    (b"GIF87a", "GIF"),
+    (b"GIF89a", "GIF"),
+    (b"BM", "BMP"),
+    (b"II*\x00", "TIFF"),
+    (b"MM\x00*", "TIFF"),
+]
+
+
+class StoredUpload(NamedTuple):
+    path: str
+    size: int
+    sha256: str
+    format: str
+    width: int
+    height: int
+    # Capture time, location and camera from the header (services.photo_metadata)
+    metadata: Optional[PhotoMetadata] = None
+
+
+def sniff_image_format(header: bytes) -> Optional[str]:
+    """Image format from the first bytes of a file, or None if not a supported image."""
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Client file name reduced to a plain base name."""
+    name = os.path.basename((filename or "").replace("\\", "/")).strip()
+    return name or "upload"
+
+
+def read_image_header(path: str):
+    """Format and dimensions parsed from the image header; pixel data is not decoded."""
+    with Image.open(path) as image:
+        return image.format, image.width, image.height
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File is too large (limit {max_bytes / (1024 * 1024):.1f} MB)"
+    )
+
+
+async def stream_upload(
+    file: UploadFile,
+    max_bytes: int = UPLOAD_MAX_BYTES,
+    upload_dir: str = UPLOAD_DIR
+) -> StoredUpload:
+    """
+    Copy an upload to disk in chunks and move it into place.
+
+    Args:
+        file: FastAPI UploadFile object
+        max_bytes: Largest accepted size in bytes
+        upload_dir: Destination directory
+
+    Returns:
+        Final path, size, SHA-256 hex digest, image format, upright
+        dimensions and header metadata
+
+    Raises:
+        HTTPException: 413 when the file is too large, 400 when it is not an image
+    """
+    # Reject early when the size is announced by the client
+    if file.size is not None and file.size > max_bytes:
+        raise _too_large(max_bytes)
+
+    await aiofiles.os.makedirs(upload_dir, exist_ok=True)
+    # Same directory as the final path so the rename is atomic
+    temp_path = os.path.join(upload_dir, f".{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+    image_format = None
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+
+                if image_format is None:
+                    image_format = sniff_image_format(chunk)
+                    if image_format is None:
+                        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image file")
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise _too_large(max_bytes)
+
+                digest.update(chunk)
+                await out.write(chunk)
+
+        if image_format is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image file")
+
+        # Check that the header parses, e.g. not a truncated or disguised file,
+        # and read the EXIF metadata along the way
+        try:
+            metadata = await run_in_threadpool(read_metadata, temp_path)
+        except Exception:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid image file")
+        image_format = metadata.format
+
+        # Content-addressed: an identical file is already in place
+        file_path = content_path(digest.hexdigest(), image_format, upload_dir)
+        if await aiofiles.os.path.exists(file_path):
+            await aiofiles.os.remove(temp_path)
+        else:
+            await aiofiles.os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            await aiofiles.os.replace(temp_path, file_path)
+    except BaseException:
+        if await aiofiles.os.path.exists(temp_path):
+            await aiofiles.os.remove(temp_path)
+        raise
+
+    logger.info(f"Saved uploaded image to {file_path} ({size} bytes)")
+    return StoredUpload(
+        path=file_path,
+        size=size,
+        sha256=digest.hexdigest(),
+        format=image_format,
+        width=metadata.width,
+        height=metadata.height,
+        metadata=metadata
+    )
+
+
+def storage_remaining(db: Session, user_id: int) -> Optional[int]:
+    """
+    Bytes a user may still upload under their subscription's storage limit.
+
+    Returns:
+        Remaining bytes (never negative), or None when the user has no limit
+    """
+    now = datetime.utcnow()
+    limits = [
+        row.storage_limit_gb for row in db.query(SubscriptionPackage.storage_limit_gb).join(
+            UserSubscription, UserSubscription.package_id == SubscriptionPackage.package_id
+        ).filter(
+            UserSubscription.user_id == user_id,
+            UserSubscription.is_active == True,
+            UserSubscription.start_date <= now,
+            UserSubscription.end_date >= now
+        ).all()
+    ]
+
+    if limits:
+        # A package without a storage limit is unlimited
+        if any(limit is None for limit in limits):
+            return None
+        limit_gb = max(limits)
+    else:
+        default_limit = os.getenv("DEFAULT_STORAGE_LIMIT_GB")
+        if not default_limit:
+            return None
+        limit_gb = float(default_limit)
+
+    used = db.query(func.coalesce(func.sum(Photo.file_size), 0)).filter(
+        Photo.user_id == user_id,
+        Photo.is_deleted == False
+    ).scalar()
+    return max(int(limit_gb * 1024 ** 3) - used, 0)
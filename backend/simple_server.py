@@ -6,6 +6,8 @@ import uvicorn
 import os
 import json
 import time
+import aiofiles
+import aiofiles.os
 
 class UserCreate(BaseModel):
     username: str
@@ -40,6 +42,10 @@ app.add_middleware(
 # Create uploads directory
 os.makedirs("uploads", exist_ok=True)
 
+# Upload limits
+UPLOAD_MAX_BYTES = int(float(os.getenv("UPLOAD_MAX_MB", "50")) * 1024 * 1024)
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # Mock user database for development
 mock_users = []
 
@@ -112,13 +118,24 @@ async def upload_photo(file: UploadFile = File(...)):
     
     # Create a timestamp-based filename to avoid collisions
     timestamp = int(time.time())
-    filename = f"{timestamp}_{file.filename}"
+    filename = f"{timestamp}_{os.path.basename(file.filename or 'upload')}"
     file_path = os.path.join("uploads", filename)
     
-    # Save the file
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    # Stream the file to a temporary path in chunks, then move it into place
+    temp_path = f"{file_path}.part"
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > UPLOAD_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail="File is too large")
+                await buffer.write(chunk)
+        await aiofiles.os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
     
     # Mock photo record
     return {
@@ -0,0 +1,157 @@
+"""
+Shared fixtures.
+
+Each test run gets its own SQLite database and storage directories. They
+are set before any application module is imported, because the modules
+read their settings at import time.
+"""
+import os
+import shutil
+import tempfile
+import uuid
+
+WORK_DIR = tempfile.mkdtemp(prefix="facial-recognition-tests-")
+# A PostgreSQL DATABASE_URL is only used to check query plans (tests/test_query_plans.py)
+POSTGRES_URL = os.environ.get("DATABASE_URL") if os.environ.get("DATABASE_URL", "").startswith("postgresql") else None
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'test.db')}"
+for setting, directory in (
+    ("UPLOAD_DIR", "uploads"),
+    ("RENDITION_CACHE_DIR", "renditions"),
+    ("DETECTION_CACHE_DIR", "detections"),
+    ("DETECTION_INDEX_DIR", "detection_index"),
+):
+    os.environ[setting] = os.path.join(WORK_DIR, directory)
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+
+
+@pytest.fixture(scope="session")
+def client():
+    """
+    Client of the API. The startup hooks (job workers, login flushes) are not
+    run, so every statement a test sees comes from the request it makes.
+    """
+    # main mounts ./uploads relative to the working directory
+    previous_dir = os.getcwd()
+    os.chdir(WORK_DIR)
+    try:
+        from main import app
+
+        yield TestClient(app)
+    finally:
+        os.chdir(previous_dir)
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def postgres_engine():
+    """
+    Engine of the PostgreSQL database of DATABASE_URL, with the tables of the
+    models created if missing. Tests using it are skipped without one.
+    """
+    if POSTGRES_URL is None:
+        pytest.skip("DATABASE_URL is not a PostgreSQL database")
+
+    from database.database import Base
+    from models import face, job, photo, user  # noqa: F401 (register the tables)
+
+    engine = create_engine(POSTGRES_URL)
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+@pytest.fixture
+def user(client):
+    """A new user and the headers of an authenticated request."""
+    name = uuid.uuid4().hex[:12]
+    response = client.post("/api/auth/register", json={
+        "username": name,
+        "email": f"{name}@example.com",
+        "password": "password",
+        "first_name": "Test",
+        "last_name": "User"
+    })
+    assert response.status_code == 201, response.text
+    response = client.post("/api/auth/token", data={"username": f"{name}@example.com", "password": "password"})
+    token = response.json()
+    headers = {"Authorization": f"Bearer {token['access_token']}"}
+    # Caches the token's user, so later requests authenticate without a query
+    assert client.get("/api/users/me", headers=headers).status_code == 200
+    return token["user_id"], headers
+
+
+@pytest.fixture
+def db(client):
+    from database.database import SessionLocal
+
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def statements(client):
+    """SQL statements run through the synchronous engine while the test runs."""
+    from database.database import engine
+
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        yield recorded
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def synthetic_detections(db, user):
+    """
+    Add detections of synthetic identities (benchmarks.bench_descriptors) to
+    one photo of the test user.
+
+    Returns a function of (descriptor, identities, views, rng) returning the
+    flushed detections, their identities and their embeddings.
+    """
+    from benchmarks.bench_descriptors import synthetic_identity, synthetic_view
+    from models.face import FaceDetection
+    from models.photo import Photo
+    from services.embedding_format import encode_embedding
+
+    user_id, _ = user
+
+    def add(descriptor, identities, views, rng):
+        photo = Photo(user_id=user_id, file_name="crops.jpg", storage_path="crops.jpg", file_size=0)
+        db.add(photo)
+        db.flush()
+
+        detections, labels, embeddings = [], [], []
+        for identity in range(identities):
+            face = synthetic_identity(rng)
+            for _ in range(views):
+                embedding = descriptor.describe(synthetic_view(face, rng))
+                detections.append(FaceDetection(
+                    photo_id=photo.photo_id,
+                    bounding_box_x=0,
+                    bounding_box_y=0,
+                    bounding_box_width=100,
+                    bounding_box_height=100,
+                    confidence_score=1.0,
+                    embedding=encode_embedding(embedding, pipeline_version=descriptor.pipeline_version)
+                ))
+                labels.append(identity)
+                embeddings.append(embedding)
+        db.add_all(detections)
+        db.flush()
+        return detections, labels, embeddings
+
+    return add
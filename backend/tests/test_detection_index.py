@@ -0,0 +1,80 @@
+"""
+Catching up the persistent detection search index with the database.
+"""
+import numpy as np
+
+from services.face_descriptors import LBPDescriptor, PixelDescriptor
+
+
+def test_stale_detections_are_indexed_once_redescribed(user, db, synthetic_detections, tmp_path):
+    from services.detection_index import DetectionIndexStore
+    from services.embedding_format import encode_embedding
+
+    user_id, _ = user
+    rng = np.random.default_rng(0)
+    descriptor = LBPDescriptor()
+    current, _, _ = synthetic_detections(descriptor, 3, 2, rng)
+    # Made by a worker still running the previous descriptor
+    stale, _, _ = synthetic_detections(PixelDescriptor(), 2, 2, rng)
+    db.commit()
+
+    index = DetectionIndexStore(str(tmp_path), max_bytes=1 << 20).get(db, user_id, descriptor.pipeline_version)
+    assert len(index) == len(current)
+    assert index.stale_ids == {detection.detection_id for detection in stale}
+
+    # Re-described in place, below the index's catch-up point
+    for detection in stale[1:]:
+        detection.embedding = encode_embedding(
+            rng.random(descriptor.dimension), pipeline_version=descriptor.pipeline_version
+        )
+    db.delete(stale[0])
+    db.commit()
+
+    # A new process loads the saved index with the ids it skipped
+    index = DetectionIndexStore(str(tmp_path), max_bytes=1 << 20).get(db, user_id, descriptor.pipeline_version)
+    assert len(index) == len(current) + len(stale) - 1
+    assert index.stale_ids == set()
+
+
+def test_late_commits_are_indexed_and_deleted_detections_dropped(user, db, synthetic_detections, tmp_path):
+    from models.face import FaceDetection
+    from services.detection_index import DetectionIndexStore
+
+    user_id, _ = user
+    rng = np.random.default_rng(0)
+    descriptor = PixelDescriptor()
+    first, _, embeddings = synthetic_detections(descriptor, 2, 2, rng)
+    late, _, _ = synthetic_detections(descriptor, 1, 2, rng)
+    last, _, _ = synthetic_detections(descriptor, 1, 2, rng)
+    # The ids of ``late`` are taken, but not committed before the catch-up passed them
+    late_rows = [
+        {column.name: getattr(detection, column.name) for column in FaceDetection.__table__.columns}
+        for detection in late
+    ]
+    for detection in late:
+        db.delete(detection)
+    db.commit()
+
+    store = DetectionIndexStore(str(tmp_path), max_bytes=1 << 20)
+    index = store.get(db, user_id, descriptor.pipeline_version)
+    assert len(index) == len(first) + len(last)
+    assert index.max_detection_id == last[-1].detection_id
+
+    db.execute(FaceDetection.__table__.insert(), late_rows)
+    db.commit()
+    index = store.get(db, user_id, descriptor.pipeline_version)
+    assert all(row["detection_id"] in index.gallery for row in late_rows)
+
+    # A deleted detection, and one of a deleted photo, are not returned and leave the index
+    deleted_id = first[0].detection_id
+    db.delete(first[0])
+    db.commit()
+    scores, detection_ids = store.search(db, user_id, descriptor.pipeline_version, embeddings[0], top_k=3)
+    assert len(detection_ids) == 3 and deleted_id not in detection_ids.tolist()
+    assert deleted_id not in index.gallery
+
+    last[0].photo.is_deleted = True
+    db.commit()
+    scores, detection_ids = store.search(db, user_id, descriptor.pipeline_version, embeddings[0], top_k=len(index))
+    assert not {detection.detection_id for detection in last} & set(detection_ids.tolist())
+    assert len(index) == len(first) - 1 + len(late_rows)
@@ -0,0 +1,71 @@
+"""
+Binary embedding format and the restricted reader of legacy pickled blobs.
+"""
+import pickle
+
+import numpy as np
+import pytest
+
+from services.embedding_format import (
+    HEADER_SIZE,
+    decode_embedding,
+    decode_embeddings,
+    encode_embedding,
+    pipeline_version_of,
+    read_header,
+)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.float16])
+def test_round_trip(dtype):
+    embedding = np.random.default_rng(0).random(531)
+
+    blob = encode_embedding(embedding, dtype, pipeline_version=2)
+    decoded = decode_embedding(blob)
+
+    header = read_header(blob)
+    assert (header.dtype, header.pipeline_version, header.dimension) == (np.dtype(dtype), 2, 531)
+    assert header.norm == pytest.approx(np.linalg.norm(decoded.astype(np.float32)), rel=1e-6)
+    assert len(blob) == HEADER_SIZE + 531 * np.dtype(dtype).itemsize
+    assert decoded.dtype == dtype
+    np.testing.assert_array_equal(decoded, embedding.astype(dtype))
+    # A view on the blob, not a copy
+    assert not decoded.flags.writeable
+
+
+def test_decode_embeddings_of_mixed_layouts():
+    rng = np.random.default_rng(0)
+    embeddings = rng.random((4, 16)).astype(np.float32)
+    same_layout = [encode_embedding(embedding, np.float32) for embedding in embeddings]
+    mixed = [
+        same_layout[0],
+        encode_embedding(embeddings[1], np.float16),
+        pickle.dumps(embeddings[2]),
+        same_layout[3],
+    ]
+
+    np.testing.assert_array_equal(decode_embeddings(same_layout), embeddings)
+    np.testing.assert_allclose(decode_embeddings(mixed), embeddings, atol=1e-3, rtol=0)
+    assert decode_embeddings([]).shape == (0, 0)
+
+
+def test_legacy_pickled_arrays_are_read():
+    embedding = np.arange(10000, dtype=np.float64) / 10000
+
+    blob = pickle.dumps(embedding)
+
+    np.testing.assert_array_equal(decode_embedding(blob), embedding)
+    assert pipeline_version_of(blob) == 1
+
+
+class _Payload:
+    def __reduce__(self):
+        return (print, ("unpickled",))
+
+
+@pytest.mark.parametrize("payload", [_Payload(), {"embedding": [0.0, 1.0]}, [0.0, 1.0]])
+def test_legacy_blobs_other_than_arrays_are_refused(payload, capsys):
+    with pytest.raises((pickle.UnpicklingError, ValueError)):
+        decode_embedding(pickle.dumps(payload))
+    # Nothing ran while refusing
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,59 @@
+"""
+Startup check of the stored embeddings against the active descriptor.
+"""
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from services.face_descriptors import LBPDescriptor, PixelDescriptor
+
+
+@pytest.fixture
+def faces_engine(tmp_path):
+    """A separate database, so faces of other tests do not count."""
+    from database.database import Base
+    from models import face, photo, user  # noqa: F401 (registers the tables)
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'faces.db'}")
+    Base.metadata.create_all(bind=engine)
+    try:
+        yield engine
+    finally:
+        engine.dispose()
+
+
+def _add_faces(engine, blobs):
+    from models.face import Face
+    from models.user import User
+
+    with Session(engine) as session:
+        owner = User(username="owner", email="owner@example.com", password_hash="-", first_name="O", last_name="W")
+        session.add(owner)
+        session.flush()
+        session.add_all(Face(user_id=owner.user_id, person_name="Face", face_embedding=blob) for blob in blobs)
+        session.commit()
+
+
+def test_startup_refuses_a_descriptor_no_stored_face_was_made_by(faces_engine):
+    from services.embedding_format import encode_embedding
+    from services.embedding_reencoder import EmbeddingsOutOfDate, check_embeddings
+
+    pixel = PixelDescriptor()
+    _add_faces(faces_engine, [
+        encode_embedding(np.zeros(pixel.dimension), pipeline_version=pixel.pipeline_version) for _ in range(2)
+    ])
+
+    check_embeddings(faces_engine, pixel)
+    with pytest.raises(EmbeddingsOutOfDate):
+        check_embeddings(faces_engine, LBPDescriptor())
+
+
+def test_startup_accepts_legacy_pixel_faces_and_an_empty_database(faces_engine):
+    import pickle
+
+    from services.embedding_reencoder import check_embeddings
+
+    check_embeddings(faces_engine, LBPDescriptor())
+    _add_faces(faces_engine, [pickle.dumps(np.zeros(PixelDescriptor.dimension))])
+    check_embeddings(faces_engine, PixelDescriptor())
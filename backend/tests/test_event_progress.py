@@ -0,0 +1,43 @@
+"""
+Progress of an event's processing while its photos are queued.
+"""
+
+
+def test_progress_counts_photos_queued_on_their_own(client, user, db):
+    from api.routes.events import _EventProgress
+    from models.photo import Photo
+    from services.job_queue import PENDING
+
+    user_id, headers = user
+    event_id = client.post("/api/events/", json={"name": "wedding"}, headers=headers).json()["event_id"]
+    photo = Photo(user_id=user_id, event_id=event_id, file_name="photo.jpg", storage_path="photo.jpg", file_size=0)
+    db.add(photo)
+    db.commit()
+
+    # Queued on its own before the whole event is, so the event adds no batch for it
+    assert client.post(f"/api/faces/process/{photo.photo_id}", headers=headers).status_code == 202
+    response = client.post(f"/api/events/{event_id}/process", headers=headers)
+    assert response.json()["queued_photos"] == 0
+
+    progress = _EventProgress(event_id)
+    _, jobs = progress.poll()
+    assert progress.unprocessed_ids == {photo.photo_id}
+    assert jobs == {PENDING: 1}
+
+
+def test_progress_stream_holds_no_connection_of_the_request(client, user):
+    from api.routes.events import stream_event_progress
+    from database.database import SessionLocal
+    from models.user import User
+
+    user_id, headers = user
+    event_id = client.post("/api/events/", json={"name": "gala"}, headers=headers).json()["event_id"]
+
+    request_db = SessionLocal()
+    try:
+        current_user = request_db.get(User, user_id)
+        response = stream_event_progress(event_id, current_user=current_user, db=request_db)
+        assert response.media_type == "text/event-stream"
+        assert not request_db.in_transaction()
+    finally:
+        request_db.close()
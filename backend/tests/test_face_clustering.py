@@ -0,0 +1,62 @@
+"""
+Clustering of unidentified faces at the descriptors' calibrated thresholds.
+"""
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from services.face_descriptors import LBPDescriptor, PixelDescriptor
+
+
+@pytest.mark.parametrize("descriptor_class", [PixelDescriptor, LBPDescriptor])
+def test_distinct_identities_stay_in_separate_clusters(user, db, synthetic_detections, descriptor_class):
+    from services.face_clustering import assign_detections
+
+    user_id, _ = user
+    rng = np.random.default_rng(0)
+    descriptor = descriptor_class()
+    detections, identities, embeddings = synthetic_detections(descriptor, 20, 4, rng)
+
+    assign_detections(
+        db, user_id, detections, embeddings, descriptor.pipeline_version, descriptor.cluster_threshold
+    )
+    db.commit()
+
+    members = defaultdict(set)
+    for identity, detection in zip(identities, detections):
+        members[detection.cluster_id].add(identity)
+    assert all(len(cluster_identities) == 1 for cluster_identities in members.values()), dict(members)
+
+
+def test_failed_clustering_keeps_only_the_detections(user, db, tmp_path, monkeypatch):
+    import asyncio
+
+    from api.routes import faces as face_routes
+    from benchmarks.corpus import generate_corpus
+    from models.face import FaceCluster, FaceDetection
+    from models.photo import Photo
+
+    user_id, _ = user
+    path = generate_corpus(str(tmp_path), [(640, 480)], [1], seed=0, quality=85)[0].path
+    photo = Photo(user_id=user_id, file_name="photo.jpg", storage_path=path, file_size=0)
+    db.add(photo)
+    db.commit()
+
+    def assign_halfway(db, user_id, detections, *args):
+        cluster = FaceCluster(user_id=user_id, centroid=b"", size=len(detections))
+        db.add(cluster)
+        db.flush()
+        for detection in detections:
+            detection.cluster_id = cluster.cluster_id
+        db.flush()
+        raise RuntimeError("clustering failed")
+
+    monkeypatch.setattr(face_routes, "assign_detections", assign_halfway)
+    assert asyncio.run(face_routes.process_photo_batch([photo.photo_id], db, user_id)) == 1
+
+    assert db.query(FaceCluster).filter(FaceCluster.user_id == user_id).count() == 0
+    detection = db.query(FaceDetection).filter(FaceDetection.photo_id == photo.photo_id).one()
+    assert detection.cluster_id is None
+    db.refresh(photo)
+    assert photo.is_processed
@@ -0,0 +1,51 @@
+"""
+Matching of detected faces against the user's named faces.
+"""
+import asyncio
+
+import numpy as np
+
+from benchmarks.corpus import generate_corpus
+
+
+def test_match_faces_scores_a_batch():
+    from api.routes.faces import face_recognition_service
+
+    gallery = np.random.default_rng(0).random((5, 64))
+    queries = gallery[[3, 1]] + 0.01
+
+    scores, indices = asyncio.run(face_recognition_service.match_faces(queries, gallery, top_k=2))
+
+    assert scores.shape == indices.shape == (2, 2)
+    np.testing.assert_array_equal(indices[:, 0], [3, 1])
+    assert (scores[:, 0] > 0.99).all()
+
+
+def test_processed_photo_is_matched_to_the_named_face(client, user, db, tmp_path):
+    from api.routes.faces import process_photo_batch
+    from models.face import FaceDetection
+    from models.photo import Photo
+
+    user_id, headers = user
+    # The same person saved twice at different JPEG qualities, so the second
+    # file is no byte-identical twin and its face is detected again
+    photos = []
+    for quality in (90, 80):
+        corpus_photo = generate_corpus(str(tmp_path / str(quality)), [(640, 480)], [1], seed=0, quality=quality)[0]
+        photo = Photo(user_id=user_id, file_name="photo.jpg", storage_path=corpus_photo.path, file_size=0)
+        db.add(photo)
+        photos.append(photo)
+    db.commit()
+    first_id, second_id = (photo.photo_id for photo in photos)
+
+    assert asyncio.run(process_photo_batch([first_id], db, user_id)) == 1
+    named = db.query(FaceDetection).filter(FaceDetection.photo_id == first_id).one()
+    response = client.post(
+        "/api/faces/create", params={"detection_id": named.detection_id}, json={"person_name": "Ada"}, headers=headers
+    )
+    assert response.status_code == 200, response.text
+    face_id = response.json()["face_id"]
+
+    assert asyncio.run(process_photo_batch([second_id], db, user_id)) == 1
+    matched = db.query(FaceDetection).filter(FaceDetection.photo_id == second_id).one()
+    assert (matched.face_id, matched.identified) == (face_id, True)
@@ -0,0 +1,57 @@
+"""
+Write-through of face changes into the cached galleries and cluster indexes.
+"""
+import numpy as np
+
+from services.face_descriptors import get_descriptor
+
+
+def test_write_through_keeps_the_caches_valid(client, user, db, synthetic_detections):
+    from models.face import FaceCluster
+    from services.embedding_format import decode_embedding
+    from services.face_clustering import assign_detections, cluster_cache, cluster_version, load_clusters
+    from services.gallery_cache import gallery_cache, gallery_version, load_gallery
+
+    user_id, headers = user
+    # The active descriptor; the routes write through only its embeddings
+    descriptor = get_descriptor()
+    detections, _, embeddings = synthetic_detections(descriptor, 2, 3, np.random.default_rng(0))
+    assign_detections(db, user_id, detections, embeddings, descriptor.pipeline_version, descriptor.cluster_threshold)
+    db.commit()
+
+    def galleries():
+        """The cached gallery and cluster index, as the next batch of photos looks them up."""
+        return (
+            gallery_cache.get_or_load(
+                user_id, lambda: load_gallery(db, user_id, decode_embedding), version=gallery_version(db, user_id)
+            ),
+            cluster_cache.get_or_load(
+                user_id,
+                lambda: load_clusters(db, user_id, descriptor.pipeline_version),
+                version=cluster_version(db, user_id)
+            )
+        )
+
+    galleries()
+    misses = (gallery_cache.misses, cluster_cache.misses)
+
+    # Named: a new face, and the detection leaves its cluster
+    response = client.post(
+        "/api/faces/create",
+        params={"detection_id": detections[0].detection_id},
+        json={"person_name": "Ada"},
+        headers=headers
+    )
+    assert response.status_code == 200, response.text
+    face_id = response.json()["face_id"]
+    gallery, clusters = galleries()
+    assert (gallery_cache.misses, cluster_cache.misses) == misses
+    assert gallery.index.ids.tolist() == [face_id]
+    cluster_ids = {cluster_id for cluster_id, in db.query(FaceCluster.cluster_id).filter(FaceCluster.user_id == user_id)}
+    assert set(clusters.index.ids.tolist()) == cluster_ids
+
+    assert client.put(f"/api/faces/update/{face_id}", json={"person_name": "Ada L."}, headers=headers).status_code == 200
+    assert client.delete(f"/api/faces/people/{face_id}", headers=headers).status_code == 204
+    gallery, _ = galleries()
+    assert (gallery_cache.misses, cluster_cache.misses) == misses
+    assert len(gallery) == 0
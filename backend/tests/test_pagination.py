@@ -0,0 +1,71 @@
+"""
+Keyset pagination of the photo listing.
+"""
+from sqlalchemy import update
+
+
+def _add_photos(db, user_id, count):
+    """Photos of the user that all share the upload_date of the first (a database default)."""
+    from models.photo import Photo
+
+    photos = [
+        Photo(user_id=user_id, file_name=f"{i}.jpg", storage_path=f"{i}.jpg", file_size=0)
+        for i in range(count)
+    ]
+    db.add_all(photos)
+    db.flush()
+    db.execute(
+        update(Photo).where(Photo.photo_id.in_([photo.photo_id for photo in photos])).values(
+            upload_date=Photo.__table__.select().with_only_columns(Photo.upload_date)
+            .where(Photo.photo_id == photos[0].photo_id).scalar_subquery()
+        )
+    )
+    db.commit()
+    return [photo.photo_id for photo in photos]
+
+
+def _pages(client, headers, limit, between_pages=None):
+    """photo_ids of every page, following X-Next-Cursor until the last page."""
+    pages, cursor = [], None
+    while True:
+        params = {"limit": limit, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/api/photos/", params=params, headers=headers)
+        assert response.status_code == 200, response.text
+        pages.append([photo["photo_id"] for photo in response.json()])
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            return pages
+        if between_pages:
+            between_pages(pages[-1])
+
+
+def test_cursor_pages_of_photos_uploaded_at_the_same_time(client, user, db):
+    user_id, headers = user
+    photo_ids = _add_photos(db, user_id, 7)
+
+    pages = _pages(client, headers, limit=3)
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    # Newest first; equal upload dates fall back to the id
+    assert sum(pages, []) == sorted(photo_ids, reverse=True)
+
+
+def test_cursor_pages_after_the_cursor_photo_is_deleted(client, user, db):
+    from models.photo import Photo
+
+    user_id, headers = user
+    photo_ids = _add_photos(db, user_id, 7)
+    deleted = []
+
+    def delete_last(page):
+        # The next page continues from the timestamp and id in the cursor
+        db.query(Photo).filter(Photo.photo_id == page[-1]).delete()
+        db.commit()
+        deleted.append(page[-1])
+
+    pages = _pages(client, headers, limit=3, between_pages=delete_last)
+
+    listed = sum(pages, [])
+    assert len(listed) == len(set(listed))
+    assert listed == sorted(photo_ids, reverse=True)
+    assert deleted == [pages[0][-1], pages[1][-1]]
@@ -0,0 +1,55 @@
+"""
+Moving legacy files into the content-addressed store, and uploads whose
+photo is never recorded.
+"""
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from models.photo import Photo, StoredFile
+
+
+def test_backfill_repoints_every_photo_of_a_shared_file(client, user, db, tmp_path):
+    from services.photo_store import backfill
+
+    user_id, _ = user
+    source = str(tmp_path / "legacy.jpg")
+    shutil.copyfile(generate_corpus(str(tmp_path / "corpus"), [(640, 480)], [1], seed=user_id)[0].path, source)
+    photos = [
+        Photo(user_id=user_id, file_name="legacy.jpg", storage_path=source, file_size=0, is_deleted=is_deleted)
+        for is_deleted in (False, False, True)
+    ]
+    db.add_all(photos)
+    db.commit()
+
+    # Photos of other tests may be moved along
+    backfill(db)
+
+    content_hash = photos[0].content_hash
+    stored = db.get(StoredFile, content_hash)
+    assert stored.ref_count == 2
+    assert {(photo.content_hash, photo.storage_path) for photo in photos} == {(content_hash, stored.storage_path)}
+    assert os.path.exists(stored.storage_path)
+    assert not os.path.exists(source)
+
+
+def test_failed_upload_leaves_its_file_to_the_purge(client, user, db, tmp_path, monkeypatch):
+    from api.routes import photos as photo_routes
+
+    _, headers = user
+    path = generate_corpus(str(tmp_path), [(320, 240)], [1], seed=7, quality=70)[0].path
+
+    def fail(db, stored):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(photo_routes, "acquire_stored_file", fail)
+    with open(path, "rb") as f, pytest.raises(RuntimeError):
+        client.post("/api/photos/upload", files={"file": ("photo.jpg", f, "image/jpeg")}, headers=headers)
+
+    with open(path, "rb") as f:
+        stored = db.get(StoredFile, hashlib.sha256(f.read()).hexdigest())
+    assert (stored.ref_count, stored.released_at is not None) == (0, True)
+    assert os.path.exists(stored.storage_path)
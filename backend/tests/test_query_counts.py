@@ -0,0 +1,99 @@
+"""
+SQL statements per request, so N+1 query patterns do not come back.
+
+Statements are summarized as "<verb> <table>" and compared as counts.
+"""
+import asyncio
+import re
+from collections import Counter
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+
+_TABLE = re.compile(r"^(?:(SELECT)\b.*?\bFROM|(INSERT) INTO|(UPDATE)|(DELETE) FROM)\s+(\w+)", re.DOTALL)
+
+
+def summarize(statements):
+    summary = Counter()
+    for statement in statements:
+        match = _TABLE.match(statement)
+        if match:
+            verb = next(group for group in match.groups()[:4] if group)
+            summary[f"{verb} {match.group(5)}"] += 1
+        else:
+            summary[statement.split()[0]] += 1
+    return summary
+
+
+def upload(client, headers, path, event_id=None):
+    with open(path, "rb") as f:
+        response = client.post(
+            "/api/photos/upload",
+            files={"file": ("photo.jpg", f.read(), "image/jpeg")},
+            data={"event_id": str(event_id)} if event_id else {},
+            headers=headers
+        )
+    assert response.status_code == 200, response.text
+    return response.json()["photo_id"]
+
+
+@pytest.mark.parametrize("event_count", [1, 30])
+def test_event_listing(client, user, db, statements, event_count):
+    from models.photo import Photo
+
+    user_id, headers = user
+    for i in range(event_count):
+        event_id = client.post("/api/events/", json={"name": f"event {i}"}, headers=headers).json()["event_id"]
+        if i % 3 == 0:
+            db.add(Photo(user_id=user_id, event_id=event_id, file_name="photo.jpg", storage_path="photo.jpg", file_size=0))
+    db.commit()
+
+    statements.clear()
+    response = client.get("/api/events/", headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()) == event_count
+
+    # The page of events, then the photo counts of the whole page
+    assert summarize(statements) == {"SELECT events": 1, "SELECT photos": 1}
+
+
+@pytest.mark.parametrize("photo_count", [1, 4])
+def test_photo_batch(client, user, db, statements, tmp_path, photo_count):
+    from api.routes.faces import process_photo_batch
+    from models.face import FaceCluster
+
+    user_id, headers = user
+    # Distinct files, so none reuses the detections of an identical twin
+    photos = [
+        generate_corpus(str(tmp_path / str(i)), [(640, 480)], [1], seed=user_id * 100 + i)[0]
+        for i in range(photo_count)
+    ]
+    photo_ids = [upload(client, headers, photo.path) for photo in photos]
+
+    statements.clear()
+    faces = asyncio.run(process_photo_batch(photo_ids, db, user_id))
+    assert faces == photo_count
+    summary = summarize(statements)
+    clusters = db.query(FaceCluster).filter(FaceCluster.user_id == user_id).count()
+
+    # SQLite cannot return the ids of a multi-row INSERT in order, so the ORM
+    # inserts rows that need their id one at a time. A new cluster's id is
+    # needed before the next face is compared, and its flush also writes the
+    # cluster assignments made since the previous one
+    assert summary.pop("INSERT face_detections") == faces
+    assert summary.pop("INSERT face_clusters") == clusters
+    assert summary.pop("UPDATE face_detections") == clusters
+    assert summary.pop("UPDATE face_clusters", 0) <= clusters
+    # Everything else is the same for any number of photos: the photos, their
+    # processed twins, the gallery (version and load), the clusters (version
+    # before and after, and load) in their savepoint, and one batched UPDATE
+    # of the photos
+    assert summary == {
+        "SELECT photos": 2,
+        "SELECT faces": 2,
+        "SELECT face_clusters": 3,
+        "SAVEPOINT": 1,
+        "RELEASE": 1,
+        "UPDATE photos": 1,
+    }
@@ -0,0 +1,111 @@
+"""
+Query plans of the hot queries of the API, so they keep using their indexes.
+
+Runs EXPLAIN on the statements behind the photo and event listings (offset
+and cursor pages), the event photo counts and progress, the face detection
+lookups, the people/gallery queries and the cluster listings. A plan fails
+when it scans a table instead of searching an index, when it does not use
+the index the query is meant to use, or, for listings, when the rows do not
+come out of the index already ordered.
+
+Plans are checked on the SQLite database of the suite and, when
+DATABASE_URL names a PostgreSQL database, on that one too. On PostgreSQL
+sequential scans are disabled for the session, so small test tables still
+show whether an index is usable.
+"""
+import re
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from models import face, job, photo, user  # noqa: F401 (register the tables)
+from models.face import Face, FaceCluster, FaceDetection
+from models.photo import Event, Photo
+from services.pagination import after_cursor, encode_cursor
+
+# A full table scan; "SCAN t USING [COVERING] INDEX i" reads an index instead
+_TABLE_SCAN = re.compile(r"\bSCAN (\w+)\b(?! USING (?:COVERING )?INDEX)")
+# A sort node of a PostgreSQL plan ("Sort", "Incremental Sort")
+_PG_SORT = re.compile(r"\bSort\b(?! Key)")
+
+photo_listing = select(Photo).where(Photo.user_id == 1, Photo.is_deleted == False)
+photo_order = (Photo.upload_date.desc(), Photo.photo_id.desc())
+event_listing = select(Event).where(Event.user_id == 1)
+event_order = (Event.created_at.desc(), Event.event_id.desc())
+cursor = encode_cursor(datetime(2024, 1, 1), 1000)
+
+# (name, expected index, must be sorted by the index, statement)
+HOT_QUERIES = [
+    ("GET /photos/", "ix_photos_user_id_upload_date", True,
+     photo_listing.order_by(*photo_order).offset(200).limit(101)),
+    ("GET /photos/?cursor", "ix_photos_user_id_upload_date", True,
+     photo_listing.where(after_cursor(Photo, "upload_date", "photo_id", cursor)).order_by(*photo_order).limit(101)),
+    ("GET /events/", "ix_events_user_id_created_at", True,
+     event_listing.order_by(*event_order).limit(101)),
+    ("GET /events/?cursor", "ix_events_user_id_created_at", True,
+     event_listing.where(after_cursor(Event, "created_at", "event_id", cursor)).order_by(*event_order).limit(101)),
+    ("event photo counts", "ix_photos_event_id_is_processed", False,
+     select(Photo.event_id, func.count(Photo.photo_id))
+     .where(Photo.event_id.in_([1, 2, 3]), Photo.is_deleted == False)
+     .group_by(Photo.event_id)),
+    ("GET /events/{id}/process/progress", "ix_photos_event_id_is_processed", False,
+     select(Photo.photo_id).where(Photo.event_id == 1, Photo.is_deleted == False, Photo.is_processed == False)),
+    ("GET /faces/photo/{id}", "ix_face_detections_photo_id", False,
+     select(FaceDetection).where(FaceDetection.photo_id == 1)),
+    ("GET /faces/people/{id}/photos", "ix_face_detections_face_id", False,
+     select(FaceDetection).where(FaceDetection.face_id == 1)),
+    ("GET /faces/people", "ix_faces_user_id_is_active", False,
+     select(Face).where(Face.user_id == 1)),
+    ("matching gallery", "ix_faces_user_id_is_active", True,
+     select(Face.face_id, Face.face_embedding)
+     .where(Face.user_id == 1, Face.is_active == True)
+     .order_by(Face.face_id)),
+    ("GET /faces/clusters", "ix_face_clusters_user_id_size", True,
+     select(FaceCluster).where(FaceCluster.user_id == 1, FaceCluster.size >= 2)
+     .order_by(FaceCluster.size.desc(), FaceCluster.cluster_id.desc()).limit(50)),
+    ("GET /faces/clusters/{id}/detections", "ix_face_detections_cluster_id", False,
+     select(FaceDetection).where(FaceDetection.cluster_id == 1)),
+]
+
+
+def explain(connection, statement) -> str:
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "postgresql":
+        rows = connection.exec_driver_sql(f"EXPLAIN {sql}").all()
+        return "\n".join(row[0] for row in rows)
+    rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    return "\n".join(row[-1] for row in rows)
+
+
+@pytest.mark.parametrize(
+    "index, sorted_by_index, statement",
+    [query[1:] for query in HOT_QUERIES],
+    ids=[query[0] for query in HOT_QUERIES]
+)
+def test_query_plan(client, index, sorted_by_index, statement):
+    from database.database import engine
+
+    with engine.connect() as connection:
+        plan = explain(connection, statement)
+
+    assert not _TABLE_SCAN.findall(plan), f"scans a table:\n{plan}"
+    assert index in plan, f"does not use {index}:\n{plan}"
+    if sorted_by_index:
+        assert "TEMP B-TREE FOR ORDER BY" not in plan, f"sorts instead of reading {index} in order:\n{plan}"
+
+
+@pytest.mark.parametrize(
+    "index, sorted_by_index, statement",
+    [query[1:] for query in HOT_QUERIES],
+    ids=[query[0] for query in HOT_QUERIES]
+)
+def test_postgresql_query_plan(postgres_engine, index, sorted_by_index, statement):
+    with postgres_engine.connect() as connection:
+        connection.exec_driver_sql("SET enable_seqscan = off")
+        plan = explain(connection, statement)
+
+    assert "Seq Scan" not in plan, f"scans a table:\n{plan}"
+    assert index in plan, f"does not use {index}:\n{plan}"
+    if sorted_by_index:
+        assert not _PG_SORT.search(plan), f"sorts instead of reading {index} in order:\n{plan}"
@@ -0,0 +1,27 @@
+"""
+Retroactive identification of earlier detections of a newly named face.
+"""
+import numpy as np
+
+from services.face_descriptors import LBPDescriptor
+
+
+def test_retro_match_leaves_other_people_unidentified(user, db, synthetic_detections):
+    from models.face import Face
+    from services.retro_match import retro_match
+
+    user_id, _ = user
+    descriptor = LBPDescriptor()
+    detections, identities, _ = synthetic_detections(descriptor, 40, 4, np.random.default_rng(0))
+    # Named from its first detection, as POST /faces/ does
+    face = Face(user_id=user_id, person_name="First", face_embedding=detections[0].embedding)
+    db.add(face)
+    db.commit()
+
+    result = retro_match(db, user_id, face.face_id, descriptor.pipeline_version, descriptor.similarity_threshold)
+
+    for detection in detections:
+        db.refresh(detection)
+    matched = {identity for identity, detection in zip(identities, detections) if detection.face_id == face.face_id}
+    assert matched == {0}
+    assert result["matched"] == sum(detection.face_id == face.face_id for detection in detections)
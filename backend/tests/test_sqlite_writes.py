@@ -0,0 +1,97 @@
+"""
+Concurrent writes to the SQLite database of the synchronous engine.
+"""
+import threading
+import time
+
+from sqlalchemy import func
+
+from models.photo import Event
+
+
+def _event_names(db, user_id):
+    return {name for name, in db.query(Event.name).filter(Event.user_id == user_id)}
+
+
+def test_writer_waits_for_the_open_write_transaction(client, user):
+    from database.database import SessionLocal
+
+    user_id, _ = user
+    holder, waiter = SessionLocal(), SessionLocal()
+    try:
+        holder.add(Event(user_id=user_id, name="holder"))
+        holder.flush()
+
+        committed = threading.Event()
+
+        def commit_later():
+            time.sleep(0.3)
+            holder.commit()
+            committed.set()
+
+        thread = threading.Thread(target=commit_later)
+        thread.start()
+        # Blocks in SQLite's busy handler until the holder commits, then writes
+        waiter.add(Event(user_id=user_id, name="waiter"))
+        waiter.commit()
+        assert committed.is_set()
+        thread.join()
+
+        assert _event_names(waiter, user_id) == {"holder", "waiter"}
+    finally:
+        holder.close()
+        waiter.close()
+
+
+def test_write_after_reading_what_another_session_changed(client, user):
+    from database.database import SessionLocal
+
+    user_id, _ = user
+    reader, writer = SessionLocal(), SessionLocal()
+    try:
+        count = reader.query(func.count(Event.event_id)).filter(Event.user_id == user_id).scalar()
+        writer.add(Event(user_id=user_id, name="writer"))
+        writer.commit()
+
+        # The read took no snapshot the write would have to upgrade
+        reader.add(Event(user_id=user_id, name=f"reader saw {count}"))
+        reader.commit()
+
+        assert _event_names(reader, user_id) == {"writer", "reader saw 0"}
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_background_writes_wait_off_the_event_loop(client, user):
+    import asyncio
+
+    from database.database import SessionLocal, background_writer
+    from services.job_queue import JobQueue
+
+    user_id, _ = user
+    holder, db = SessionLocal(), SessionLocal()
+    try:
+        holder.add(Event(user_id=user_id, name="holder"))
+        holder.flush()
+        threading.Timer(0.3, holder.commit).start()
+
+        async def main():
+            ticks = 0
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.02)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            # The queue's UPDATE waits for the holder's write lock on the writer thread
+            await background_writer.run(JobQueue().recover_stale_jobs, db)
+            ticker.cancel()
+            return ticks
+
+        assert asyncio.run(main()) >= 5
+    finally:
+        holder.close()
+        db.close()